@@ -0,0 +1,76 @@
+"""Bytes saved against CPU spent when compressing DLQ payloads.
+
+Run from the repository root with the same environment as the unit tests, e.g.
+    PYTHONPATH=src python benchmarks/bench_dlq_compression.py
+"""
+import json
+import time
+from datetime import datetime
+
+from helper.compression import compress_payload, decompress_payload, supported_encodings
+
+ITERATIONS = 50
+
+
+def gcs_event(index: int) -> dict:
+    return {
+        "kind": "storage#object",
+        "id": f"dummy_bucket/test/2024/05/31/test_file_{index}.json/1717150210123431",
+        "selfLink": f"https://www.googleapis.com/storage/v1/b/dummy_bucket/o/test_file_{index}.json",
+        "name": f"test/2024/05/31/test_file_{index}.json",
+        "bucket": "dummy_bucket",
+        "generation": "1717150210123431",
+        "metageneration": "1",
+        "contentType": "application/json",
+        "timeCreated": str(datetime(2024, 5, 31, 10, 10, 10)),
+        "updated": str(datetime(2024, 5, 31, 10, 10, 10)),
+        "storageClass": "STANDARD",
+        "size": "1048576",
+        "md5Hash": "XUFAKrxLKna5cZ2REBfFkg==",
+        "crc32c": "yZRlqg==",
+        "etag": "CKih16GjycICEAE=",
+    }
+
+
+def consumer_payload(rows: int) -> dict:
+    return {
+        "data": [
+            {"Name": f"Customer {row}", "Age": 20 + row % 50, "Country": "United Kingdom"}
+            for row in range(rows)
+        ]
+    }
+
+
+def measure(payload: bytes, encoding: str) -> tuple:
+    start = time.process_time()
+    for _ in range(ITERATIONS):
+        compressed = compress_payload(payload, encoding)
+    compress_ms = (time.process_time() - start) * 1000 / ITERATIONS
+
+    start = time.process_time()
+    for _ in range(ITERATIONS):
+        decompress_payload(compressed, encoding)
+    decompress_ms = (time.process_time() - start) * 1000 / ITERATIONS
+    return len(compressed), compress_ms, decompress_ms
+
+
+def main() -> None:
+    payloads = {
+        "gcs event": gcs_event(0),
+        "consumer 100 rows": consumer_payload(100),
+        "consumer 10k rows": consumer_payload(10_000),
+        "consumer 100k rows": consumer_payload(100_000),
+    }
+    print(f"{'payload':<20}{'encoding':<10}{'raw B':>12}{'encoded B':>12}"
+          f"{'saved':>8}{'compress ms':>14}{'decompress ms':>16}")
+    for name, data in payloads.items():
+        payload = json.dumps(data).encode("utf-8")
+        for encoding in supported_encodings():
+            size, compress_ms, decompress_ms = measure(payload, encoding)
+            saved = 100 * (1 - size / len(payload))
+            print(f"{name:<20}{encoding:<10}{len(payload):>12}{size:>12}"
+                  f"{saved:>7.1f}%{compress_ms:>14.3f}{decompress_ms:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Peak memory per request when decoding a large Pub/Sub push envelope.
+
+Compares the previous decode path (model_dump, base64 decode to str, json.loads,
+then a second decode for GcsToPubsubEvent validation) with DecodedEnvelope, which
+decodes and parses the data once. Peak allocations are measured with tracemalloc.
+
+Run from the repository root with the same environment as the unit tests, e.g.
+    PYTHONPATH=src python benchmarks/bench_envelope_memory.py
+"""
+import base64
+import json
+import tracemalloc
+
+from helper.utils import decode_pubsub_message_data
+from pydantic_model.api_model import GcsToPubsubEvent, Message, PubSubMessage
+from service.envelope import DecodedEnvelope
+
+PAYLOAD_SIZES_MB = (1, 5, 10)
+
+
+def build_request(size_mb: int) -> Message:
+    data = {
+        "bucket": "dummy_bucket",
+        "name": "test/2024/05/31/test_file.json",
+        "metadata": {"padding": "x" * (size_mb * 1024 * 1024)},
+    }
+    return Message(
+        message=PubSubMessage(
+            data=base64.b64encode(json.dumps(data).encode("utf-8")),
+            attributes={},
+            message_id="123",
+            publish_time="2024-05-31T10:10:10.012022+01:00",
+        )
+    )
+
+
+def previous_decode(request: Message) -> None:
+    original_request = request.model_dump()
+    original_request["message"]["data"] = json.loads(
+        decode_pubsub_message_data(original_request["message"]["data"], strict=False)
+    )
+    GcsToPubsubEvent(**json.loads(decode_pubsub_message_data(request.message.data)))
+
+
+def envelope_decode(request: Message) -> None:
+    envelope = DecodedEnvelope(request)
+    envelope.original_request
+    envelope.gcs_event
+
+
+def peak_mb(decode, request: Message) -> float:
+    tracemalloc.start()
+    decode(request)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def main() -> None:
+    print(f"{'payload MB':>10}{'previous peak MB':>18}{'envelope peak MB':>18}")
+    for size_mb in PAYLOAD_SIZES_MB:
+        request = build_request(size_mb)
+        print(
+            f"{size_mb:>10}{peak_mb(previous_decode, request):>18.1f}"
+            f"{peak_mb(envelope_decode, request):>18.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Messages per second through the processing pipeline in push mode (one HTTP
+request per message into POST /) against pull mode (streaming pull with flow
+control, see worker.py).
+
+Both modes run the full GCS pipeline against the storage emulator from
+docker-compose.yml, and pull mode needs its Pub/Sub emulator. The benchmark
+uploads the source object and creates its own topic and subscription, deleting
+them afterwards. With the Docker Compose dev instance running:
+    docker exec gcp-cloud-run-template-api-dev /bin/sh -c "PYTHONPATH=/home/appuser/src poetry run python /home/appuser/benchmarks/bench_pull_vs_push.py"
+"""
+import asyncio
+import base64
+import json
+import threading
+import time
+
+from fastapi.testclient import TestClient
+from google.cloud import pubsub_v1
+
+from configuration.env import settings
+from gcp.gcs import GoogleCloudStorage
+from gcp.pubsub import PubSubPublisherPool
+from gcp.subscriber import PubSubPullSubscriber
+from main import app
+from service.pipeline import create_gcs_event_pipeline
+from worker import handle_message
+
+MESSAGES = 2_000
+TOPIC = "bench.gcs-events"
+SUBSCRIPTION = "bench.gcs-events.subscription"
+PULL_TIMEOUT_SEC = 300
+
+GCS_EVENT = {
+    "kind": "storage#object",
+    "name": "bench/2024/05/31/test_file.json",
+    "bucket": "dummy_bucket",
+    "generation": "1717150210123431",
+    "contentType": "application/json",
+    "size": "1048576",
+    "crc32c": "yZRlqg==",
+}
+
+
+def push_mode() -> float:
+    envelope = {
+        "message": {
+            "data": base64.b64encode(json.dumps(GCS_EVENT).encode()).decode(),
+            "attributes": {"bucketId": "dummy_bucket"},
+            "message_id": "1",
+            "publish_time": "2024-05-31T10:10:10.012022+01:00",
+        }
+    }
+    with TestClient(app) as client:
+        start = time.perf_counter()
+        for _ in range(MESSAGES):
+            client.post("/", json=envelope)
+        return MESSAGES / (time.perf_counter() - start)
+
+
+def pull_mode() -> float:
+    publisher = pubsub_v1.PublisherClient()
+    subscriber_client = pubsub_v1.SubscriberClient()
+    topic_path = publisher.topic_path(settings.gcp_project_id, TOPIC)
+    subscription_path = subscriber_client.subscription_path(
+        settings.gcp_project_id, SUBSCRIPTION
+    )
+    publisher.create_topic(request={"name": topic_path})
+    subscriber_client.create_subscription(
+        request={"name": subscription_path, "topic": topic_path}
+    )
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+    pipeline = create_gcs_event_pipeline()
+    publisher_pool = PubSubPublisherPool()
+    dlq_publisher = publisher_pool.get(
+        project_id=settings.gcp_project_id, topic=settings.dlq_topic
+    )
+    subscriber = PubSubPullSubscriber(
+        project_id=settings.gcp_project_id,
+        subscription=SUBSCRIPTION,
+        max_messages=settings.pull_max_messages,
+        max_bytes=settings.pull_max_bytes,
+        max_workers=settings.pull_max_workers,
+    )
+    try:
+        data = json.dumps(GCS_EVENT).encode()
+        for publish_future in [
+            publisher.publish(topic_path, data=data, bucketId="dummy_bucket")
+            for _ in range(MESSAGES)
+        ]:
+            publish_future.result()
+
+        handled = 0
+        lock = threading.Lock()
+        all_handled = threading.Event()
+
+        def callback(message) -> None:
+            nonlocal handled
+            handle_message(
+                message, pipeline=pipeline, loop=loop, dlq_publisher=dlq_publisher
+            )
+            with lock:
+                handled += 1
+                if handled == MESSAGES:
+                    all_handled.set()
+
+        start = time.perf_counter()
+        subscriber.subscribe(callback)
+        all_handled.wait(timeout=PULL_TIMEOUT_SEC)
+        return handled / (time.perf_counter() - start)
+    finally:
+        subscriber.close()
+        pipeline.close()
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+        publisher_pool.close()
+        subscriber_client.delete_subscription(request={"subscription": subscription_path})
+        publisher.delete_topic(request={"topic": topic_path})
+        subscriber_client.close()
+
+
+def main() -> None:
+    GoogleCloudStorage(project_id=settings.gcp_project_id).upload_stringio_to_gcs(
+        GCS_EVENT["bucket"], GCS_EVENT["name"], json.dumps([{"Name": "John Doe"}])
+    )
+    print(f"push mode : {push_mode():8.1f} messages/s (sequential POST /)")
+    print(
+        f"pull mode : {pull_mode():8.1f} messages/s "
+        f"(max_messages={settings.pull_max_messages}, workers={settings.pull_max_workers})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Per-request CPU spent on JSON for a typical GCS event, stdlib json against the
+shared serialiser (orjson when installed).
+
+Each simulated request parses the decoded Pub/Sub data, serialises the log entries
+written while handling it and renders the JSON response.
+
+Run from the repository root with the same environment as the unit tests, e.g.
+    PYTHONPATH=src python benchmarks/bench_serialiser.py
+"""
+import json
+import time
+from datetime import datetime
+
+from helper import serialiser
+
+REQUESTS = 20_000
+LOG_LINES_PER_REQUEST = 4
+
+GCS_EVENT = {
+    "kind": "storage#object",
+    "id": "dummy_bucket/test/2024/05/31/test_file.json/1717150210123431",
+    "selfLink": "https://www.googleapis.com/storage/v1/b/dummy_bucket/o/test_file.json",
+    "name": "test/2024/05/31/test_file.json",
+    "bucket": "dummy_bucket",
+    "generation": "1717150210123431",
+    "metageneration": "1",
+    "contentType": "application/json",
+    "timeCreated": "2024-05-31T10:10:10.123Z",
+    "updated": "2024-05-31T10:10:10.123Z",
+    "storageClass": "STANDARD",
+    "size": "1048576",
+    "md5Hash": "XUFAKrxLKna5cZ2REBfFkg==",
+    "crc32c": "yZRlqg==",
+    "etag": "CKih16GjycICEAE=",
+}
+
+
+def stdlib_request(raw_data: bytes) -> None:
+    data = json.loads(raw_data)
+    context = {
+        "project": "dummy-project",
+        "requestType": "/",
+        "original_request": {"message": {"data": data, "message_id": "123"}},
+    }
+    for _ in range(LOG_LINES_PER_REQUEST):
+        json.dumps({"product": "api", "message": "log line", "context": context})
+    json.dumps(
+        {"status": "Success", "pubsub_message_id": "123", "acknowledge_timestamp": str(datetime.now())}
+    ).encode("utf-8")
+
+
+def serialiser_request(raw_data: bytes) -> None:
+    data = serialiser.loads(raw_data)
+    context = {
+        "project": "dummy-project",
+        "requestType": "/",
+        "original_request": {"message": {"data": data, "message_id": "123"}},
+    }
+    for _ in range(LOG_LINES_PER_REQUEST):
+        serialiser.dumps({"product": "api", "message": "log line", "context": context})
+    serialiser.dumps_bytes(
+        {"status": "Success", "pubsub_message_id": "123", "acknowledge_timestamp": str(datetime.now())}
+    )
+
+
+def per_request_us(handler, raw_data: bytes) -> float:
+    start = time.process_time()
+    for _ in range(REQUESTS):
+        handler(raw_data)
+    return (time.process_time() - start) * 1_000_000 / REQUESTS
+
+
+def main() -> None:
+    raw_data = json.dumps(GCS_EVENT).encode("utf-8")
+    engine = "orjson" if serialiser.orjson is not None else "stdlib (orjson not installed)"
+    stdlib_us = per_request_us(stdlib_request, raw_data)
+    serialiser_us = per_request_us(serialiser_request, raw_data)
+    print(f"stdlib json : {stdlib_us:8.2f} us CPU per request")
+    print(f"serialiser  : {serialiser_us:8.2f} us CPU per request [{engine}]")
+    print(f"saved       : {stdlib_us - serialiser_us:8.2f} us ({100 * (1 - serialiser_us / stdlib_us):.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
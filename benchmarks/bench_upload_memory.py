@@ -0,0 +1,55 @@
+"""Peak memory when uploading a large pipeline output to GCS.
+
+Compares the previous upload path (the pipeline decoding its bytes to str, then
+StringIO, encode, BytesIO and getvalue for the size) with
+GoogleCloudStorage.upload_to_gcs, which streams the bytes as they are. Peak
+allocations are measured with tracemalloc and include the client library's own
+upload buffers.
+
+Uploads go to the storage emulator from docker-compose.yml. With the Docker
+Compose dev instance running:
+    docker exec gcp-cloud-run-template-api-dev /bin/sh -c "PYTHONPATH=/home/appuser/src poetry run python /home/appuser/benchmarks/bench_upload_memory.py"
+"""
+import io
+import tracemalloc
+
+from configuration.env import settings
+from gcp.gcs import GoogleCloudStorage
+
+PAYLOAD_SIZE_MB = 100
+BUCKET = "dummy_bucket"
+BLOB_NAME = "bench/upload_memory.bin"
+
+
+def previous_upload(gcs: GoogleCloudStorage, data: bytes) -> None:
+    blob = gcs._client.bucket(BUCKET).blob(BLOB_NAME)
+    string_io = io.StringIO(data.decode("utf-8"))
+    bytes_io = io.BytesIO(string_io.getvalue().encode())
+    blob.upload_from_file(bytes_io, size=len(bytes_io.getvalue()))
+
+
+def streamed_upload(gcs: GoogleCloudStorage, data: bytes) -> None:
+    gcs.upload_to_gcs(BUCKET, BLOB_NAME, data, content_type="application/octet-stream")
+
+
+def peak_mb(upload, gcs: GoogleCloudStorage, data: bytes) -> float:
+    tracemalloc.start()
+    upload(gcs, data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def main() -> None:
+    gcs = GoogleCloudStorage(project_id=settings.gcp_project_id)
+    data = b"x" * (PAYLOAD_SIZE_MB * 1024 * 1024)
+    print(f"payload          : {PAYLOAD_SIZE_MB} MB")
+    print(f"previous upload  : {peak_mb(previous_upload, gcs, data):8.1f} MB peak")
+    print(
+        f"upload_to_gcs    : {peak_mb(streamed_upload, gcs, data):8.1f} MB peak "
+        f"(chunk size {settings.gcs_upload_chunk_size // (1024 * 1024)} MB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Optional
 
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -16,6 +16,85 @@ class Settings(BaseSettings):
     )
     key_secret_id: str = "secret_manager_id"
     dlq_topic: str = "dlq.topic"
+    pubsub_max_inflight_publishes: int = 100
+    pubsub_compression: Optional[str] = None
+    pubsub_compression_threshold_bytes: int = 64 * 1024
+    # compressed push and pull messages larger than this once decompressed are dead-lettered
+    max_decompressed_bytes: int = 64 * 1024 * 1024
+    dlq_batch_enabled: bool = False
+    dlq_batch_max_messages: int = 100
+    dlq_batch_max_bytes: int = 1000000
+    dlq_batch_max_latency_sec: float = 0.05
+    dlq_flush_timeout_sec: float = 10
+    dlq_spool_enabled: bool = False
+    # each process spools into its own subdirectory
+    dlq_spool_dir: str = "/tmp/dlq_spool"
+    dlq_spool_segment_max_bytes: int = 4 * 1024 * 1024
+    dlq_spool_drain_interval_sec: float = 5
+    dlq_spool_max_backoff_sec: float = 300
+    pubsub_batch_max_concurrency: int = 10
+    pull_subscription: str = "gcs-events.subscription"
+    pull_max_messages: int = 100
+    pull_max_bytes: int = 100 * 1024 * 1024
+    pull_max_workers: int = 10
+    dedup_enabled: bool = False
+    dedup_backend: str = "memory"
+    dedup_ttl_sec: float = 3600
+    dedup_max_entries: int = 100_000
+    dedup_datastore_kind: str = "ProcessedPubsubMessage"
+    # identity or gzip
+    pipeline_transform: str = "identity"
+    pipeline_read_concurrency: int = 32
+    pipeline_transform_concurrency: int = 4
+    pipeline_upload_concurrency: int = 32
+    admission_enabled: bool = False
+    admission_max_inflight_pushes: int = 80
+    admission_max_queued_pushes: int = 40
+    admission_max_queue_wait_sec: float = 2
+    admission_reserved_consumer_inflight: int = 20
+    admission_max_queued_consumer: int = 20
+    adaptive_concurrency_enabled: bool = False
+    adaptive_concurrency_initial_limit: int = 10
+    adaptive_concurrency_min_limit: int = 1
+    adaptive_concurrency_max_limit: int = 200
+    adaptive_concurrency_latency_tolerance: float = 1.5
+    adaptive_concurrency_backoff_ratio: float = 0.7
+    gcs_read_chunk_size: int = 4 * 1024 * 1024
+    gcs_parallel_download_threshold: int = 64 * 1024 * 1024
+    gcs_parallel_download_chunk_size: int = 16 * 1024 * 1024
+    gcs_parallel_download_concurrency: int = 8
+    # must be a multiple of 256 KiB
+    gcs_upload_chunk_size: int = 8 * 1024 * 1024
+    gcs_composite_upload_threshold: int = 64 * 1024 * 1024
+    gcs_composite_upload_part_size: int = 8 * 1024 * 1024
+    gcs_composite_upload_concurrency: int = 8
+    # derived from the pipeline's and transfers' thread counts when 0
+    gcs_http_pool_size: int = 0
+    gcs_batch_concurrency: int = 16
+    gcs_cache_enabled: bool = False
+    gcs_cache_max_memory_bytes: int = 256 * 1024 * 1024
+    gcs_cache_max_disk_bytes: int = 1024 * 1024 * 1024
+    # a temporary directory when empty, each process caches into its own subdirectory
+    gcs_cache_dir: str = ""
+    datastore_cache_enabled: bool = False
+    datastore_cache_max_entries: int = 10_000
+    datastore_cache_ttl_sec: float = 60
+    # per kind overrides of datastore_cache_ttl_sec, e.g. {"Country": 3600}
+    datastore_cache_kind_ttl_sec: Dict[str, float] = {}
+    datastore_cache_negative_ttl_sec: float = 10
+    datastore_batch_window_sec: float = 0.002
+    # get_multi takes at most 1000 keys
+    datastore_batch_max_keys: int = 1000
+    datastore_singleflight_enabled: bool = False
+    datastore_query_page_size: int = 500
+    # create the default Datastore client in lifespan instead of on the first request
+    datastore_warm_clients: bool = False
+    # retries to a dependency are capped at this share of the calls made to it
+    retry_budget_ratio: float = 0.1
+    # retries allowed before any calls have earned budget
+    retry_budget_max_tokens: float = 10
+    # retries stop once a push request has run this long, no deadline when 0
+    retry_request_deadline_sec: float = 0
     datastore_namespace: str = "test_datastore"
 
 
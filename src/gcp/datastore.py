@@ -1,29 +1,251 @@
+import copy
+import datetime
 import logging
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
-from google.api_core.exceptions import BadRequest, ServiceUnavailable
+from google.api_core.exceptions import BadRequest, GoogleAPIError, ServiceUnavailable
 from google.cloud import datastore
 
 from configuration.env import settings
 from service.logger import CustomLoggerAdapter
 from error.custom_exceptions import DatastoreGenericError, InternalAPIException
-from helper.utils import exponential_retry_decorator
+from gcp.datastore_cache import get_entity_cache, normalise_filters
+from gcp.datastore_loader import KeyBatchLoader
+from helper.concurrency_limiter import DATASTORE_DEPENDENCY, dependency_limit
+from helper.singleflight import SingleFlight
+from helper.retry import Retry
 
 logger = CustomLoggerAdapter(logging.getLogger(__name__), None)
 
-ds_client = datastore.Client(project=settings.gcp_project_id, namespace=settings.namespace)
+# get_entity returns at most this many entities
+GET_ENTITY_LIMIT = 100
+
+# identical get_entity queries in flight at the same time share one query
+query_flights = SingleFlight()
+
+ClientKey = Tuple[str, Optional[str]]
+
+_clients: Dict[ClientKey, datastore.Client] = {}
+_key_loaders: Dict[ClientKey, KeyBatchLoader] = {}
+_clients_lock = threading.Lock()
+
+
+def _client_key(project_id: Optional[str], namespace: Optional[str]) -> ClientKey:
+    return (
+        project_id or settings.gcp_project_id,
+        namespace if namespace is not None else settings.datastore_namespace,
+    )
+
+
+def get_datastore_client(
+    project_id: Optional[str] = None, namespace: Optional[str] = None
+) -> datastore.Client:
+    """Process-wide client for the project and namespace, created on first use.
+    Defaults to settings.gcp_project_id and settings.datastore_namespace."""
+    key = _client_key(project_id, namespace)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = datastore.Client(project=key[0], namespace=key[1])
+    return client
+
+
+def warm_datastore_clients(namespaces: Iterable[Optional[str]] = (None,)) -> None:
+    """Creates the clients for the namespaces of settings.gcp_project_id up front, so
+    the first request does not pay for it"""
+    for namespace in namespaces:
+        get_datastore_client(namespace=namespace)
+
+
+def get_key_loader(
+    project_id: Optional[str] = None, namespace: Optional[str] = None
+) -> KeyBatchLoader:
+    """Process-wide batch loader for key lookups in the project and namespace"""
+    key = _client_key(project_id, namespace)
+    loader = _key_loaders.get(key)
+    if loader is None:
+        client = get_datastore_client(*key)
+        with _clients_lock:
+            loader = _key_loaders.get(key)
+            if loader is None:
+                loader = _key_loaders[key] = KeyBatchLoader(
+                    client,
+                    batch_window_sec=settings.datastore_batch_window_sec,
+                    max_batch_size=settings.datastore_batch_max_keys,
+                )
+    return loader
+
+
+def key_loader_stats() -> Dict[str, dict]:
+    return {
+        f"{project_id}/{namespace or ''}": loader.stats()
+        for (project_id, namespace), loader in list(_key_loaders.items())
+    }
+
+
+def get_entity_by_key(
+    kind: str, identifier, namespace: Optional[str] = None
+) -> Optional[datastore.Entity]:
+    """Entity of kind with the key name or id, None when it does not exist. Lookups
+    from concurrent requests are sent to Datastore together."""
+    client = get_datastore_client(namespace=namespace)
+    return get_key_loader(namespace=namespace).load(client.key(kind, identifier))
+
+
+def get_entities_by_keys(
+    kind: str, identifiers: Iterable, namespace: Optional[str] = None
+) -> List[Optional[datastore.Entity]]:
+    """Entities of kind with the key names or ids, in as few get_multi calls as possible"""
+    client = get_datastore_client(namespace=namespace)
+    return get_key_loader(namespace=namespace).load_many(
+        client.key(kind, identifier) for identifier in identifiers
+    )
 
-@exponential_retry_decorator(InternalAPIException, num_retries=5, logger=logger, time_to_wait = 10)
 def get_entity(kind: str, filters: dict) -> datastore.entity:
-    query = ds_client.query(kind=kind)
-    for query_filter in filters:
+    """Entities of kind matching the equality filters, read through the entity cache
+    when it is enabled (empty results are cached too)"""
+    cache = get_entity_cache()
+    if cache is not None:
+        cached = cache.get(kind, filters)
+        if cached is not None:
+            return cached
+    if settings.datastore_singleflight_enabled:
+        result, shared = query_flights.do(
+            (kind, normalise_filters(filters)), _query_entities, kind, filters
+        )
+        if shared:
+            result = copy.deepcopy(result)
+    else:
+        result = _query_entities(kind, filters)
+    if cache is not None:
+        cache.put(kind, filters, result)
+    return result
+
+
+def _query_entities(kind: str, filters: dict) -> datastore.entity:
+    result = list(iter_entities(kind, filters, limit=GET_ENTITY_LIMIT + 1))
+    if len(result) > GET_ENTITY_LIMIT:
+        logger.warning(
+            msg=f"More than {GET_ENTITY_LIMIT} {kind} entities match {filters}, "
+            f"returning the first {GET_ENTITY_LIMIT}, use iter_entities to read them all"
+        )
+        del result[GET_ENTITY_LIMIT:]
+    return result
+
+
+def iter_entities(
+    kind: str,
+    filters: Optional[dict] = None,
+    page_size: Optional[int] = None,
+    limit: Optional[int] = None,
+    projection: Optional[Sequence[str]] = None,
+    keys_only: bool = False,
+    order: Optional[Sequence[str]] = None,
+    namespace: Optional[str] = None,
+) -> Iterator[Union[datastore.Entity, datastore.Key]]:
+    """Streams the entities of kind matching the equality filters a page at a time,
+    so a kind of any size is read in constant memory.
+
+    Arguments:
+        kind: Kind to query
+        filters: Property values the entities must have
+        page_size: Entities fetched per request, defaults to settings.datastore_query_page_size
+        limit: Stop after this many entities, all of them when not given
+        projection: Only fetch these properties
+        keys_only: Only fetch keys, which are yielded instead of entities
+        order: Properties to order by, prefixed with "-" for descending order
+        namespace: Namespace to query, defaults to settings.datastore_namespace
+
+    Returns:
+        Iterator: The entities, or keys for keys_only queries
+
+    """
+    page_size = page_size or settings.datastore_query_page_size
+    query = get_datastore_client(namespace=namespace).query(kind=kind)
+    for query_filter in filters or {}:
         query.add_filter(query_filter, "=", filters[query_filter])
+    if keys_only:
+        query.keys_only()
+    elif projection:
+        query.projection = projection
+    if order:
+        query.order = order
+
+    cursor = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        fetch_size = page_size if remaining is None else min(page_size, remaining)
+        entities, cursor = _fetch_page(query, fetch_size, cursor)
+        for entity in entities:
+            yield entity.key if keys_only else entity
+        if remaining is not None:
+            remaining -= len(entities)
+        if cursor is None:
+            break
 
+
+@Retry(InternalAPIException, dependency=DATASTORE_DEPENDENCY, initial_delay_sec=0.01, max_delay_sec=1)
+def _fetch_page(
+    query: datastore.Query, page_size: int, cursor: Optional[bytes]
+) -> Tuple[List[datastore.Entity], Optional[bytes]]:
+    """One page of query results and the cursor to continue from, None after the last page"""
     try:
-        result = list(query.fetch(limit=100))
+        with dependency_limit(DATASTORE_DEPENDENCY):
+            query_iterator = query.fetch(limit=page_size, start_cursor=cursor)
+            page = next(query_iterator.pages, None)
+            entities = list(page) if page is not None else []
 
     except BadRequest as e:
         raise DatastoreGenericError(f"Bad request: {e}")
     except ServiceUnavailable as e:
         raise InternalAPIException(f"Service Unavailable: {e}")
 
-    return result
+    return entities, query_iterator.next_page_token
+
+
+class DatastoreDedupStore:
+    """Processed Pub/Sub message ids shared by every instance, stored as one entity
+    per message id with an expires_at property.
+
+    Lookups treat expired entities as missing, a TTL policy on expires_at can be
+    used to delete them. Concurrent lookups are batched into get_multi calls.
+    Datastore errors are logged and the message is processed again rather than
+    failing the request.
+    """
+
+    def __init__(self, kind: str, ttl_sec: float, client: datastore.Client = None) -> None:
+        self._kind = kind
+        self._ttl_sec = ttl_sec
+        self._client = client or get_datastore_client()
+        self._loader = KeyBatchLoader(
+            self._client,
+            batch_window_sec=settings.datastore_batch_window_sec,
+            max_batch_size=settings.datastore_batch_max_keys,
+        )
+
+    def is_processed(self, message_id: str) -> bool:
+        try:
+            entity = self._loader.load(self._client.key(self._kind, message_id))
+        except GoogleAPIError as e:
+            logger.error(msg=f"Failed to read dedup entry for message {message_id}: {e}")
+            return False
+        return entity is not None and entity["expires_at"] > datetime.datetime.now(
+            datetime.timezone.utc
+        )
+
+    def mark_processed(self, message_id: str) -> None:
+        entity = datastore.Entity(
+            key=self._client.key(self._kind, message_id),
+            exclude_from_indexes=("expires_at",),
+        )
+        entity["expires_at"] = datetime.datetime.now(
+            datetime.timezone.utc
+        ) + datetime.timedelta(seconds=self._ttl_sec)
+        try:
+            with dependency_limit(DATASTORE_DEPENDENCY):
+                self._client.put(entity)
+        except GoogleAPIError as e:
+            logger.error(msg=f"Failed to write dedup entry for message {message_id}: {e}")
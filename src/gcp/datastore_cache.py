@@ -0,0 +1,145 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from configuration.env import settings
+
+
+def normalise_filters(filters: dict) -> Tuple:
+    """Hashable form of equality filters that does not depend on their order"""
+
+    def freeze(value):
+        if isinstance(value, dict):
+            return tuple(sorted((name, freeze(item)) for name, item in value.items()))
+        if isinstance(value, (list, tuple, set)):
+            return tuple(freeze(item) for item in value)
+        return value
+
+    return tuple(sorted((name, freeze(value)) for name, value in filters.items()))
+
+
+class EntityCache:
+    """LRU of Datastore query results keyed by kind and normalised filters.
+
+    Results expire after the kind's TTL (kind_ttl_sec, falling back to ttl_sec).
+    Empty results are cached for negative_ttl_sec, so lookups of missing reference
+    data do not query Datastore every time either. Callers get copies of the cached
+    entities and can modify them freely.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_sec: float,
+        negative_ttl_sec: float,
+        kind_ttl_sec: Optional[Dict[str, float]] = None,
+        clock=time.monotonic,
+    ) -> None:
+        self._max_entries = max_entries
+        self._ttl_sec = ttl_sec
+        self._negative_ttl_sec = negative_ttl_sec
+        self._kind_ttl_sec = kind_ttl_sec or {}
+        self._clock = clock
+        # (kind, filters) -> (expires_at, entities)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, kind: str, filters: dict) -> Optional[List]:
+        """Cached result of the query, None on a miss (an empty list is a cached
+        empty result)"""
+        key = (kind, normalise_filters(filters))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry[1]:
+                self.hits += 1
+            else:
+                self.negative_hits += 1
+            entities = entry[1]
+        return [copy.deepcopy(entity) for entity in entities]
+
+    def put(self, kind: str, filters: dict, entities: List) -> None:
+        ttl_sec = (
+            self._kind_ttl_sec.get(kind, self._ttl_sec)
+            if entities
+            else self._negative_ttl_sec
+        )
+        if ttl_sec <= 0:
+            return
+        key = (kind, normalise_filters(filters))
+        entities = [copy.deepcopy(entity) for entity in entities]
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl_sec, entities)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, kind: Optional[str] = None, filters: Optional[dict] = None) -> int:
+        """Drops the cached result of one query, of every query on kind, or everything
+        when no kind is given. Returns the number of entries dropped."""
+        with self._lock:
+            if kind is None:
+                keys = list(self._entries)
+            elif filters is not None:
+                key = (kind, normalise_filters(filters))
+                keys = [key] if key in self._entries else []
+            else:
+                keys = [key for key in self._entries if key[0] == kind]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+_entity_cache: Optional[EntityCache] = None
+_entity_cache_lock = threading.Lock()
+
+
+def get_entity_cache() -> Optional[EntityCache]:
+    """Process-wide cache for datastore.get_entity, None when it is disabled"""
+    global _entity_cache
+    if not settings.datastore_cache_enabled:
+        return None
+    if _entity_cache is None:
+        with _entity_cache_lock:
+            if _entity_cache is None:
+                _entity_cache = EntityCache(
+                    max_entries=settings.datastore_cache_max_entries,
+                    ttl_sec=settings.datastore_cache_ttl_sec,
+                    negative_ttl_sec=settings.datastore_cache_negative_ttl_sec,
+                    kind_ttl_sec=settings.datastore_cache_kind_ttl_sec,
+                )
+    return _entity_cache
+
+
+def invalidate_entity_cache(kind: Optional[str] = None, filters: Optional[dict] = None) -> int:
+    """Drops cached get_entity results, e.g. after writing to the kind"""
+    cache = get_entity_cache()
+    return cache.invalidate(kind, filters) if cache is not None else 0
+
+
+def entity_cache_stats() -> Optional[dict]:
+    return _entity_cache.stats() if _entity_cache is not None else None
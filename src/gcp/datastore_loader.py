@@ -0,0 +1,108 @@
+import copy
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional
+
+from google.cloud import datastore
+
+from helper.concurrency_limiter import DATASTORE_DEPENDENCY, dependency_limit
+
+
+def _copy_entity(entity: Optional[datastore.Entity]) -> Optional[datastore.Entity]:
+    return copy.deepcopy(entity) if entity is not None else None
+
+
+class _Batch:
+    def __init__(self) -> None:
+        self.futures: Dict[datastore.Key, Future] = {}
+
+
+class KeyBatchLoader:
+    """Coalesces single key lookups from concurrent threads into get_multi calls.
+
+    The first lookup opens a batch and waits batch_window_sec for others to join it,
+    a batch reaching max_batch_size keys is sent straight away. Every caller gets its
+    own entity, or None when it does not exist. Lookups of the same key within a
+    batch share one get_multi result, and every caller after the first gets a deep
+    copy of it so none of them sees another's changes. Errors are raised to every
+    caller of the batch.
+    """
+
+    def __init__(
+        self, client: datastore.Client, batch_window_sec: float, max_batch_size: int
+    ) -> None:
+        self._client = client
+        self._batch_window_sec = batch_window_sec
+        self._max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._batch: Optional[_Batch] = None
+        self.loads = 0
+        self.rpcs = 0
+        self.largest_batch = 0
+
+    def load(self, key: datastore.Key) -> Optional[datastore.Entity]:
+        with self._lock:
+            self.loads += 1
+            batch = self._batch
+            opened = batch is None
+            if opened:
+                batch = self._batch = _Batch()
+            future = batch.futures.get(key)
+            first = future is None
+            if first:
+                future = batch.futures[key] = Future()
+            full = len(batch.futures) >= self._max_batch_size
+            if full:
+                self._batch = None
+
+        if opened and not full:
+            time.sleep(self._batch_window_sec)
+            with self._lock:
+                # unless the batch filled up and was sent in the meantime
+                full = self._batch is batch
+                if full:
+                    self._batch = None
+        if full:
+            self._dispatch(batch.futures)
+        entity = future.result()
+        return entity if first else _copy_entity(entity)
+
+    def load_many(self, keys: Iterable[datastore.Key]) -> List[Optional[datastore.Entity]]:
+        """Looks keys up in as few get_multi calls as possible, for callers that
+        already have all of them (such as one request needing several entities)"""
+        keys = list(keys)
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(unique_keys), self._max_batch_size):
+            futures = {
+                key: Future() for key in unique_keys[start : start + self._max_batch_size]
+            }
+            self._dispatch(futures)
+            found.update((key, future.result()) for key, future in futures.items())
+        with self._lock:
+            self.loads += len(keys)
+        returned = set()
+        results = []
+        for key in keys:
+            results.append(found[key] if key not in returned else _copy_entity(found[key]))
+            returned.add(key)
+        return results
+
+    def _dispatch(self, futures: Dict[datastore.Key, Future]) -> None:
+        with self._lock:
+            self.rpcs += 1
+            self.largest_batch = max(self.largest_batch, len(futures))
+        try:
+            with dependency_limit(DATASTORE_DEPENDENCY):
+                entities = self._client.get_multi(list(futures))
+        except BaseException as e:
+            for future in futures.values():
+                future.set_exception(e)
+            return
+        found = {entity.key: entity for entity in entities}
+        for key, future in futures.items():
+            future.set_result(found.get(key))
+
+    def stats(self) -> dict:
+        return {"loads": self.loads, "rpcs": self.rpcs, "largest_batch": self.largest_batch}
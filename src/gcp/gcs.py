@@ -1,39 +1,454 @@
+import base64
+import contextvars
+import hashlib
 import io
 import logging.config
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    NoReturn,
+    Optional,
+    Tuple,
+    Union,
+)
 
+import google_crc32c
 from google.api_core.exceptions import GoogleAPIError
+from requests.adapters import HTTPAdapter
 from google.cloud import storage
+from google.cloud.storage.retry import DEFAULT_RETRY
 from google.cloud.exceptions import NotFound
 
 from configuration.env import settings
 from configuration.logger_config import logger_config
 from error.custom_exceptions import ManualDLQError, PubsubReprocessError
+from helper.concurrency_limiter import GCS_DEPENDENCY, dependency_limit
+from helper.retry import Retry, is_transient_error
 from pydantic_model.api_model import ErrorEnum
 from service.logger import CustomLoggerAdapter
 
 logger = CustomLoggerAdapter(logging.getLogger(__name__), None)
 
+CHECKSUM_SLICE_SIZE = 1024 * 1024
+# parts of composite uploads are written under this prefix of the target bucket
+COMPOSITE_UPLOAD_PREFIX = "_composite_uploads"
+# GCS limits on one compose request and on the components of a composite object
+MAX_COMPOSE_SOURCES = 32
+MAX_COMPOSITE_COMPONENTS = 1024
+
+
+# idempotent calls are retried here rather than by the client, so their retries count
+# against the GCS retry budget. Uploads keep the client's retry, which resumes from the
+# last chunk the server received instead of replaying the stream.
+gcs_retry = Retry(is_transient_error, dependency=GCS_DEPENDENCY)
+
+
+def call_gcs(method: Callable, *args, transfer: bool = False, **kwargs):
+    """Calls the client method under the GCS concurrency limit, with transient errors
+    retried by gcs_retry. Downloads and copies are flagged as transfers."""
+
+    def attempt():
+        with dependency_limit(GCS_DEPENDENCY, transfer=transfer):
+            return method(*args, retry=None, **kwargs)
+
+    return gcs_retry.call(attempt)
+
+
+def raise_read_error(e: Exception) -> NoReturn:
+    """Maps a failed GCS read to the error the Pub/Sub message is handled with,
+    missing files are dead-lettered and anything else is retried"""
+    error_value = f"Failed to read file from google cloud storage: {e}"
+    logger.error(msg=error_value)
+    if isinstance(e, NotFound):
+        raise ManualDLQError(
+            original_request=logger_config.context.get().get("original_request"),
+            error_desc=error_value,
+            error_stage=ErrorEnum.FILE_NOT_FOUND,
+        )
+    raise PubsubReprocessError(
+        original_request=logger_config.context.get().get("original_request"),
+        error_desc=error_value,
+        error_stage=ErrorEnum.GOOGLE_API_ERROR,
+    )
+
+
+def crc32c_digest(data) -> bytes:
+    # google_crc32c only accepts bytes, so a bytearray is checksummed a slice at a time
+    checksum = google_crc32c.Checksum()
+    view = memoryview(data)
+    for start in range(0, len(view), CHECKSUM_SLICE_SIZE):
+        checksum.update(view[start : start + CHECKSUM_SLICE_SIZE].tobytes())
+    return checksum.digest()
+
+
+def verify_checksums(data, crc32c=None, md5_hash=None) -> None:
+    """Compares downloaded data with the object's base64 encoded crc32c and md5Hash
+    (composite objects only have a crc32c), a mismatch is retried"""
+    verify_digests(
+        crc32c_digest(data) if crc32c else None,
+        hashlib.md5(data).digest() if md5_hash else None,
+        crc32c,
+        md5_hash,
+    )
+
+
+def verify_digests(data_crc32c, data_md5, crc32c=None, md5_hash=None) -> None:
+    """verify_checksums for digests computed while the data was streamed"""
+    mismatches = []
+    if crc32c and base64.b64encode(data_crc32c).decode() != crc32c:
+        mismatches.append("crc32c")
+    if md5_hash and base64.b64encode(data_md5).decode() != md5_hash:
+        mismatches.append("md5Hash")
+    if mismatches:
+        error_value = f"Downloaded file does not match its {' and '.join(mismatches)}"
+        logger.error(msg=error_value)
+        raise PubsubReprocessError(
+            original_request=logger_config.context.get().get("original_request"),
+            error_desc=error_value,
+            error_stage=ErrorEnum.CHECKSUM_MISMATCH,
+        )
+
+
+class GcsFileReader(io.RawIOBase):
+    """Read-only file object over a GCS blob.
+
+    Data is fetched in ranged requests of chunk_size bytes, so only one chunk is
+    held in memory at a time. Errors are raised as ManualDLQError or
+    PubsubReprocessError like GoogleCloudStorage.read_gcs_file_to_bytes.
+    """
+
+    def __init__(self, blob: storage.Blob, chunk_size: int) -> None:
+        super().__init__()
+        self._blob_reader = blob.open("rb", chunk_size=chunk_size)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        try:
+            with dependency_limit(GCS_DEPENDENCY, transfer=True):
+                data = self._blob_reader.read(len(buffer))
+        except (GoogleAPIError, Exception) as e:
+            raise_read_error(e)
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._blob_reader.close()
+        super().close()
+
+
+def raise_upload_error(e: Exception, target_bucket_name) -> NoReturn:
+    """Maps a failed GCS upload to the error the Pub/Sub message is handled with"""
+    if isinstance(e, NotFound):
+        error_value = f"Failed to upload to GCS bucket: {e}"
+        logger.error(msg=error_value)
+        raise ManualDLQError(
+            original_request=logger_config.context.get().get("original_request"),
+            error_desc=error_value,
+            error_stage=ErrorEnum.UPLOAD_TO_GCS,
+        )
+    error_value = f"Failed to upload to GCS bucket - {target_bucket_name}: {e}"
+    logger.error(msg=error_value)
+    logger.error(msg=logger_config.context.get().get("original_request"))
+    raise PubsubReprocessError(
+        original_request=logger_config.context.get().get("original_request"),
+        error_desc=error_value,
+        error_stage=ErrorEnum.GOOGLE_API_ERROR,
+    )
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable file object over a bytes-like object.
+
+    Reads slice a memoryview of the buffer, unlike io.BytesIO which copies
+    bytearray and memoryview inputs up front.
+    """
+
+    def __init__(self, data) -> None:
+        super().__init__()
+        self._view = memoryview(data).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}
+        self._position = max(0, base[whence] + offset)
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else self._position + size
+        data = self._view[self._position : end].tobytes()
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self._view[self._position : self._position + len(buffer)]
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class IterableReader(io.RawIOBase):
+    """Forward-only file object over an iterable of byte chunks, holding at most one
+    chunk at a time"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk).cast("B")
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self._position += size
+        return size
+
+
+UploadData = Union[bytes, bytearray, memoryview, BinaryIO, Iterable[bytes]]
+
+
+def to_upload_stream(data: UploadData, size: Optional[int]) -> Tuple[BinaryIO, Optional[int]]:
+    """Wraps upload data in a file object without copying it, returns the stream
+    and its size when known"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return BufferReader(data), memoryview(data).nbytes if size is None else size
+    if hasattr(data, "read"):
+        return data, size
+    return io.BufferedReader(IterableReader(data)), size
+
+
+def http_pool_size() -> int:
+    """Connections kept per host, enough for every thread that can call GCS at once so
+    none of them opens and discards a connection of its own"""
+    return settings.gcs_http_pool_size or (
+        settings.pipeline_read_concurrency
+        + settings.pipeline_upload_concurrency
+        + settings.gcs_parallel_download_concurrency
+        + settings.gcs_composite_upload_concurrency
+        + settings.gcs_batch_concurrency
+    )
+
+
+_clients: Dict[str, storage.Client] = {}
+_clients_lock = threading.Lock()
+
+
+def get_storage_client(project_id: str) -> storage.Client:
+    """Process-wide storage client for the project, sharing one HTTP connection pool
+    between every GoogleCloudStorage instance"""
+    client = _clients.get(project_id)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(project_id)
+            if client is None:
+                client = storage.Client(project_id)
+                pool_size = http_pool_size()
+                # the default requests adapter keeps only 10 connections per host
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                client._http.mount("https://", adapter)
+                client._http.mount("http://", adapter)
+                _clients[project_id] = client
+    return client
+
+
+class GcsObjectResult(NamedTuple):
+    """Outcome for one object of a batch operation, error is the ManualDLQError or
+    PubsubReprocessError the single object operation raised"""
+
+    name: str
+    data: Optional[bytes] = None
+    error: Optional[Exception] = None
+
 
 class GoogleCloudStorage:
     """Class to interact with Google cloud storage"""
 
-    def __init__(self, project_id):
+    def __init__(self, project_id, cache=None):
         self._client = self._init_client(project_id)
+        # optional gcp.gcs_cache.GcsObjectCache in front of read_gcs_file_to_bytes
+        self._cache = cache
+
+    @property
+    def cache(self):
+        return self._cache
 
     def _init_client(self, project_id):
-        return storage.Client(project_id)
+        return get_storage_client(project_id)
+
+    @staticmethod
+    def _run_batch(
+        operation: Callable[[str], Optional[bytes]], blob_names: Iterable[str]
+    ) -> List[GcsObjectResult]:
+        def run(name: str) -> GcsObjectResult:
+            try:
+                return GcsObjectResult(name=name, data=operation(name))
+            except (ManualDLQError, PubsubReprocessError) as e:
+                return GcsObjectResult(name=name, error=e)
+
+        with ThreadPoolExecutor(
+            max_workers=settings.gcs_batch_concurrency, thread_name_prefix="gcs-batch"
+        ) as executor:
+            # the batch threads need the logging context for their errors
+            futures = [
+                executor.submit(contextvars.copy_context().run, run, name)
+                for name in blob_names
+            ]
+            return [future.result() for future in futures]
+
+    def read_many(self, bucket_name, blob_names: Iterable[str]) -> List[GcsObjectResult]:
+        """Reads files from a gcs bucket concurrently.
+
+        Arguments:
+            bucket_name: Bucket name where the files reside
+            blob_names: Names of the files to read
+
+        Returns:
+            List[GcsObjectResult]: The content or error of each file, in the order given
 
-    def read_gcs_file_to_bytes(self, bucket_name, source_blob_name) -> bytes:
+        """
+        return self._run_batch(
+            lambda name: self.read_gcs_file_to_bytes(bucket_name, name), blob_names
+        )
+
+    def upload_many(
+        self, target_bucket_name, files: Dict[str, UploadData], content_type=None
+    ) -> List[GcsObjectResult]:
+        """Uploads files to a gcs bucket concurrently.
+
+        Arguments:
+            target_bucket_name: Bucket name where the files should be uploaded
+            files: Data to upload by file name
+            content_type: Content type of the files, application/octet-stream when not given
+
+        Returns:
+            List[GcsObjectResult]: The error of each file, if any, in the order given
+
+        """
+        return self._run_batch(
+            lambda name: self.upload_to_gcs(
+                target_bucket_name, name, files[name], content_type=content_type
+            ),
+            files,
+        )
+
+    def delete_many(self, bucket_name, blob_names: Iterable[str]) -> List[GcsObjectResult]:
+        """Deletes files from a gcs bucket concurrently, files that do not exist count
+        as deleted.
+
+        Arguments:
+            bucket_name: Bucket name where the files reside
+            blob_names: Names of the files to delete
+
+        Returns:
+            List[GcsObjectResult]: The error of each file, if any, in the order given
+
+        """
+        bucket = self._client.bucket(bucket_name)
+
+        def delete(name: str) -> None:
+            try:
+                call_gcs(bucket.blob(name).delete)
+            except NotFound:
+                pass
+            except (GoogleAPIError, Exception) as e:
+                error_value = f"Failed to delete file from google cloud storage: {e}"
+                logger.error(msg=error_value)
+                raise PubsubReprocessError(
+                    original_request=logger_config.context.get().get("original_request"),
+                    error_desc=error_value,
+                    error_stage=ErrorEnum.GOOGLE_API_ERROR,
+                )
+
+        return self._run_batch(delete, blob_names)
+
+    def list_gcs_files(self, bucket_name, prefix=None) -> List[str]:
+        """Names of the files in a gcs bucket, optionally only those under prefix"""
+        with dependency_limit(GCS_DEPENDENCY):
+            return [
+                blob.name
+                for blob in self._client.list_blobs(bucket_name, prefix=prefix)
+            ]
+
+    def read_gcs_file_to_bytes(
+        self,
+        bucket_name,
+        source_blob_name,
+        size=None,
+        crc32c=None,
+        md5_hash=None,
+        generation=None,
+    ) -> bytes:
         """Reads a file as bytes from a gcs bucket.
 
+        Files of at least settings.gcs_parallel_download_threshold bytes are fetched
+        in parallel byte ranges when their size is known. With a cache, a generation
+        read before is served without touching the network.
+
         Arguments:
             bucket_name: Bucket name where the file resides
             source_blob_name: Name of the file to read
+            size: Size of the file in bytes, e.g. from the GCS notification
+            crc32c: Base64 encoded crc32c the parallel download and cached copies are
+                verified against
+            md5_hash: Base64 encoded md5 the parallel download is verified against
+            generation: Generation the ranges of a parallel download are pinned to, and
+                the cache key
 
         Returns:
-            bytes: The file as bytes
+            bytes: The file as bytes (a bytearray for parallel downloads)
 
         """
+        cacheable = self._cache is not None and generation and crc32c
+        if cacheable:
+            cached = self._cache.get(bucket_name, source_blob_name, generation, crc32c)
+            if cached is not None:
+                logger.info(msg=f"Read file from the cache: {source_blob_name}")
+                return cached
+        file_as_bytes = self._download(
+            bucket_name, source_blob_name, size, crc32c, md5_hash, generation
+        )
+        if cacheable:
+            self._cache.put(bucket_name, source_blob_name, generation, crc32c, file_as_bytes)
+        return file_as_bytes
+
+    def _download(
+        self, bucket_name, source_blob_name, size, crc32c, md5_hash, generation
+    ) -> bytes:
+        if size is not None and int(size) >= settings.gcs_parallel_download_threshold:
+            return self.download_gcs_file_in_parallel(
+                bucket_name, source_blob_name, int(size), crc32c, md5_hash, generation
+            )
         try:
             logger.info(msg=f"Reading file from the bucket: {bucket_name}")
             # Get the bucket
@@ -41,67 +456,318 @@ class GoogleCloudStorage:
             # Get the blob (file) from the bucket
             blob = bucket.blob(source_blob_name)
             # Read the file content as bytes
-            file_as_bytes = blob.download_as_bytes()
+            file_as_bytes = call_gcs(blob.download_as_bytes, transfer=True)
             logger.info(msg=f"Successfully read file from the bucket: {bucket_name}")
 
-        except NotFound as e:
-            error_value = f"Failed to read file from google cloud storage: {e}"
-            logger.error(msg=error_value)
-            raise ManualDLQError(
-                original_request=logger_config.context.get().get("original_request"),
-                error_desc=error_value,
-                error_stage=ErrorEnum.FILE_NOT_FOUND,
-            )
-
         except (GoogleAPIError, Exception) as e:
-            error_value = f"Failed to read file from google cloud storage: {e}"
-            logger.error(msg=error_value)
-            raise PubsubReprocessError(
-                original_request=logger_config.context.get().get("original_request"),
-                error_desc=error_value,
-                error_stage=ErrorEnum.GOOGLE_API_ERROR,
-            )
+            raise_read_error(e)
 
         return file_as_bytes
 
-    def upload_stringio_to_gcs(self, target_bucket_name, target_blob_name, string_data):
-        """Uploads string data to a gcs bucket.
+    def download_gcs_file_in_parallel(
+        self,
+        bucket_name,
+        source_blob_name,
+        size: int,
+        crc32c=None,
+        md5_hash=None,
+        generation=None,
+    ) -> bytearray:
+        """Downloads a file in byte ranges of settings.gcs_parallel_download_chunk_size,
+        fetched by up to settings.gcs_parallel_download_concurrency threads into one
+        preallocated buffer.
+
+        Arguments:
+            bucket_name: Bucket name where the file resides
+            source_blob_name: Name of the file to read
+            size: Size of the file in bytes
+            crc32c: Base64 encoded crc32c the download is verified against
+            md5_hash: Base64 encoded md5 the download is verified against
+            generation: Generation of the file to read, pins every range to the same version
+
+        Returns:
+            bytearray: The file's content
+
+        """
+        logger.info(msg=f"Reading file in parallel ranges from the bucket: {bucket_name}")
+        blob = self._client.bucket(bucket_name).blob(
+            source_blob_name, generation=int(generation) if generation else None
+        )
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        chunk_size = settings.gcs_parallel_download_chunk_size
+
+        def download_range(start: int) -> None:
+            end = min(start + chunk_size, size)
+            try:
+                # ranges can not be checked by the client, the whole file is verified below
+                data = call_gcs(
+                    blob.download_as_bytes, start=start, end=end - 1, checksum=None, transfer=True
+                )
+                if len(data) != end - start:
+                    raise ValueError(
+                        f"Expected {end - start} bytes at offset {start}, got {len(data)}"
+                    )
+                view[start:end] = data
+            except (GoogleAPIError, Exception) as e:
+                raise_read_error(e)
+
+        with ThreadPoolExecutor(
+            max_workers=settings.gcs_parallel_download_concurrency,
+            thread_name_prefix="gcs-download",
+        ) as executor:
+            # the range threads need the logging context for their errors
+            futures = [
+                executor.submit(contextvars.copy_context().run, download_range, start)
+                for start in range(0, size, chunk_size)
+            ]
+            for future in futures:
+                future.result()
+
+        verify_checksums(buffer, crc32c, md5_hash)
+        logger.info(msg=f"Successfully read file from the bucket: {bucket_name}")
+        return buffer
+
+    def open_gcs_file(
+        self, bucket_name, source_blob_name, chunk_size=None, generation=None
+    ) -> GcsFileReader:
+        """Opens a file in a gcs bucket for streaming reads.
+
+        Arguments:
+            bucket_name: Bucket name where the file resides
+            source_blob_name: Name of the file to read
+            chunk_size: Bytes fetched per request, defaults to settings.gcs_read_chunk_size
+            generation: Generation of the file to read, pins every request to the same version
+
+        Returns:
+            GcsFileReader: Read-only file object over the file
+
+        """
+        logger.info(msg=f"Opening file for streaming from the bucket: {bucket_name}")
+        blob = self._client.bucket(bucket_name).blob(
+            source_blob_name, generation=int(generation) if generation else None
+        )
+        return GcsFileReader(blob, chunk_size or settings.gcs_read_chunk_size)
+
+    def iter_gcs_file_chunks(
+        self,
+        bucket_name,
+        source_blob_name,
+        chunk_size=None,
+        crc32c=None,
+        md5_hash=None,
+        generation=None,
+    ) -> Iterator[bytes]:
+        """Streams a file from a gcs bucket, holding one chunk in memory at a time.
+
+        The checksums are verified after the last chunk is read and before the iterator
+        is exhausted, so an upload consuming it is never finalized with corrupt data.
+
+        Arguments:
+            bucket_name: Bucket name where the file resides
+            source_blob_name: Name of the file to read
+            chunk_size: Bytes per chunk, defaults to settings.gcs_read_chunk_size
+            crc32c: Base64 encoded crc32c the file is verified against
+            md5_hash: Base64 encoded md5 the file is verified against
+            generation: Generation of the file to read, pins every chunk to the same version
+
+        Returns:
+            Iterator[bytes]: The file's chunks in order
+
+        """
+        chunk_size = chunk_size or settings.gcs_read_chunk_size
+        crc32c_checksum = google_crc32c.Checksum() if crc32c else None
+        md5_checksum = hashlib.md5() if md5_hash else None
+        with self.open_gcs_file(
+            bucket_name, source_blob_name, chunk_size, generation
+        ) as reader:
+            while True:
+                chunk = reader.read(chunk_size)
+                if not chunk:
+                    break
+                if crc32c_checksum is not None:
+                    crc32c_checksum.update(chunk)
+                if md5_checksum is not None:
+                    md5_checksum.update(chunk)
+                yield chunk
+        verify_digests(
+            crc32c_checksum.digest() if crc32c_checksum is not None else None,
+            md5_checksum.digest() if md5_checksum is not None else None,
+            crc32c,
+            md5_hash,
+        )
+        logger.info(msg=f"Successfully streamed file from the bucket: {bucket_name}")
+
+    def upload_to_gcs(
+        self,
+        target_bucket_name,
+        target_blob_name,
+        data: UploadData,
+        content_type=None,
+        size=None,
+    ):
+        """Uploads data to a gcs bucket without copying it into intermediate buffers.
 
         Arguments:
             target_bucket_name: Bucket name where the file should be uploaded
             target_blob_name: Name of the file to upload
-            string_data: Data to upload
+            data: bytes, bytearray, memoryview, a binary file object or an iterable of byte chunks
+            content_type: Content type of the file, application/octet-stream when not given
+            size: Size of the data in bytes, taken from buffers and required for a single
+                request upload of file objects and iterables
 
         """
         try:
             logger.info(msg=f"Uploading file to {target_bucket_name}")
-            # Get the bucket
             bucket = self._client.bucket(target_bucket_name)
-            # Create a new blob in the bucket
             blob = bucket.blob(target_blob_name)
             logger.info(msg=f"blob: {blob}")
-            # Convert the StringIO object to a BytesIO object
-            string_io = io.StringIO(string_data)
-            bytes_io = io.BytesIO(string_io.getvalue().encode())
-            # Upload the BytesIO object to the GCS bucket
-            blob.upload_from_file(bytes_io, size=len(bytes_io.getvalue()))
+            if (
+                isinstance(data, (bytes, bytearray, memoryview))
+                and memoryview(data).nbytes >= settings.gcs_composite_upload_threshold
+            ):
+                self._upload_composite(bucket, blob, data, content_type)
+            else:
+                stream, size = to_upload_stream(data, size)
+                self._upload_stream(blob, stream, size, content_type)
             logger.info(msg=f"File uploaded to {target_bucket_name}")
 
-        except NotFound as e:
-            error_value = f"Failed to upload to GCS bucket: {e}"
-            logger.error(msg=error_value)
-            raise ManualDLQError(
-                original_request=logger_config.context.get().get("original_request"),
-                error_desc=error_value,
-                error_stage=ErrorEnum.UPLOAD_TO_GCS,
+        except (ManualDLQError, PubsubReprocessError):
+            # raised while reading streamed data, e.g. from iter_gcs_file_chunks
+            raise
+        except (GoogleAPIError, Exception) as e:
+            raise_upload_error(e, target_bucket_name)
+
+    @staticmethod
+    def _upload_stream(blob: storage.Blob, stream, size, content_type) -> None:
+        # payloads above the multipart limit go through a resumable upload in chunks of
+        # this size, a failed chunk is retried on its own instead of the whole upload
+        blob.chunk_size = settings.gcs_upload_chunk_size
+        with dependency_limit(GCS_DEPENDENCY, transfer=True):
+            blob.upload_from_file(
+                stream, size=size, content_type=content_type, retry=DEFAULT_RETRY
             )
+
+    def _upload_composite(
+        self, bucket: storage.Bucket, blob: storage.Blob, data, content_type
+    ) -> None:
+        """Uploads parts of the data in parallel and composes them into the blob, so a
+        stalled connection only costs one part"""
+        view = memoryview(data).cast("B")
+        # stay within the component limit of a composite object
+        part_size = max(
+            settings.gcs_composite_upload_part_size,
+            -(-len(view) // MAX_COMPOSITE_COMPONENTS),
+        )
+        upload_id = uuid.uuid4().hex
+        parts = [
+            bucket.blob(f"{COMPOSITE_UPLOAD_PREFIX}/{upload_id}/{blob.name}/{index:04d}")
+            for index in range(-(-len(view) // part_size))
+        ]
+        logger.info(msg=f"Uploading {len(parts)} parts of {blob.name} for composition")
+
+        def upload_part(index: int) -> None:
+            part_data = view[index * part_size : (index + 1) * part_size]
+            self._upload_stream(parts[index], BufferReader(part_data), len(part_data), content_type)
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=settings.gcs_composite_upload_concurrency,
+                thread_name_prefix="gcs-upload",
+            ) as executor:
+                futures = [
+                    executor.submit(contextvars.copy_context().run, upload_part, index)
+                    for index in range(len(parts))
+                ]
+                for future in futures:
+                    future.result()
+
+            blob.content_type = content_type
+            # a compose request takes at most 32 sources, later ones extend the blob
+            sources = parts[:MAX_COMPOSE_SOURCES]
+            remaining = parts[MAX_COMPOSE_SOURCES:]
+            while True:
+                call_gcs(blob.compose, sources, transfer=True)
+                if not remaining:
+                    break
+                sources = [blob] + remaining[: MAX_COMPOSE_SOURCES - 1]
+                remaining = remaining[MAX_COMPOSE_SOURCES - 1 :]
+        finally:
+            failed = [
+                result.name
+                for result in self.delete_many(bucket.name, [part.name for part in parts])
+                if result.error is not None
+            ]
+            if failed:
+                # leftover parts are only storage, a lifecycle rule on the prefix cleans them up
+                logger.warning(msg=f"Failed to delete {len(failed)} composite upload parts")
+
+    def copy_gcs_file(
+        self,
+        source_bucket_name,
+        source_blob_name,
+        target_bucket_name,
+        target_blob_name,
+        generation=None,
+    ) -> int:
+        """Copies a file between gcs buckets server-side, without downloading it.
+
+        Large or cross-location copies take several rewrite calls, each continuing
+        from the token returned by the previous one.
+
+        Arguments:
+            source_bucket_name: Bucket name where the file resides
+            source_blob_name: Name of the file to copy
+            target_bucket_name: Bucket name where the file should be copied to
+            target_blob_name: Name of the copy
+            generation: Generation of the file to copy, the latest one when not given
+
+        Returns:
+            int: Size of the file in bytes
+
+        """
+        try:
+            logger.info(
+                msg=f"Copying file from {source_bucket_name} to {target_bucket_name}"
+            )
+            source_blob = self._client.bucket(source_bucket_name).blob(
+                source_blob_name, generation=int(generation) if generation else None
+            )
+            target_blob = self._client.bucket(target_bucket_name).blob(target_blob_name)
+            token = None
+            while True:
+                token, bytes_rewritten, total_bytes = call_gcs(
+                    target_blob.rewrite, source_blob, token=token, transfer=True
+                )
+                if token is None:
+                    break
+                logger.info(msg=f"Copied {bytes_rewritten} of {total_bytes} bytes")
+            logger.info(msg=f"File copied to {target_bucket_name}")
+
         except (GoogleAPIError, Exception) as e:
-            error_value = f"Failed to upload to GCS bucket - {target_bucket_name}: {e}"
+            error_value = f"Failed to copy file in google cloud storage: {e}"
             logger.error(msg=error_value)
-            logger.error(msg=logger_config.context.get().get("original_request"))
-
+            if isinstance(e, NotFound):
+                raise ManualDLQError(
+                    original_request=logger_config.context.get().get("original_request"),
+                    error_desc=error_value,
+                    error_stage=ErrorEnum.FILE_NOT_FOUND,
+                )
             raise PubsubReprocessError(
                 original_request=logger_config.context.get().get("original_request"),
                 error_desc=error_value,
                 error_stage=ErrorEnum.GOOGLE_API_ERROR,
             )
+
+        return total_bytes
+
+    def upload_stringio_to_gcs(self, target_bucket_name, target_blob_name, string_data):
+        """Uploads string data to a gcs bucket.
+
+        Arguments:
+            target_bucket_name: Bucket name where the file should be uploaded
+            target_blob_name: Name of the file to upload
+            string_data: Data to upload
+
+        """
+        self.upload_to_gcs(target_bucket_name, target_blob_name, string_data.encode())
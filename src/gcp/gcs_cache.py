@@ -0,0 +1,240 @@
+import base64
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from configuration.env import settings
+from gcp.gcs import crc32c_digest
+from service.logger import CustomLoggerAdapter
+
+logger = CustomLoggerAdapter(logging.getLogger(__name__), None)
+
+CacheKey = Tuple[str, str, str]
+
+
+class GcsObjectCache:
+    """Two-tier LRU of GCS object contents keyed by bucket, name and generation.
+
+    A generation's content never changes, so a cached entry stays valid until it is
+    evicted. Entries are only stored when their content matches the object's crc32c,
+    and reads from disk are checksummed again before they are served. The memory tier
+    holds up to max_memory_bytes, the disk tier up to max_disk_bytes in directory,
+    least recently used entries are evicted first.
+
+    The cache owns directory: it holds a lock on it while it is open, removes any
+    files left in it on startup and deletes it on close.
+    """
+
+    def __init__(self, max_memory_bytes: int, max_disk_bytes: int, directory: str) -> None:
+        self._max_memory_bytes = max_memory_bytes
+        self._max_disk_bytes = max_disk_bytes
+        self._directory = directory
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # key -> (crc32c, size), the content lives in a file named after the key
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.checksum_failures = 0
+        os.makedirs(directory, exist_ok=True)
+        self._owner_lock = os.open(directory, os.O_RDONLY)
+        fcntl.flock(self._owner_lock, fcntl.LOCK_EX)
+        # files of an earlier process with the same pid are not indexed, drop them
+        for name in os.listdir(directory):
+            _remove_path(os.path.join(directory, name))
+
+    def _path(self, key: CacheKey) -> str:
+        return os.path.join(
+            self._directory, hashlib.sha256("/".join(key).encode()).hexdigest()
+        )
+
+    def get(
+        self, bucket_name: str, blob_name: str, generation: str, crc32c: str
+    ) -> Optional[bytes]:
+        """Cached content of the object generation, None on a miss"""
+        key = (bucket_name, blob_name, str(generation))
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] == crc32c:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            on_disk = self._disk.get(key)
+            if on_disk is None or on_disk[0] != crc32c:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(key)
+
+        data = self._read_file(key)
+        if data is None or base64.b64encode(crc32c_digest(data)).decode() != crc32c:
+            with self._lock:
+                if data is not None:
+                    self.checksum_failures += 1
+                    logger.warning(msg=f"Cached copy of {blob_name} failed its crc32c check")
+                self._remove_from_disk_locked(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self._add_to_memory_locked(key, crc32c, data)
+        return data
+
+    def put(
+        self, bucket_name: str, blob_name: str, generation: str, crc32c: str, data
+    ) -> None:
+        """Caches the object generation if its content matches crc32c"""
+        if len(data) > self._max_memory_bytes and len(data) > self._max_disk_bytes:
+            return
+        data = bytes(data)
+        if base64.b64encode(crc32c_digest(data)).decode() != crc32c:
+            with self._lock:
+                self.checksum_failures += 1
+            logger.warning(
+                msg=f"Not caching {blob_name}, its content does not match its crc32c"
+            )
+            return
+        key = (bucket_name, blob_name, str(generation))
+        written = len(data) <= self._max_disk_bytes and self._write_file(key, data)
+        with self._lock:
+            self._add_to_memory_locked(key, crc32c, data)
+            if written:
+                self._add_to_disk_locked(key, crc32c, len(data))
+
+    def _add_to_memory_locked(self, key: CacheKey, crc32c: str, data: bytes) -> None:
+        if len(data) > self._max_memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous[1])
+        self._memory[key] = (crc32c, data)
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self._max_memory_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _add_to_disk_locked(self, key: CacheKey, crc32c: str, size: int) -> None:
+        previous = self._disk.pop(key, None)
+        if previous is not None:
+            self._disk_bytes -= previous[1]
+        self._disk[key] = (crc32c, size)
+        self._disk_bytes += size
+        while self._disk_bytes > self._max_disk_bytes:
+            self._remove_from_disk_locked(next(iter(self._disk)))
+            self.evictions += 1
+
+    def _remove_from_disk_locked(self, key: CacheKey) -> None:
+        entry = self._disk.pop(key, None)
+        if entry is None:
+            return
+        self._disk_bytes -= entry[1]
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _read_file(self, key: CacheKey) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def _write_file(self, key: CacheKey, data: bytes) -> bool:
+        path = self._path(key)
+        try:
+            # readers never see a partially written file
+            with tempfile.NamedTemporaryFile(dir=self._directory, delete=False) as file:
+                file.write(data)
+            os.replace(file.name, path)
+            return True
+        except OSError as e:
+            logger.warning(msg=f"Failed to write GCS cache file: {e}")
+            return False
+
+    def close(self) -> None:
+        """Drops every entry and deletes the cache directory"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._disk.clear()
+            self._disk_bytes = 0
+            shutil.rmtree(self._directory, ignore_errors=True)
+            os.close(self._owner_lock)
+
+    def stats(self) -> dict:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "checksum_failures": self.checksum_failures,
+        }
+
+
+def _remove_path(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _remove_orphaned_directories(root_dir: str) -> None:
+    """Deletes the cache directories in root_dir whose process has exited"""
+    for entry in os.listdir(root_dir):
+        directory = os.path.join(root_dir, entry)
+        # only the per-process directories, named after their pid, are ours
+        if not entry.isdigit() or not os.path.isdir(directory):
+            continue
+        try:
+            lock_fd = os.open(directory, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # the owner is still running
+            os.close(lock_fd)
+            continue
+        try:
+            shutil.rmtree(directory, ignore_errors=True)
+        finally:
+            os.close(lock_fd)
+
+
+def create_gcs_object_cache() -> Optional[GcsObjectCache]:
+    """Builds the object cache configured in settings, None when it is disabled.
+
+    Every process caches into its own subdirectory of gcs_cache_dir, so the disk cap
+    holds per gunicorn worker and directories of exited workers are removed.
+    """
+    if not settings.gcs_cache_enabled:
+        return None
+    if settings.gcs_cache_dir:
+        os.makedirs(settings.gcs_cache_dir, exist_ok=True)
+        _remove_orphaned_directories(settings.gcs_cache_dir)
+        directory = os.path.join(settings.gcs_cache_dir, str(os.getpid()))
+    else:
+        directory = tempfile.mkdtemp(prefix="gcs-cache-")
+    return GcsObjectCache(
+        max_memory_bytes=settings.gcs_cache_max_memory_bytes,
+        max_disk_bytes=settings.gcs_cache_max_disk_bytes,
+        directory=directory,
+    )
@@ -1,47 +1,107 @@
-import decimal
-import json
+import asyncio
+import threading
 from concurrent import futures
-from datetime import date, datetime
+from functools import partial
+from typing import Callable, Dict, Optional, Tuple
 
 from google.cloud import pubsub_v1
 
+from configuration.env import settings
 from error.custom_exceptions import PubsubPublishException
+from helper import serialiser
+from helper.concurrency_limiter import (
+    PUBSUB_DEPENDENCY,
+    dependency_limit,
+    dependency_limit_async,
+)
+from helper.compression import CONTENT_ENCODING_ATTRIBUTE, compress_payload
+from helper.retry import Retry, is_transient_error
 from service.logger import CustomLoggerAdapter, configure_logger
 
 PUBSUB_PUBLISH_TIMEOUT_SEC = 10
 
 logger = CustomLoggerAdapter(configure_logger(), None)
 
+# a message may be published twice when a response is lost, consumers of the DLQ
+# already see redelivered messages
+pubsub_retry = Retry(is_transient_error, dependency=PUBSUB_DEPENDENCY)
+
+
+def get_dlq_batch_settings() -> Optional[pubsub_v1.types.BatchSettings]:
+    """Batch settings for DLQ publishers, None when batching is disabled"""
+    if not settings.dlq_batch_enabled:
+        return None
+    return pubsub_v1.types.BatchSettings(
+        max_bytes=settings.dlq_batch_max_bytes,
+        max_latency=settings.dlq_batch_max_latency_sec,
+        max_messages=settings.dlq_batch_max_messages,
+    )
+
 
 class PubSubPublisher:
-    def __init__(self, project_id, topic):
+    def __init__(self, project_id, topic, batch_settings=None):
         self._project_id = project_id
         self._topic = topic
-        self._ps_client = self._get_publisher_client()
+        self._ps_client = self._get_publisher_client(batch_settings)
+        self._inflight_publishes = asyncio.Semaphore(
+            settings.pubsub_max_inflight_publishes
+        )
+        self._pending_publishes = set()
+        self._pending_lock = threading.Lock()
 
     @staticmethod
-    def _get_publisher_client() -> pubsub_v1.PublisherClient:
-        return pubsub_v1.PublisherClient()
+    def _get_publisher_client(batch_settings=None) -> pubsub_v1.PublisherClient:
+        if batch_settings is None:
+            return pubsub_v1.PublisherClient()
+        return pubsub_v1.PublisherClient(batch_settings=batch_settings)
+
+    json_serial = staticmethod(serialiser.json_serial)
 
     @staticmethod
-    def json_serial(obj):
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        elif isinstance(obj, decimal.Decimal):
-            return int(obj)
-        raise TypeError(f"Type {type(obj)} is not serializable")
+    def encode_payload(data) -> Tuple[bytes, Dict[str, str]]:
+        """JSON encodes the data, compressing it with settings.pubsub_compression when
+        it is above the size threshold. Returns the payload and the attributes
+        describing its encoding."""
+        payload = serialiser.dumps_bytes(data)
+        if (
+            settings.pubsub_compression
+            and len(payload) >= settings.pubsub_compression_threshold_bytes
+        ):
+            return (
+                compress_payload(payload, settings.pubsub_compression),
+                {CONTENT_ENCODING_ATTRIBUTE: settings.pubsub_compression},
+            )
+        return payload, {}
+
+    def _submit(self, data, source_message_uuid, source_publish_time) -> futures.Future:
+        payload, encoding_attributes = self.encode_payload(data)
+        return self._ps_client.publish(
+            topic=f"projects/{self._project_id}/topics/{self._topic}",
+            data=payload,
+            source_message_uuid=str(source_message_uuid),
+            source_publish_time=str(source_publish_time),
+            **encoding_attributes,
+        )
+
+    def _publish_once(self, data, source_message_uuid, source_publish_time) -> str:
+        with dependency_limit(PUBSUB_DEPENDENCY):
+            publish_future = self._submit(data, source_message_uuid, source_publish_time)
+            return publish_future.result(timeout=PUBSUB_PUBLISH_TIMEOUT_SEC)
+
+    async def _publish_once_async(self, data, source_message_uuid, source_publish_time) -> str:
+        async with dependency_limit_async(PUBSUB_DEPENDENCY):
+            publish_future = self._submit(data, source_message_uuid, source_publish_time)
+            return await asyncio.wait_for(
+                asyncio.wrap_future(publish_future),
+                timeout=PUBSUB_PUBLISH_TIMEOUT_SEC,
+            )
 
     def publish(self, data, source_message_uuid, source_publish_time) -> None:
         logger.info(f"Publishing to DLQ topic: {self._topic}")
         try:
-            data_str = json.dumps(data, default=self.json_serial)
-            publish_future = self._ps_client.publish(
-                topic=f"projects/{self._project_id}/topics/{self._topic}",
-                data=data_str.encode("utf-8"),
-                source_message_uuid=str(source_message_uuid),
-                source_publish_time=str(source_publish_time),
-            )
-            message_id = publish_future.result(timeout=PUBSUB_PUBLISH_TIMEOUT_SEC)
+            message_id = pubsub_retry.call(
+                self._publish_once, data, source_message_uuid, source_publish_time
+            )
             logger.info(
                 f"Message published to DLQ topic with the following id: {message_id}"
             )
@@ -54,3 +114,146 @@ class PubSubPublisher:
         except Exception as ge:
             logger.error(f"Unknown exception occured while publishing to DLQ: {ge}")
             raise PubsubPublishException(str(ge))
+
+    async def publish_async(self, data, source_message_uuid, source_publish_time) -> None:
+        """Publishes without blocking the event loop while waiting for the message id.
+
+        The number of publishes awaited at once is bounded by
+        settings.pubsub_max_inflight_publishes, transient errors are retried without
+        blocking the event loop and failures raise PubsubPublishException exactly as
+        publish() does.
+        """
+        logger.info(f"Publishing to DLQ topic: {self._topic}")
+        async with self._inflight_publishes:
+            try:
+                message_id = await pubsub_retry.call_async(
+                    self._publish_once_async, data, source_message_uuid, source_publish_time
+                )
+                logger.info(
+                    f"Message published to DLQ topic with the following id: {message_id}"
+                )
+            except asyncio.TimeoutError:
+                error_value = (
+                    f"Publishing data timed after {PUBSUB_PUBLISH_TIMEOUT_SEC} "
+                    f"seconds to pubsub topic {self._topic}."
+                )
+                logger.error(error_value)
+                raise PubsubPublishException(error_value)
+            except Exception as ge:
+                logger.error(f"Unknown exception occured while publishing to DLQ: {ge}")
+                raise PubsubPublishException(str(ge))
+
+    def publish_nowait(
+        self,
+        data,
+        source_message_uuid,
+        source_publish_time,
+        on_error: Optional[Callable[[PubsubPublishException], None]] = None,
+    ) -> None:
+        """Adds the message to the client's current batch and returns immediately.
+
+        The batch is sent once it reaches the configured size or latency. If the
+        publish fails, the error is logged and passed to on_error.
+        """
+        try:
+            publish_future = self._submit(
+                data, source_message_uuid, source_publish_time
+            )
+        except Exception as ge:
+            logger.error(f"Unknown exception occured while publishing to DLQ: {ge}")
+            raise PubsubPublishException(str(ge))
+
+        with self._pending_lock:
+            self._pending_publishes.add(publish_future)
+        publish_future.add_done_callback(
+            partial(self._on_publish_done, on_error=on_error)
+        )
+
+    def _on_publish_done(self, publish_future: futures.Future, on_error=None) -> None:
+        with self._pending_lock:
+            self._pending_publishes.discard(publish_future)
+
+        exception = publish_future.exception()
+        if exception is None:
+            logger.info(
+                f"Message published to DLQ topic with the following id: "
+                f"{publish_future.result()}"
+            )
+            return
+
+        logger.error(f"Unknown exception occured while publishing to DLQ: {exception}")
+        if on_error is not None:
+            on_error(PubsubPublishException(str(exception)))
+
+    @property
+    def pending_publishes(self) -> int:
+        return len(self._pending_publishes)
+
+    def flush(self, timeout=None) -> None:
+        """Waits for every message queued with publish_nowait to be sent"""
+        with self._pending_lock:
+            pending = list(self._pending_publishes)
+        if not pending:
+            return
+
+        logger.info(f"Flushing {len(pending)} pending message(s) to topic: {self._topic}")
+        _, not_done = futures.wait(pending, timeout=timeout)
+        if not_done:
+            logger.error(
+                f"{len(not_done)} message(s) were not published to topic "
+                f"{self._topic} within {timeout} seconds"
+            )
+
+    def close(self, timeout=None) -> None:
+        """Sends any outstanding batches, waits for them and closes the gRPC channel"""
+        self._ps_client.stop()
+        self.flush(timeout=timeout)
+        self._ps_client.transport.close()
+
+
+class PubSubPublisherPool:
+    """Process-wide registry of publishers keyed by project and topic.
+
+    A publisher (and therefore its gRPC channel) is created on first use and then
+    shared by every request and thread in the worker until the pool is closed.
+    """
+
+    def __init__(self, batch_settings=None) -> None:
+        self._batch_settings = batch_settings
+        self._publishers = {}
+        self._lock = threading.Lock()
+
+    def get(self, project_id, topic) -> PubSubPublisher:
+        key = (project_id, topic)
+        publisher = self._publishers.get(key)
+        if publisher is None:
+            with self._lock:
+                publisher = self._publishers.get(key)
+                if publisher is None:
+                    publisher = PubSubPublisher(
+                        project_id=project_id,
+                        topic=topic,
+                        batch_settings=self._batch_settings,
+                    )
+                    self._publishers[key] = publisher
+                    logger.info(
+                        f"Opened Pub/Sub publisher channel for topic: {topic} "
+                        f"({len(self._publishers)} open)"
+                    )
+        return publisher
+
+    @property
+    def open_channels(self) -> int:
+        return len(self._publishers)
+
+    def close(self, timeout=None) -> None:
+        """Flushes pending batches of every publisher and closes their channels"""
+        with self._lock:
+            publishers, self._publishers = self._publishers, {}
+
+        for (_, topic), publisher in publishers.items():
+            try:
+                publisher.close(timeout=timeout)
+            except Exception as ge:
+                logger.error(f"Failed to close Pub/Sub publisher for topic {topic}: {ge}")
+        logger.info(f"Closed {len(publishers)} Pub/Sub publisher channel(s)")
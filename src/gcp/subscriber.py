@@ -0,0 +1,64 @@
+from concurrent import futures
+from typing import Any, Callable, Optional
+
+from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.subscriber.futures import StreamingPullFuture
+from google.cloud.pubsub_v1.subscriber.message import Message as PulledMessage
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
+
+from service.logger import CustomLoggerAdapter, configure_logger
+
+logger = CustomLoggerAdapter(configure_logger(), None)
+
+
+class PubSubPullSubscriber:
+    """Streaming pull subscriber with flow control.
+
+    At most max_messages messages (and max_bytes bytes) are leased at once, and
+    callbacks run on a pool of max_workers threads, so the worker sets the delivery
+    rate instead of Pub/Sub.
+    """
+
+    def __init__(
+        self, project_id, subscription, max_messages, max_bytes, max_workers
+    ) -> None:
+        self._client = pubsub_v1.SubscriberClient()
+        self._subscription_path = self._client.subscription_path(
+            project_id, subscription
+        )
+        self._flow_control = pubsub_v1.types.FlowControl(
+            max_messages=max_messages, max_bytes=max_bytes
+        )
+        self._max_workers = max_workers
+        self._streaming_pull_future: Optional[StreamingPullFuture] = None
+
+    def subscribe(
+        self, callback: Callable[[PulledMessage], Any]
+    ) -> StreamingPullFuture:
+        """Opens the streaming pull, callback must ack or nack every message"""
+        scheduler = ThreadScheduler(
+            executor=futures.ThreadPoolExecutor(max_workers=self._max_workers)
+        )
+        self._streaming_pull_future = self._client.subscribe(
+            self._subscription_path,
+            callback=callback,
+            flow_control=self._flow_control,
+            scheduler=scheduler,
+            await_callbacks_on_shutdown=True,
+        )
+        logger.info(f"Listening for messages on {self._subscription_path}")
+        return self._streaming_pull_future
+
+    def close(self, timeout=None) -> None:
+        """Stops pulling, waits for the running callbacks and closes the channel"""
+        if self._streaming_pull_future is not None:
+            self._streaming_pull_future.cancel()
+            try:
+                self._streaming_pull_future.result(timeout=timeout)
+            except futures.CancelledError:
+                pass
+            except Exception as ge:
+                logger.error(f"Streaming pull on {self._subscription_path} ended with: {ge}")
+            self._streaming_pull_future = None
+        self._client.close()
+        logger.info(f"Closed Pub/Sub subscriber for {self._subscription_path}")
@@ -0,0 +1,49 @@
+import gzip
+import io
+
+try:
+    import zstandard
+except ImportError:  # zstandard is a dependency, gzip still works without it
+    zstandard = None
+
+CONTENT_ENCODING_ATTRIBUTE = "content-encoding"
+GZIP = "gzip"
+ZSTD = "zstd"
+
+
+def supported_encodings() -> tuple:
+    return (GZIP, ZSTD) if zstandard is not None else (GZIP,)
+
+
+def compress_payload(payload: bytes, encoding: str) -> bytes:
+    if encoding == GZIP:
+        return gzip.compress(payload, compresslevel=6)
+    if encoding == ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+    raise ValueError(f"Unsupported content-encoding: {encoding}")
+
+
+def _read_at_most(reader, max_size: int) -> bytes:
+    output = bytearray()
+    while len(output) <= max_size:
+        chunk = reader.read(max_size + 1 - len(output))
+        if not chunk:
+            return bytes(output)
+        output += chunk
+    raise ValueError(f"decompressed payload is larger than {max_size} bytes")
+
+
+def decompress_payload(payload: bytes, encoding: str, max_size: int) -> bytes:
+    """Reverses compress_payload, decompressing at most max_size bytes so a small
+    payload can not expand without bound. Any failure is raised as a ValueError."""
+    if encoding not in supported_encodings():
+        raise ValueError(f"Unsupported content-encoding: {encoding}")
+    try:
+        if encoding == GZIP:
+            reader = gzip.GzipFile(fileobj=io.BytesIO(payload))
+        else:
+            reader = zstandard.ZstdDecompressor().stream_reader(payload)
+        with reader:
+            return _read_at_most(reader, max_size)
+    except Exception as e:
+        raise ValueError(f"Unable to decompress {encoding} payload: {e}") from e
@@ -0,0 +1,280 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import Dict, FrozenSet, Optional
+
+from google.api_core.exceptions import ClientError, GoogleAPIError, TooManyRequests
+
+from configuration.env import settings
+
+GCS_DEPENDENCY = "gcs"
+DATASTORE_DEPENDENCY = "datastore"
+PUBSUB_DEPENDENCY = "pubsub"
+
+# share of the gap towards a slower sample the no-load latency drifts by while the
+# limit is at its minimum, so a dependency that has permanently slowed down stops
+# being treated as overloaded
+BASELINE_DRIFT = 0.1
+
+# dependencies whose slot the current call already holds, calls nested in it (such as
+# a streamed upload reading its source) run in that slot instead of waiting for another
+_held_dependencies: contextvars.ContextVar[FrozenSet[str]] = contextvars.ContextVar(
+    "held_dependencies", default=frozenset()
+)
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """GoogleAPIErrors that signal an overloaded dependency, client errors such as
+    NotFound say nothing about its load (except 429)"""
+    return isinstance(exc, GoogleAPIError) and (
+        not isinstance(exc, ClientError) or isinstance(exc, TooManyRequests)
+    )
+
+
+class _AsyncWaiter:
+    def __init__(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+
+    def wake(self) -> None:
+        self.granted = True
+        self.loop.call_soon_threadsafe(self._set_result)
+
+    def _set_result(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class _ThreadWaiter:
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.granted = False
+
+    def wake(self) -> None:
+        self.granted = True
+        self.event.set()
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on the calls in flight to one dependency.
+
+    Every call reports its latency. While latency stays within latency_tolerance
+    times the no-load baseline (the fastest call seen) the limit grows by roughly one per round trip, when
+    a call is slower or fails with an overload error the limit is cut by
+    backoff_ratio, at most once per observed latency so one slow burst only counts
+    once. Callers over the limit wait in FIFO order, from threads or coroutines.
+
+    Transfers, whose latency grows with the size of the object, are not compared
+    with the baseline. They only cut the limit on overload errors.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_tolerance: float = 1.5,
+        backoff_ratio: float = 0.7,
+        clock=time.monotonic,
+    ) -> None:
+        self.name = name
+        self._limit = float(initial_limit)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._latency_tolerance = latency_tolerance
+        self._backoff_ratio = backoff_ratio
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self._inflight = 0
+        self._baseline_latency: Optional[float] = None
+        self._last_latency: Optional[float] = None
+        self._last_decrease = float("-inf")
+        self.calls = 0
+        self.overload_errors = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _try_acquire_locked(self) -> bool:
+        if not self._waiters and self._inflight < int(self._limit):
+            self._inflight += 1
+            return True
+        return False
+
+    def _grant_waiters_locked(self) -> None:
+        while self._waiters and self._inflight < int(self._limit):
+            self._inflight += 1
+            self._waiters.popleft().wake()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            waiter = _ThreadWaiter()
+            self._waiters.append(waiter)
+        waiter.event.wait()
+
+    async def acquire_async(self) -> None:
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            waiter = _AsyncWaiter()
+            self._waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # the slot was handed over as the waiter was cancelled
+                    self._inflight -= 1
+                    self._grant_waiters_locked()
+                else:
+                    self._waiters.remove(waiter)
+            raise
+
+    def release(
+        self, latency_sec: float, overloaded: bool = False, transfer: bool = False
+    ) -> None:
+        """Frees the slot and adapts the limit to the call's latency and outcome"""
+        with self._lock:
+            self._inflight -= 1
+            self.calls += 1
+            slow = False
+            if not transfer:
+                self._last_latency = latency_sec
+                if self._baseline_latency is None or latency_sec < self._baseline_latency:
+                    self._baseline_latency = latency_sec
+                elif self._limit <= self._min_limit:
+                    self._baseline_latency += (
+                        latency_sec - self._baseline_latency
+                    ) * BASELINE_DRIFT
+                slow = latency_sec > self._baseline_latency * self._latency_tolerance
+
+            if overloaded:
+                self.overload_errors += 1
+            now = self._clock()
+            if overloaded or slow:
+                if now - self._last_decrease >= latency_sec:
+                    self._limit = max(
+                        float(self._min_limit), self._limit * self._backoff_ratio
+                    )
+                    self._last_decrease = now
+                    self.decreases += 1
+            else:
+                self._limit = min(float(self._max_limit), self._limit + 1 / self._limit)
+            self._grant_waiters_locked()
+
+    @contextmanager
+    def limit_call(self, transfer: bool = False):
+        self.acquire()
+        start = time.monotonic()
+        overloaded = False
+        try:
+            yield
+        except BaseException as e:
+            overloaded = is_overload_error(e)
+            raise
+        finally:
+            self.release(time.monotonic() - start, overloaded=overloaded, transfer=transfer)
+
+    @asynccontextmanager
+    async def limit_call_async(self, transfer: bool = False):
+        await self.acquire_async()
+        start = time.monotonic()
+        overloaded = False
+        try:
+            yield
+        except BaseException as e:
+            overloaded = is_overload_error(e)
+            raise
+        finally:
+            self.release(time.monotonic() - start, overloaded=overloaded, transfer=transfer)
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self._limit),
+            "inflight": self._inflight,
+            "waiting": len(self._waiters),
+            "baseline_latency_sec": self._baseline_latency,
+            "last_latency_sec": self._last_latency,
+            "calls": self.calls,
+            "overload_errors": self.overload_errors,
+            "decreases": self.decreases,
+        }
+
+
+_limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(dependency: str) -> Optional[AdaptiveConcurrencyLimiter]:
+    """Process-wide limiter for the dependency, None when adaptive concurrency is disabled"""
+    if not settings.adaptive_concurrency_enabled:
+        return None
+    limiter = _limiters.get(dependency)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(dependency)
+            if limiter is None:
+                limiter = AdaptiveConcurrencyLimiter(
+                    name=dependency,
+                    initial_limit=settings.adaptive_concurrency_initial_limit,
+                    min_limit=settings.adaptive_concurrency_min_limit,
+                    max_limit=settings.adaptive_concurrency_max_limit,
+                    latency_tolerance=settings.adaptive_concurrency_latency_tolerance,
+                    backoff_ratio=settings.adaptive_concurrency_backoff_ratio,
+                )
+                _limiters[dependency] = limiter
+    return limiter
+
+
+@contextmanager
+def _holding(dependency: str):
+    token = _held_dependencies.set(_held_dependencies.get() | {dependency})
+    try:
+        yield
+    finally:
+        _held_dependencies.reset(token)
+
+
+@contextmanager
+def _limit_call(limiter: AdaptiveConcurrencyLimiter, transfer: bool):
+    with limiter.limit_call(transfer), _holding(limiter.name):
+        yield
+
+
+@asynccontextmanager
+async def _limit_call_async(limiter: AdaptiveConcurrencyLimiter, transfer: bool):
+    async with limiter.limit_call_async(transfer):
+        with _holding(limiter.name):
+            yield
+
+
+def dependency_limit(dependency: str, transfer: bool = False):
+    """Context manager limiting a blocking call to the dependency. Calls whose
+    duration depends on the amount of data moved are flagged as transfers. A call
+    made while the context already holds a slot for the dependency is not limited."""
+    limiter = get_limiter(dependency)
+    if limiter is None or dependency in _held_dependencies.get():
+        return nullcontext()
+    return _limit_call(limiter, transfer)
+
+
+def dependency_limit_async(dependency: str, transfer: bool = False):
+    """Async context manager limiting an awaited call to the dependency"""
+    limiter = get_limiter(dependency)
+    if limiter is None or dependency in _held_dependencies.get():
+        return nullcontext()
+    return _limit_call_async(limiter, transfer)
+
+
+def limiter_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
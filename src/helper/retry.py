@@ -0,0 +1,257 @@
+import asyncio
+import contextvars
+import inspect
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Optional, Tuple, Type, Union
+
+import requests
+from google.api_core.exceptions import ServerError, TooManyRequests
+
+from configuration.env import settings
+from service.logger import CustomLoggerAdapter
+
+logger = CustomLoggerAdapter(logging.getLogger(__name__), None)
+
+RetryOn = Union[Type[BaseException], Tuple[Type[BaseException], ...], Callable[[BaseException], bool]]
+
+# monotonic time the current request has to finish by, None when it has no deadline
+_request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Server errors, 429s and dropped connections, which a later attempt may not hit"""
+    return isinstance(
+        exc,
+        (
+            ServerError,
+            TooManyRequests,
+            ConnectionError,
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ),
+    )
+
+
+@contextmanager
+def request_deadline(timeout_sec: float):
+    """Stops retries inside the block from sleeping past timeout_sec from now, an
+    enclosing deadline that is sooner still applies. No deadline when timeout_sec <= 0."""
+    if timeout_sec <= 0:
+        yield
+        return
+    deadline = time.monotonic() + timeout_sec
+    enclosing = _request_deadline.get()
+    token = _request_deadline.set(deadline if enclosing is None else min(enclosing, deadline))
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def full_jitter_delay(
+    attempt: int, initial_delay_sec: float, max_delay_sec: float, multiplier: float, rng=random.random
+) -> float:
+    """Delay before retry number attempt (from 1), drawn uniformly between 0 and the
+    capped exponential delay so retries from many callers spread out"""
+    return rng() * min(max_delay_sec, initial_delay_sec * multiplier ** (attempt - 1))
+
+
+class RetryBudget:
+    """Caps the retries to one dependency at a share of the calls made to it.
+
+    Every call earns ratio tokens and every retry spends one, so at most ratio retries
+    are made per call once the initial max_tokens are spent. While a dependency is
+    down callers fail fast instead of multiplying its load.
+    """
+
+    def __init__(self, name: str, ratio: float, max_tokens: float) -> None:
+        self.name = name
+        self._ratio = ratio
+        self._max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.exhausted = 0
+        self.deadline_exceeded = 0
+        self.failures = 0
+
+    def record_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self._max_tokens, self._tokens + self._ratio)
+
+    def try_retry(self) -> bool:
+        """Spends a token for a retry, False when the budget is exhausted"""
+        with self._lock:
+            if self._tokens < 1:
+                self.exhausted += 1
+                return False
+            self._tokens -= 1
+            self.retries += 1
+            return True
+
+    def record_deadline_exceeded(self) -> None:
+        with self._lock:
+            self.deadline_exceeded += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    def stats(self) -> dict:
+        return {
+            "tokens": self._tokens,
+            "calls": self.calls,
+            "retries": self.retries,
+            "budget_exhausted": self.exhausted,
+            "deadline_exceeded": self.deadline_exceeded,
+            "failures": self.failures,
+        }
+
+
+_budgets: Dict[str, RetryBudget] = {}
+_budgets_lock = threading.Lock()
+
+
+def get_retry_budget(dependency: str) -> RetryBudget:
+    """Process-wide retry budget for the dependency"""
+    budget = _budgets.get(dependency)
+    if budget is None:
+        with _budgets_lock:
+            budget = _budgets.get(dependency)
+            if budget is None:
+                budget = _budgets[dependency] = RetryBudget(
+                    name=dependency,
+                    ratio=settings.retry_budget_ratio,
+                    max_tokens=settings.retry_budget_max_tokens,
+                )
+    return budget
+
+
+def retry_stats() -> dict:
+    return {name: budget.stats() for name, budget in list(_budgets.items())}
+
+
+class Retry:
+    """Retries a sync or async callable with full jitter exponential backoff.
+
+    Errors matching retry_on (exception types or a predicate) are retried up to
+    max_attempts calls in total, as long as the dependency's retry budget allows it
+    and the next attempt would start before the deadline: deadline_sec from the first
+    attempt or the request_deadline, whichever is sooner. Async callables back off
+    with asyncio.sleep, so the event loop is never blocked. Once retries stop the
+    last error is raised.
+    """
+
+    def __init__(
+        self,
+        retry_on: RetryOn,
+        dependency: str,
+        max_attempts: int = 5,
+        initial_delay_sec: float = 0.1,
+        max_delay_sec: float = 10,
+        multiplier: float = 2,
+        deadline_sec: Optional[float] = None,
+        rng=random.random,
+        clock=time.monotonic,
+    ) -> None:
+        if isinstance(retry_on, (type, tuple)):
+            exception_types = retry_on
+            self._should_retry = lambda e: isinstance(e, exception_types)
+        else:
+            self._should_retry = retry_on
+        self._dependency = dependency
+        self._max_attempts = max_attempts
+        self._initial_delay_sec = initial_delay_sec
+        self._max_delay_sec = max_delay_sec
+        self._multiplier = multiplier
+        self._deadline_sec = deadline_sec
+        self._rng = rng
+        self._clock = clock
+
+    def _deadline(self, started: float) -> Optional[float]:
+        deadlines = [
+            deadline
+            for deadline in (
+                started + self._deadline_sec if self._deadline_sec is not None else None,
+                _request_deadline.get(),
+            )
+            if deadline is not None
+        ]
+        return min(deadlines) if deadlines else None
+
+    def _next_delay(
+        self, error: BaseException, attempt: int, started: float, budget: RetryBudget
+    ) -> Optional[float]:
+        """Seconds to wait before retrying after the error, None to give up"""
+        if not self._should_retry(error):
+            return None
+        if attempt >= self._max_attempts:
+            budget.record_failure()
+            return None
+        delay = full_jitter_delay(
+            attempt, self._initial_delay_sec, self._max_delay_sec, self._multiplier, self._rng
+        )
+        deadline = self._deadline(started)
+        if deadline is not None and self._clock() + delay >= deadline:
+            budget.record_deadline_exceeded()
+            return None
+        if not budget.try_retry():
+            return None
+        logger.warning(
+            msg=f"{self._dependency} call failed ({error}), retry {attempt} in {delay:.3f} seconds"
+        )
+        return delay
+
+    def call(self, func: Callable, *args, **kwargs):
+        budget = get_retry_budget(self._dependency)
+        budget.record_call()
+        started = self._clock()
+        attempt = 1
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(e, attempt, started, budget)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, func: Callable, *args, **kwargs):
+        budget = get_retry_budget(self._dependency)
+        budget.record_call()
+        started = self._clock()
+        attempt = 1
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(e, attempt, started, budget)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def __call__(self, func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await self.call_async(func, *args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+
+        return wrapper
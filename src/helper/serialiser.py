@@ -0,0 +1,42 @@
+import decimal
+import json
+from datetime import date, datetime
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library encoder
+    orjson = None
+
+
+def json_serial(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    elif isinstance(obj, decimal.Decimal):
+        return int(obj)
+    raise TypeError(f"Type {type(obj)} is not serializable")
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Serialises obj to UTF-8 JSON, using orjson when it is installed.
+
+    Values orjson rejects (e.g. integers wider than 64 bits) are retried with the
+    standard library encoder, so both engines accept the same inputs.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=json_serial, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj, default=json_serial).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parses JSON, decode errors are raised as json.decoder.JSONDecodeError"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
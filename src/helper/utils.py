@@ -1,10 +1,8 @@
 import base64
 import binascii
-import time
 import io
 import json
 from typing import Sequence
-from functools import wraps
 
 from fastapi import Request
 from pydantic_core import ValidationError
@@ -14,6 +12,8 @@ from configuration.logger_config import logger_config
 from error.custom_exceptions import ManualDLQError, MessageDecodeError, MessageValidationError
 
 from gcp.gcs import GoogleCloudStorage
+from helper import serialiser
+from helper.compression import CONTENT_ENCODING_ATTRIBUTE, decompress_payload
 from pydantic_model.api_model import GcsToPubsubEvent, ErrorEnum
 from service.logger import CustomLoggerAdapter, configure_logger
 
@@ -22,7 +22,8 @@ logger = CustomLoggerAdapter(configure_logger(), None)
 def format_pydantic_validation_error_message(pydantic_exception: Sequence) -> str:
     exceptions_list = []
     for exception in pydantic_exception:
-        parameter = exception["loc"][-1]
+        # errors about the whole object have an empty location
+        parameter = exception["loc"][-1] if exception["loc"] else "body"
         message = exception["msg"]
         exceptions_list.append({"parameter": parameter, "reason": message})
     return f"The following request parameters failed validation: {str(exceptions_list)}"
@@ -44,9 +45,26 @@ def create_pydantic_validation_error_message(pydantic_exception: str) -> str:
         f"The following request parameters failed validation: {exceptions_list}"
     )
 
-def decode_pubsub_message_data(data, strict=True) -> str:
+def decode_pubsub_message_bytes(data, content_encoding=None) -> bytes:
+    """Base64 decodes PubSub message data to bytes, decompressing it first when the
+    message carries a content-encoding attribute (see PubSubPublisher.encode_payload)"""
     try:
-        return base64.b64decode(data).decode("utf-8").strip()
+        decoded = base64.b64decode(data)
+    except binascii.Error as be:
+        raise MessageDecodeError(f"Pubsub Message Data Base64 error: {be}")
+    if content_encoding:
+        try:
+            decoded = decompress_payload(
+                decoded, content_encoding, settings.max_decompressed_bytes
+            )
+        except ValueError as ve:
+            raise MessageDecodeError(f"Pubsub Message Data Decompression error: {ve}")
+    return decoded
+
+
+def decode_pubsub_message_data(data, strict=True, content_encoding=None) -> str:
+    try:
+        return decode_pubsub_message_bytes(data, content_encoding).decode("utf-8").strip()
     except TypeError as te:
         if isinstance(data, dict):
             logger.info(f"PubSub message data was not encoded.")
@@ -57,44 +75,81 @@ def decode_pubsub_message_data(data, strict=True) -> str:
             raise MessageDecodeError(
                 f"Unknown DataType for PubSub message data - unable to decode. {te}"
             )
-    except binascii.Error as be:
-        raise MessageDecodeError(f"Pubsub Message Data Base64 error: {be}")
     except UnicodeDecodeError as ude:
         raise MessageDecodeError(f"Pubsub Message Data Decoding error: {ude}")
 
 
-def read_validate_message_data(request):
+def decode_dlq_message_data(pubsub_message: dict):
+    """Returns the data to publish to the DLQ for a PubSub message dict, reusing it
+    as-is when it has already been decoded"""
+    data = pubsub_message.get("data")
+    if isinstance(data, (dict, list)):
+        return data
     try:
-        message_data = GcsToPubsubEvent(
-            **json.loads(decode_pubsub_message_data(request.message.data))
+        return serialiser.loads(
+            decode_pubsub_message_data(
+                data,
+                strict=False,
+                content_encoding=(pubsub_message.get("attributes") or {}).get(
+                    CONTENT_ENCODING_ATTRIBUTE
+                ),
+            )
         )
+    except (MessageDecodeError, ValueError):
+        # data that can not be decoded is dead-lettered as it was received
+        return data
+
+
+def validate_gcs_event(data: dict, original_request: dict = None) -> GcsToPubsubEvent:
+    """Validates decoded message data as a GCS notification, raises ManualDLQError
+    carrying original_request (the request in the logging context by default)"""
+    if original_request is None:
+        original_request = logger_config.context.get().get("original_request")
+    try:
+        if not isinstance(data, dict):
+            raise MessageValidationError(
+                f"Expected a JSON object, got {type(data).__name__}"
+            )
+        message_data = GcsToPubsubEvent(**data)
         logger.info(f"Data Decoded {message_data.model_dump()}")
         return message_data
-    except json.decoder.JSONDecodeError as jse:
-        logger.error(msg=dict(exception=str(jse.msg)))
-        raise ManualDLQError(
-            original_request=logger_config.context.get().get("original_request"),
-            error_desc=str(jse.msg),
-            error_stage=ErrorEnum.MESSAGE_VALIDATION,
-        )
     except MessageValidationError as mve:
         logger.error(msg=dict(exception=str(mve)))
         raise ManualDLQError(
-            original_request=logger_config.context.get().get("original_request"),
+            original_request=original_request,
             error_desc=str(mve),
             error_stage=ErrorEnum.MESSAGE_VALIDATION,
         )
     except ValidationError as ve:
-        logger.error(logger_config.context.get().get("original_request"))
+        logger.error(original_request)
         validation_exception = create_pydantic_validation_error_message(str(ve))
         logger.error(msg=dict(exception=str(validation_exception)))
         raise ManualDLQError(
-            original_request=logger_config.context.get().get("original_request"),
+            original_request=original_request,
             error_desc=validation_exception,
             error_stage=ErrorEnum.MESSAGE_VALIDATION,
         )
 
 
+def read_validate_message_data(request):
+    try:
+        data = serialiser.loads(
+            decode_pubsub_message_data(
+                request.message.data,
+                content_encoding=request.message.attributes.get(
+                    CONTENT_ENCODING_ATTRIBUTE
+                ),
+            )
+        )
+    except json.decoder.JSONDecodeError as jse:
+        logger.error(msg=dict(exception=str(jse.msg)))
+        raise ManualDLQError(
+            original_request=logger_config.context.get().get("original_request"),
+            error_desc=str(jse.msg),
+            error_stage=ErrorEnum.MESSAGE_VALIDATION,
+        )
+    return validate_gcs_event(data)
+
 
 def remove_file_extension(file_extension_string, extension_to_remove=""):
     if extension_to_remove in file_extension_string:
@@ -115,43 +170,3 @@ def extract_trace_and_request_type(original_request: Request) -> dict:
     ctx_required_fields["requestType"] = original_request.scope["path"]
     return ctx_required_fields
 
-
-def exponential_retry_decorator(ExceptionToCheck, num_retries=4, time_to_wait=5, backoff_factor=1.5, logger=None):
-    """Retry calling the decorated function using an exponential backoff.
-    :param ExceptionToCheck: the exception to check. may be a tuple of
-        exceptions to check
-    :type ExceptionToCheck: Exception or tuple
-    :param num_retries: number of times to try before giving up
-    :type num_retries: int
-    :param time_to_wait: initial delay between retries in milliseconds
-    :type time_to_wait: int
-    :param backoff_factor: backoff_factor multiplier e.g. value of 2 will double the delay
-        each retry
-    :type backoff_factor: int
-    :param logger: logger to use. If None, print
-    :type logger: logging.Logger instance
-    """
-
-    def deco_retry(f):
-
-        @wraps(f)
-        def func_retry(*args, **kwargs):
-            deco_num_retries, deco_time_tow_wait = num_retries, time_to_wait
-            while deco_num_retries > 1:
-                try:
-                    return f(*args, **kwargs)
-                except ExceptionToCheck as e:
-                    msg = "%s, Retrying in %s seconds..." % (str(e), deco_time_tow_wait / 1000)
-                    if logger:
-                        logger.warning(msg)
-                    else:
-                        print(msg)
-                    time.sleep(deco_time_tow_wait / 1000)
-                    deco_num_retries -= 1
-                    deco_time_tow_wait *= backoff_factor
-            return f(*args, **kwargs)
-
-        return func_retry  # true decorator
-
-    return deco_retry
-
@@ -1,21 +1,36 @@
-import json
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, List
 import pendulum
 
 from fastapi import FastAPI, Request, status, Response, Depends
-from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 
 from configuration.env import settings
-from gcp.pubsub import PubSubPublisher
+from gcp.datastore import key_loader_stats, warm_datastore_clients
+from gcp.datastore_cache import entity_cache_stats
+from gcp.pubsub import PubSubPublisher, PubSubPublisherPool, get_dlq_batch_settings
 from gcp.secret import SecretManager
 from core.api import build_hello_world
 from configuration.logger_config import logger_config
 from service.logger import CustomLoggerAdapter, configure_logger
 from service import dependencies
-from helper.utils import decode_pubsub_message_data, extract_trace_and_request_type, format_pydantic_validation_error_message, create_pydantic_validation_error_message
+from service.admission import AdmissionControlMiddleware, create_admission_controller
+from service.dlq_spool import DlqSpool, drain_spool_forever
+from service.envelope import DecodedEnvelope
+from service.dedup import create_dedup_store, mark_processed
+from service.pipeline import (
+    create_gcs_event_pipeline,
+    log_dead_lettered,
+    log_reprocess_error,
+    process_pubsub_message_once,
+)
+from service.responses import SerialiserJSONResponse
+from helper.concurrency_limiter import limiter_stats
+from helper.retry import request_deadline, retry_stats
+from helper.utils import decode_dlq_message_data, extract_trace_and_request_type, format_pydantic_validation_error_message, create_pydantic_validation_error_message
 from error.custom_exceptions import (
     ManualDLQError,
     InternalAPIException,
@@ -29,67 +44,357 @@ from error.custom_exceptions import (
 )
 from pydantic_model.api_model import (
     Message,
+    BatchItemResult,
+    BatchItemStatus,
+    BatchResponse,
     StatusLog,
     ErrorResponse,
     LogStatus,
+    ErrorEnum,
     GCPTemplateResponse,
     GCPTemplateRequest
 )
 
 logger = CustomLoggerAdapter(configure_logger(), None)
 
+PUSH_PATHS = ("/", "/batch")
+CONSUMER_PATHS = ("/v1/hello_world",)
+
 
 @asynccontextmanager
-async def lifespan(_: FastAPI) -> AsyncGenerator[None, None]:
+async def lifespan(fastapi_app: FastAPI) -> AsyncGenerator[None, None]:
     if settings.is_test_env:
         keys = ""
     else:
         sm_client = SecretManager()
         keys = sm_client.get_secret(settings.key_secret_id)
+    fastapi_app.state.publisher_pool = PubSubPublisherPool(
+        batch_settings=get_dlq_batch_settings()
+    )
+    fastapi_app.state.admission = create_admission_controller(
+        push_paths=PUSH_PATHS, consumer_paths=CONSUMER_PATHS
+    )
+    if settings.datastore_warm_clients:
+        warm_datastore_clients()
+    fastapi_app.state.dedup_store = create_dedup_store()
+    fastapi_app.state.pipeline = create_gcs_event_pipeline()
+    fastapi_app.state.dlq_spool = None
+    spool_drainer = None
+    if settings.dlq_spool_enabled:
+        fastapi_app.state.dlq_spool = DlqSpool(
+            spool_dir=settings.dlq_spool_dir,
+            segment_max_bytes=settings.dlq_spool_segment_max_bytes,
+        )
+        spool_drainer = asyncio.create_task(
+            drain_spool_forever(
+                spool=fastapi_app.state.dlq_spool,
+                publisher=fastapi_app.state.publisher_pool.get(
+                    project_id=settings.gcp_project_id, topic=settings.dlq_topic
+                ),
+                interval_sec=settings.dlq_spool_drain_interval_sec,
+                max_backoff_sec=settings.dlq_spool_max_backoff_sec,
+            )
+        )
     yield
+    if spool_drainer is not None:
+        spool_drainer.cancel()
+        with suppress(asyncio.CancelledError):
+            await spool_drainer
+    fastapi_app.state.pipeline.close()
+    # flush any batched DLQ messages before the instance is scaled down
+    fastapi_app.state.publisher_pool.close(timeout=settings.dlq_flush_timeout_sec)
+    if fastapi_app.state.dlq_spool is not None:
+        # batches that failed to flush were spooled above, the next process drains them
+        fastapi_app.state.dlq_spool.close()
+
+
+app = FastAPI(
+    title=settings.api_name,
+    lifespan=lifespan,
+    default_response_class=SerialiserJSONResponse,
+)
+app.add_middleware(AdmissionControlMiddleware)
+
+
+def get_dlq_publisher(request: Request) -> PubSubPublisher:
+    """Returns the shared DLQ publisher from the pool created in lifespan"""
+    return request.app.state.publisher_pool.get(
+        project_id=settings.gcp_project_id, topic=settings.dlq_topic
+    )
+
+
+def spool_dlq_message(
+    request: Request, data, source_message_uuid, source_publish_time
+) -> bool:
+    """Appends the message to the DLQ spool when enabled, returns whether it was spooled"""
+    dlq_spool = request.app.state.dlq_spool
+    if dlq_spool is None:
+        return False
+    try:
+        dlq_spool.append(
+            data=data,
+            source_message_uuid=source_message_uuid,
+            source_publish_time=source_publish_time,
+        )
+    except OSError as oe:
+        logger.error(msg=f"Unable to spool the DLQ message: {str(oe)}")
+        return False
+    return True
 
 
-app = FastAPI(title=settings.api_name, lifespan=lifespan)
+def log_dlq_publish_failure(
+    message_id, source_bucket_name, exc: PubsubPublishException
+) -> None:
+    logger.error(
+        msg=f"Unable to send the message to DLQ: {str(exc)}",
+        extra_fields=StatusLog(
+            message_id=message_id,
+            status=LogStatus.FAILURE,
+            source_bucket_name=source_bucket_name,
+            destination_bucket_name=None,
+            error_stage=ErrorEnum.SENDING_TO_DLQ,
+            error_desc=str(exc),
+            response_status_code="202",
+            log_timestamp=datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        ).model_dump(),
+    )
+
+
+async def publish_to_dlq(
+    request: Request,
+    data,
+    source_message_uuid,
+    source_publish_time,
+    source_bucket_name=None,
+) -> None:
+    """Sends a message to the DLQ topic.
+
+    With settings.dlq_batch_enabled the message is queued into the current batch
+    and failures are only logged, otherwise the publish is awaited. Failed
+    publishes go to the DLQ spool when it is enabled, otherwise they raise
+    PubsubPublishException.
+    """
+    pubsub_publisher = get_dlq_publisher(request)
+    if settings.dlq_batch_enabled:
+
+        def on_error(exc: PubsubPublishException) -> None:
+            log_dlq_publish_failure(source_message_uuid, source_bucket_name, exc)
+            spool_dlq_message(request, data, source_message_uuid, source_publish_time)
+
+        pubsub_publisher.publish_nowait(
+            data=data,
+            source_message_uuid=source_message_uuid,
+            source_publish_time=source_publish_time,
+            on_error=on_error,
+        )
+        return
+
+    try:
+        await pubsub_publisher.publish_async(
+            data=data,
+            source_message_uuid=source_message_uuid,
+            source_publish_time=source_publish_time,
+        )
+    except PubsubPublishException:
+        if not spool_dlq_message(
+            request, data, source_message_uuid, source_publish_time
+        ):
+            raise
+
+
+async def dead_letter_message(request: Request, exc: ManualDLQError) -> None:
+    """Sends the message behind a ManualDLQError to the DLQ and logs it as failed.
+
+    Raises PubsubPublishException when the message could not be published or spooled.
+    """
+    pubsub_message = exc.original_request["message"]
+    source_bucket_name = (pubsub_message.get("attributes") or {}).get("bucketId", None)
+    await publish_to_dlq(
+        request,
+        data=decode_dlq_message_data(pubsub_message),
+        source_message_uuid=pubsub_message.get("message_id"),
+        source_publish_time=pubsub_message.get("publish_time"),
+        source_bucket_name=source_bucket_name,
+    )
+    # dead-lettered messages are acked, so redeliveries must not be dead-lettered twice
+    await asyncio.to_thread(
+        mark_processed, request.app.state.dedup_store, pubsub_message.get("message_id")
+    )
+    log_dead_lettered(exc)
+
+
+def retry_batch_item(item: Any, exc: BaseException) -> BatchItemResult:
+    pubsub_message = item.get("message") if isinstance(item, dict) else None
+    return BatchItemResult(
+        message_id=pubsub_message.get("message_id") if isinstance(pubsub_message, dict) else None,
+        status=BatchItemStatus.RETRY,
+        error_desc=str(exc),
+    )
+
+
+async def process_batch_item(
+    request: Request, item: Any, ctx_fields: dict
+) -> BatchItemResult:
+    """Validates and processes one envelope of a batch push, classifying the
+    outcome the same way the exception handlers do for a single push"""
+    if isinstance(item, dict):
+        pubsub_message = item.get("message")
+        if not isinstance(pubsub_message, dict):
+            pubsub_message = {}
+    else:
+        # not an envelope at all, it is dead-lettered as it was received
+        pubsub_message = {"data": item}
+    try:
+        envelope = DecodedEnvelope(Message.model_validate(item))
+    except ValidationError as ve:
+        exc = ManualDLQError(
+            original_request={"message": pubsub_message},
+            error_desc=format_pydantic_validation_error_message(ve.errors()),
+            error_stage=ErrorEnum.MESSAGE_VALIDATION,
+        )
+    else:
+        # the task runs in its own copy of the context, so this only affects this item
+        logger_config.set_request_contexts(
+            ctx_fields=ctx_fields, original_request=envelope.original_request
+        )
+        try:
+            processed = await process_pubsub_message_once(
+                request.app.state.pipeline, envelope, request.app.state.dedup_store
+            )
+        except ManualDLQError as manual_dlq_error:
+            exc = manual_dlq_error
+        except PubsubReprocessError as reprocess_error:
+            log_reprocess_error(reprocess_error)
+            return BatchItemResult(
+                message_id=envelope.message_id,
+                status=BatchItemStatus.RETRY,
+                error_stage=reprocess_error.error_stage,
+                error_desc=str(reprocess_error.error_desc),
+            )
+        else:
+            return BatchItemResult(
+                message_id=envelope.message_id,
+                status=BatchItemStatus.ACK if processed else BatchItemStatus.DEDUPLICATED,
+            )
+
+    try:
+        await dead_letter_message(request, exc)
+    except PubsubPublishException as pb:
+        logger.info(msg=f"PubsubPublishException Error Occurred: {str(pb)}")
+        return BatchItemResult(
+            message_id=pubsub_message.get("message_id"),
+            status=BatchItemStatus.RETRY,
+            error_stage=ErrorEnum.SENDING_TO_DLQ,
+            error_desc=str(pb),
+        )
+    return BatchItemResult(
+        message_id=pubsub_message.get("message_id"),
+        status=BatchItemStatus.DEAD_LETTERED,
+        error_stage=exc.error_stage,
+        error_desc=str(exc.error_desc),
+    )
 
 
 @app.get("/health")
 def health_check():
     return {"Status": "OK"}
 
+
+@app.get("/metrics")
+def metrics(request: Request):
+    """Counters for monitoring, such as the number of requests shed by admission control,
+    the adaptive concurrency limit and retries of each dependency and cache hits"""
+    admission = request.app.state.admission
+    return {
+        "admission": admission.stats() if admission is not None else None,
+        "concurrency_limits": limiter_stats(),
+        "retries": retry_stats(),
+        "pipeline": request.app.state.pipeline.stats(),
+        "datastore_cache": entity_cache_stats(),
+        "datastore_key_loaders": key_loader_stats(),
+    }
+
 ### ### ### ### ### ### PubSub Subscriber ### ### ### ### ### ### ### ###
 @app.post("/")
-def pubsub_subscriber(request: Message, original_request: Request) -> JSONResponse:
+async def pubsub_subscriber(
+    request: Message, original_request: Request
+) -> SerialiserJSONResponse:
 
     # set request contexts
     ctx_fields = extract_trace_and_request_type(original_request=original_request)
-    original_request = request.model_dump()
-    original_request["message"]["data"] = json.loads(
-        decode_pubsub_message_data(original_request["message"]["data"], strict=False)
-    )
+    envelope = DecodedEnvelope(request)
+    original_request.state.envelope = envelope
     logger_config.set_request_contexts(
-        ctx_fields=ctx_fields, original_request=original_request
+        ctx_fields=ctx_fields, original_request=envelope.original_request
     )
+    with request_deadline(settings.retry_request_deadline_sec):
+        processed = await process_pubsub_message_once(
+            original_request.app.state.pipeline,
+            envelope,
+            original_request.app.state.dedup_store,
+        )
+    if processed:
+        message_status = "Success"
+    else:
+        message_status = BatchItemStatus.DEDUPLICATED.value
 
-    return JSONResponse(
+    return SerialiserJSONResponse(
         status_code=status.HTTP_200_OK,
         content={
-            "status": "Success",
+            "status": message_status,
             "pubsub_message_id": request.message.message_id,
             "pubsub_publish_timestamp": request.message.publish_time,
             "acknowledge_timestamp": str(pendulum.now("Europe/London")),
         },
     )
 
+
+@app.post("/batch")
+async def pubsub_batch_subscriber(
+    request: List[Any], original_request: Request
+) -> SerialiserJSONResponse:
+    """Processes an array of Pub/Sub push envelopes in one request, for replays and
+    backfills. Every envelope is validated and classified on its own, so the
+    response carries one ack/retry/dead_lettered/deduplicated outcome per message."""
+    ctx_fields = extract_trace_and_request_type(original_request=original_request)
+    semaphore = asyncio.Semaphore(settings.pubsub_batch_max_concurrency)
+
+    async def process_bounded(item: Any) -> BatchItemResult:
+        async with semaphore:
+            try:
+                return await process_batch_item(original_request, item, ctx_fields)
+            except Exception as ge:
+                # an unexpected error only sends its own message back for redelivery
+                logger.error(
+                    msg=f"Unexpected error while processing a batch message, retrying it: {ge}"
+                )
+                return retry_batch_item(item, ge)
+
+    with request_deadline(settings.retry_request_deadline_sec):
+        # every item runs to completion, none is left running after the response
+        outcomes = await asyncio.gather(
+            *(process_bounded(item) for item in request), return_exceptions=True
+        )
+    results = [
+        retry_batch_item(item, outcome) if isinstance(outcome, BaseException) else outcome
+        for item, outcome in zip(request, outcomes)
+    ]
+
+    return SerialiserJSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=BatchResponse(status="Success", results=results).model_dump(),
+    )
+
 ### ### ### ### ### ### Consumer API ### ### ### ### ### ### ### ###
 @app.post("/v1/hello_world")
-def gcp_template_response(
+async def gcp_template_response(
         request: GCPTemplateRequest,
         headers: dependencies.HeaderParams = Depends(dependencies.HeaderParams)
 ):
 
     response = build_hello_world(request.data)
 
-    return JSONResponse(
+    return SerialiserJSONResponse(
         status_code=status.HTTP_200_OK,
         content= {
             "status": "Success",
@@ -112,19 +417,21 @@ async def api_validation_exception_handler(
     logger.info(
         msg="Request Validation Error Occurred", additional_info=http_response_dict
     )
+    if request.url.path == "/batch":
+        # the body is not an array of envelopes, there is no message to dead-letter
+        return SerialiserJSONResponse(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, content=http_response_dict
+        )
     try:
         # Handling messages that needs to be sent to DLQ manually
-        pubsub_publisher = PubSubPublisher(
-            project_id=settings.gcp_project_id, topic=settings.dlq_topic
-        )
-        pubsub_publisher.publish(
-            data=json.loads(
-                decode_pubsub_message_data(
-                    exc.body["message"].get("data"), strict=False
-                )
-            ),
+        await publish_to_dlq(
+            request,
+            data=decode_dlq_message_data(exc.body["message"]),
             source_message_uuid=exc.body["message"].get("message_id"),
             source_publish_time=exc.body["message"].get("publish_time"),
+            source_bucket_name=(exc.body["message"].get("attributes") or {}).get(
+                "bucketId"
+            ),
         )
     except PubsubPublishException as pb:
         http_response_dict = ErrorResponse(
@@ -134,12 +441,12 @@ async def api_validation_exception_handler(
             msg=f"PubsubPublishException Error Occurred: {str(pb)}",
             additional_info=http_response_dict,
         )
-        return JSONResponse(
+        return SerialiserJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content=http_response_dict,
         )
 
-    return JSONResponse(
+    return SerialiserJSONResponse(
         status_code=status.HTTP_202_ACCEPTED, content=http_response_dict
     )
 
@@ -151,17 +458,7 @@ async def dead_letter_queue_exception_handler(
     """Publishing to DLQ Manually in the event the api fails to do stuff with the request payload -
     instead of retrying/failing over and over"""
     try:
-        pubsub_message = exc.original_request["message"]
-        pubsub_publisher = PubSubPublisher(
-            project_id=settings.gcp_project_id, topic=settings.dlq_topic
-        )
-        pubsub_publisher.publish(
-            data=json.loads(
-                decode_pubsub_message_data(pubsub_message["data"], strict=False)
-            ),
-            source_message_uuid=pubsub_message["message_id"],
-            source_publish_time=pubsub_message["publish_time"],
-        )
+        await dead_letter_message(request, exc)
     except PubsubPublishException as pb:
         http_response_dict = ErrorResponse(
             exception="Pubsub Publish Error", detail=str(pb)
@@ -170,29 +467,16 @@ async def dead_letter_queue_exception_handler(
             msg=f"PubsubPublishException Error Occurred: {str(pb)}",
             additional_info=http_response_dict,
         )
-        return JSONResponse(
+        return SerialiserJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content=http_response_dict,
         )
 
-    logger.info(
-        msg=f"Unable to process the file - File sent to DLQ.",
-        extra_fields=StatusLog(
-            message_id=pubsub_message["message_id"],
-            status=LogStatus.FAILURE,
-            source_bucket_name=pubsub_message["attributes"].get("bucketId", None),
-            destination_bucket_name=None,
-            error_stage=exc.error_stage,
-            error_desc=exc.error_desc,
-            response_status_code="202",
-            log_timestamp=datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-        ).model_dump(),
-    )
     http_response_dict = ErrorResponse(
         exception="ManualDLQError", detail=str(exc.error_desc)
     ).model_dump(exclude_none=True)
 
-    return JSONResponse(
+    return SerialiserJSONResponse(
         status_code=status.HTTP_202_ACCEPTED, content=http_response_dict
     )
 
@@ -202,32 +486,13 @@ async def reprocess_message_exception_handler(
     request: Request, exc: PubsubReprocessError
 ):
     """Function to handle reprocess error"""
-    logger.error(
-        msg=f"Unable to process the message due to internal server error - Message "
-        f" will be retried"
-    )
-
-    logger.info(
-        msg=f"Unable to process the message - Message will be retried",
-        extra_fields=StatusLog(
-            message_id=exc.original_request["message"]["message_id"],
-            status=LogStatus.RETRY,
-            source_bucket_name=exc.original_request["message"]["attributes"].get(
-                "bucketId", None
-            ),
-            destination_bucket_name=None,
-            error_stage=exc.error_stage,
-            error_desc=exc.error_desc,
-            response_status_code="500",
-            log_timestamp=datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-        ).model_dump(),
-    )
+    log_reprocess_error(exc)
 
     http_response_dict = ErrorResponse(
         exception="PubsubReprocessError", detail=str(exc.error_desc)
     ).model_dump(exclude_none=True)
 
-    return JSONResponse(
+    return SerialiserJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=http_response_dict
     )
 
@@ -238,7 +503,7 @@ async def validation_exception_handler(request: Request, exc: ModelValidationErr
     http_response = ErrorResponse(exception="Request Validation Error Occurred", detail=validation_exception)
     http_response_dict = http_response.dict(exclude_none=True)
     logger.info(msg=http_response_dict)
-    return JSONResponse(
+    return SerialiserJSONResponse(
         status_code=status.HTTP_400_BAD_REQUEST,
         content=http_response_dict
     )
@@ -250,7 +515,7 @@ async def validation_exception_handler(request: Request, exc: DatastoreGenericEr
     http_response = ErrorResponse(exception="Datastore Error", detail=str(exc))
     http_response_dict = http_response.dict(exclude_none=True)
     logger.info(msg=http_response_dict)
-    return JSONResponse(
+    return SerialiserJSONResponse(
         status_code=status.HTTP_400_BAD_REQUEST,
         content=http_response_dict
     )
@@ -262,7 +527,7 @@ async def validation_exception_handler(request: Request, exc: DatastoreNotFoundE
     http_response = ErrorResponse(errorCode="1001", exception="NotFound Error", detail=str(exc))
     http_response_dict = http_response.dict(exclude_none=True)
     logger.info(msg=http_response_dict)
-    return JSONResponse(
+    return SerialiserJSONResponse(
         status_code=status.HTTP_404_NOT_FOUND,
         content=http_response_dict
     )
@@ -274,7 +539,7 @@ async def validation_exception_handler(request: Request, exc: DatastoreMultiResu
     http_response = ErrorResponse(errorCode="2001", exception="Multi Search Results Error", detail=str(exc))
     http_response_dict = http_response.dict(exclude_none=True)
     logger.info(msg=http_response_dict)
-    return JSONResponse(
+    return SerialiserJSONResponse(
         status_code=status.HTTP_400_BAD_REQUEST,
         content=http_response_dict
     )
@@ -287,7 +552,7 @@ async def validation_exception_handler(request: Request, exc: InternalAPIExcepti
     http_response = ErrorResponse(exception="Internal Error Occurred", detail="Internal Error Occurred")
     http_response_dict = http_response.dict(exclude_none=True)
     logger.info(msg=http_response_dict)
-    return JSONResponse(
+    return SerialiserJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content=http_response_dict
     )
\ No newline at end of file
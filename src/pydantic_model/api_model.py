@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 from pydantic import BaseModel, Field
 
@@ -14,6 +14,8 @@ class ErrorEnum(str, Enum):
     ENCRYPTION = "ENCRYPTION_ERROR"
     INPUT_FILE_NAME = "INPUT_FILE_NAME_ERROR"
     UPLOAD_TO_GCS = "UPLOAD_TO_GCS"
+    TRANSFORM = "TRANSFORM_ERROR"
+    CHECKSUM_MISMATCH = "CHECKSUM_MISMATCH"
     SENDING_TO_DLQ = "SENDING_TO_DLQ"
 
 
@@ -76,6 +78,25 @@ class Message(BaseModel):
     message: PubSubMessage
 
 
+class BatchItemStatus(str, Enum):
+    """Outcome of a single message pushed to the batch endpoint"""
+    ACK = "ack"
+    RETRY = "retry"
+    DEAD_LETTERED = "dead_lettered"
+    DEDUPLICATED = "deduplicated"
+
+
+class BatchItemResult(BaseModel):
+    message_id: Optional[str] = None
+    status: BatchItemStatus
+    error_stage: Optional[str] = None
+    error_desc: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    status: str
+    results: List[BatchItemResult]
+
 
 class GCPTemplateResponse(BaseModel):
     response_message: Optional[str] = Field(None,
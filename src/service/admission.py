@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional
+
+from fastapi import status
+
+from configuration.env import settings
+from pydantic_model.api_model import ErrorResponse
+from service.logger import CustomLoggerAdapter
+from service.responses import SerialiserJSONResponse
+
+logger = CustomLoggerAdapter(logging.getLogger(__name__), None)
+
+
+class AdmissionPool:
+    """Bounded number of in-flight requests with a bounded, time-limited wait queue.
+
+    A request that finds max_queued requests already waiting is shed with 429, one
+    that waits longer than max_queue_wait_sec for a slot is shed with 503. Both make
+    Pub/Sub back off its push delivery rate instead of piling requests up until
+    the server timeout kills them.
+    """
+
+    def __init__(
+        self, name: str, max_inflight: int, max_queued: int, max_queue_wait_sec: float
+    ) -> None:
+        self.name = name
+        self._max_inflight = max_inflight
+        self._max_queued = max_queued
+        self._max_queue_wait_sec = max_queue_wait_sec
+        self._slots = asyncio.Semaphore(max_inflight)
+        self.inflight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_queue_timeout = 0
+        self.max_queue_wait_sec_seen = 0.0
+
+    async def acquire(self) -> Optional[int]:
+        """Waits for a slot, returns None once admitted or the status code to shed with"""
+        if self._slots.locked() and self.queued >= self._max_queued:
+            self.shed_queue_full += 1
+            return status.HTTP_429_TOO_MANY_REQUESTS
+
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self._max_queue_wait_sec)
+        except asyncio.TimeoutError:
+            self.shed_queue_timeout += 1
+            return status.HTTP_503_SERVICE_UNAVAILABLE
+        finally:
+            self.queued -= 1
+            self.max_queue_wait_sec_seen = max(
+                self.max_queue_wait_sec_seen, time.monotonic() - start
+            )
+
+        self.inflight += 1
+        self.admitted += 1
+        return None
+
+    def release(self) -> None:
+        self.inflight -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_inflight": self._max_inflight,
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_queue_timeout": self.shed_queue_timeout,
+            "max_queue_wait_sec": round(self.max_queue_wait_sec_seen, 3),
+        }
+
+
+class AdmissionController:
+    """Maps request paths to their admission pools, paths without a pool (such as
+    /health) are never shed"""
+
+    def __init__(self) -> None:
+        self._pools_by_path: Dict[str, AdmissionPool] = {}
+        self._pools: Dict[str, AdmissionPool] = {}
+
+    def add_pool(self, pool: AdmissionPool, paths: Iterable[str]) -> None:
+        self._pools[pool.name] = pool
+        for path in paths:
+            self._pools_by_path[path] = pool
+
+    def pool_for(self, path: str) -> Optional[AdmissionPool]:
+        return self._pools_by_path.get(path)
+
+    def stats(self) -> dict:
+        return {name: pool.stats() for name, pool in self._pools.items()}
+
+
+def create_admission_controller(
+    push_paths: Iterable[str], consumer_paths: Iterable[str]
+) -> Optional[AdmissionController]:
+    """Builds the controller configured in settings, None when admission control is
+    disabled. Pushes and consumer requests get separate pools, so a push backlog
+    never takes the capacity reserved for consumers."""
+    if not settings.admission_enabled:
+        return None
+    controller = AdmissionController()
+    controller.add_pool(
+        AdmissionPool(
+            name="pubsub_push",
+            max_inflight=settings.admission_max_inflight_pushes,
+            max_queued=settings.admission_max_queued_pushes,
+            max_queue_wait_sec=settings.admission_max_queue_wait_sec,
+        ),
+        paths=push_paths,
+    )
+    controller.add_pool(
+        AdmissionPool(
+            name="consumer",
+            max_inflight=settings.admission_reserved_consumer_inflight,
+            max_queued=settings.admission_max_queued_consumer,
+            max_queue_wait_sec=settings.admission_max_queue_wait_sec,
+        ),
+        paths=consumer_paths,
+    )
+    return controller
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware admitting requests before routing, through the controller
+    kept on app.state.admission (requests pass straight through when it is None)"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        pool = None
+        if scope["type"] == "http":
+            controller = getattr(scope["app"].state, "admission", None)
+            if controller is not None:
+                pool = controller.pool_for(scope["path"])
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        shed_status_code = await pool.acquire()
+        if shed_status_code is not None:
+            logger.warning(
+                msg=f"Shedding request to {scope['path']} with {shed_status_code}, "
+                f"admission pool {pool.name} is overloaded"
+            )
+            response = SerialiserJSONResponse(
+                status_code=shed_status_code,
+                content=ErrorResponse(
+                    exception="Overloaded",
+                    detail=f"Too many requests in flight for {pool.name}, retry later",
+                ).model_dump(exclude_none=True),
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release()
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from configuration.env import settings
+
+DEDUP_BACKEND_MEMORY = "memory"
+DEDUP_BACKEND_DATASTORE = "datastore"
+
+
+class InMemoryDedupStore:
+    """Per-process LRU of processed Pub/Sub message ids.
+
+    Entries expire ttl_sec after they were marked and the least recently used ones
+    are evicted once max_entries is reached, so memory stays bounded.
+    """
+
+    def __init__(self, max_entries: int, ttl_sec: float, clock=time.monotonic) -> None:
+        self._max_entries = max_entries
+        self._ttl_sec = ttl_sec
+        self._clock = clock
+        self._expiries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_processed(self, message_id: str) -> bool:
+        with self._lock:
+            expires_at = self._expiries.get(message_id)
+            if expires_at is None:
+                return False
+            if expires_at <= self._clock():
+                del self._expiries[message_id]
+                return False
+            self._expiries.move_to_end(message_id)
+            return True
+
+    def mark_processed(self, message_id: str) -> None:
+        with self._lock:
+            self._expiries[message_id] = self._clock() + self._ttl_sec
+            self._expiries.move_to_end(message_id)
+            while len(self._expiries) > self._max_entries:
+                self._expiries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._expiries)
+
+
+def create_dedup_store():
+    """Builds the dedup store configured in settings, None when dedup is disabled"""
+    if not settings.dedup_enabled:
+        return None
+    if settings.dedup_backend == DEDUP_BACKEND_MEMORY:
+        return InMemoryDedupStore(
+            max_entries=settings.dedup_max_entries, ttl_sec=settings.dedup_ttl_sec
+        )
+    if settings.dedup_backend == DEDUP_BACKEND_DATASTORE:
+        # only import the Datastore client when the shared backend is selected
+        from gcp.datastore import DatastoreDedupStore
+
+        return DatastoreDedupStore(
+            kind=settings.dedup_datastore_kind, ttl_sec=settings.dedup_ttl_sec
+        )
+    raise ValueError(f"Unsupported dedup backend: {settings.dedup_backend}")
+
+
+def is_duplicate(dedup_store, message_id: Optional[str]) -> bool:
+    return dedup_store is not None and message_id is not None and dedup_store.is_processed(message_id)
+
+
+def mark_processed(dedup_store, message_id: Optional[str]) -> None:
+    if dedup_store is not None and message_id is not None:
+        dedup_store.mark_processed(message_id)
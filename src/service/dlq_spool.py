@@ -0,0 +1,230 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+from typing import List, Optional
+
+from error.custom_exceptions import PubsubPublishException
+from gcp.pubsub import PubSubPublisher
+from helper import serialiser
+from service.logger import CustomLoggerAdapter
+
+logger = CustomLoggerAdapter(logging.getLogger(__name__), None)
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+CURSOR_SUFFIX = ".ack"
+LOCK_FILE = ".owner.lock"
+# the keyword arguments of PubSubPublisher.publish every record holds
+RECORD_FIELDS = {"data", "source_message_uuid", "source_publish_time"}
+
+
+class DlqSpool:
+    """Append-only on-disk log of DLQ messages that could not be published.
+
+    Records are appended as JSON lines to numbered segment files. A segment is
+    sealed once it reaches segment_max_bytes (or when a drain starts) and is only
+    removed after every record in it has been published. Progress through a
+    segment is kept in a cursor file so a failed drain resumes where it stopped.
+
+    Every process spools into its own subdirectory of spool_dir and holds an
+    exclusive lock on it while it runs, so gunicorn workers sharing spool_dir never
+    touch each other's segments. On startup the segments of directories whose
+    owner has exited are moved into this process's directory to be drained.
+    """
+
+    def __init__(self, spool_dir: str, segment_max_bytes: int) -> None:
+        self._root_dir = spool_dir
+        self._spool_dir = os.path.join(spool_dir, str(os.getpid()))
+        self._segment_max_bytes = segment_max_bytes
+        self._lock = threading.Lock()
+        self._active_file = None
+        self._active_path: Optional[str] = None
+        os.makedirs(self._spool_dir, exist_ok=True)
+        self._owner_lock = open(os.path.join(self._spool_dir, LOCK_FILE), "a")
+        # a leftover directory of an earlier process with the same pid is taken over
+        fcntl.flock(self._owner_lock, fcntl.LOCK_EX)
+        existing = self._segment_numbers()
+        self._next_segment = existing[-1] + 1 if existing else 0
+        self._adopt_orphaned_segments()
+
+    def _adopt_orphaned_segments(self) -> None:
+        for entry in sorted(os.listdir(self._root_dir)):
+            directory = os.path.join(self._root_dir, entry)
+            if directory == self._spool_dir or not os.path.isdir(directory):
+                continue
+            try:
+                lock_fd = os.open(os.path.join(directory, LOCK_FILE), os.O_RDWR)
+            except FileNotFoundError:
+                # not a spool directory, or another process adopted it already
+                continue
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # the owner is still running
+                os.close(lock_fd)
+                continue
+            try:
+                self._move_segments_from(directory)
+                os.remove(os.path.join(directory, LOCK_FILE))
+                os.rmdir(directory)
+            finally:
+                os.close(lock_fd)
+
+    def _move_segments_from(self, directory: str) -> None:
+        names = sorted(
+            name
+            for name in os.listdir(directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        for name in names:
+            target = self._segment_path(self._next_segment)
+            self._next_segment += 1
+            cursor = os.path.join(directory, name + CURSOR_SUFFIX)
+            if os.path.exists(cursor):
+                os.replace(cursor, target + CURSOR_SUFFIX)
+            os.replace(os.path.join(directory, name), target)
+        if names:
+            logger.info(f"Adopted {len(names)} DLQ spool segment(s) from {directory}")
+
+    def _segment_numbers(self) -> List[int]:
+        numbers = []
+        for file_name in os.listdir(self._spool_dir):
+            if file_name.startswith(SEGMENT_PREFIX) and file_name.endswith(SEGMENT_SUFFIX):
+                numbers.append(int(file_name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(numbers)
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(
+            self._spool_dir, f"{SEGMENT_PREFIX}{number:010d}{SEGMENT_SUFFIX}"
+        )
+
+    def _open_segment(self) -> None:
+        self._active_path = self._segment_path(self._next_segment)
+        self._active_file = open(self._active_path, "ab")
+        self._next_segment += 1
+
+    def _seal_active_segment(self) -> None:
+        if self._active_file is not None:
+            self._active_file.close()
+            self._active_file = None
+            self._active_path = None
+
+    def append(self, data, source_message_uuid, source_publish_time) -> None:
+        """Durably appends a DLQ message, the call returns once the record is fsynced"""
+        record = serialiser.dumps_bytes(
+            {
+                "data": data,
+                "source_message_uuid": source_message_uuid,
+                "source_publish_time": source_publish_time,
+            }
+        )
+        with self._lock:
+            if self._active_file is None:
+                self._open_segment()
+            self._active_file.write(record + b"\n")
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+            if self._active_file.tell() >= self._segment_max_bytes:
+                self._seal_active_segment()
+        logger.info(f"Message {source_message_uuid} spooled for a later DLQ publish")
+
+    def sealed_segments(self) -> List[str]:
+        with self._lock:
+            return [
+                self._segment_path(number)
+                for number in self._segment_numbers()
+                if self._segment_path(number) != self._active_path
+            ]
+
+    @property
+    def pending_segments(self) -> int:
+        return len(self._segment_numbers())
+
+    @staticmethod
+    def _read_cursor(segment_path: str) -> int:
+        try:
+            with open(segment_path + CURSOR_SUFFIX, "r") as cursor_file:
+                return int(cursor_file.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _write_cursor(segment_path: str, acknowledged: int) -> None:
+        with open(segment_path + CURSOR_SUFFIX, "w") as cursor_file:
+            cursor_file.write(str(acknowledged))
+
+    def drain(self, publisher: PubSubPublisher) -> int:
+        """Publishes spooled messages oldest first and removes acknowledged segments.
+
+        Returns the number of messages published, a PubsubPublishException from the
+        publisher stops the drain and leaves the remaining records in place.
+        """
+        with self._lock:
+            self._seal_active_segment()
+
+        published = 0
+        for segment_path in self.sealed_segments():
+            acknowledged = self._read_cursor(segment_path)
+            with open(segment_path, "rb") as segment_file:
+                for index, line in enumerate(segment_file):
+                    if index < acknowledged:
+                        continue
+                    if not line.endswith(b"\n"):
+                        # torn write from a crash mid-append, the message was never accepted
+                        logger.error(f"Skipping incomplete record in {segment_path}")
+                        break
+                    try:
+                        record = serialiser.loads(line)
+                    except json.decoder.JSONDecodeError as jse:
+                        logger.error(f"Skipping corrupt record in {segment_path}: {jse}")
+                    else:
+                        if not isinstance(record, dict) or record.keys() != RECORD_FIELDS:
+                            logger.error(f"Skipping malformed record in {segment_path}")
+                        else:
+                            publisher.publish(**record)
+                            published += 1
+                    acknowledged = index + 1
+                    self._write_cursor(segment_path, acknowledged)
+
+            os.remove(segment_path)
+            if os.path.exists(segment_path + CURSOR_SUFFIX):
+                os.remove(segment_path + CURSOR_SUFFIX)
+
+        if published:
+            logger.info(f"Drained {published} spooled message(s) to the DLQ topic")
+        return published
+
+    def close(self) -> None:
+        """Seals the active segment and releases the directory, segments left in it
+        are adopted by the next process to start"""
+        with self._lock:
+            self._seal_active_segment()
+            if not self._owner_lock.closed:
+                self._owner_lock.close()
+
+
+async def drain_spool_forever(
+    spool: DlqSpool,
+    publisher: PubSubPublisher,
+    interval_sec: float,
+    max_backoff_sec: float,
+) -> None:
+    """Background task draining the spool, backing off exponentially while publishing fails"""
+    delay = interval_sec
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await asyncio.to_thread(spool.drain, publisher)
+            delay = interval_sec
+        except (PubsubPublishException, OSError) as pb:
+            delay = min(delay * 2, max_backoff_sec)
+            logger.error(f"Failed to drain DLQ spool, retrying in {delay} seconds: {pb}")
+        except Exception as ge:
+            # the drainer must outlive unexpected errors, or the spool is never drained again
+            delay = min(delay * 2, max_backoff_sec)
+            logger.error(
+                f"Unexpected error while draining DLQ spool, retrying in {delay} seconds: {ge}"
+            )
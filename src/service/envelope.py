@@ -0,0 +1,91 @@
+from functools import cached_property
+from typing import Any, Optional
+
+from error.custom_exceptions import ManualDLQError, MessageDecodeError
+from helper import serialiser
+from helper.compression import CONTENT_ENCODING_ATTRIBUTE
+from helper.utils import decode_pubsub_message_bytes, validate_gcs_event
+from pydantic_model.api_model import ErrorEnum, GcsToPubsubEvent, Message
+from service.logger import CustomLoggerAdapter, configure_logger
+
+logger = CustomLoggerAdapter(configure_logger(), None)
+
+
+class DecodedEnvelope:
+    """Request-scoped view of a Pub/Sub push envelope.
+
+    The message data is base64 decoded and parsed once, on first access, and the
+    resulting object is shared by the logging context, the validators and the DLQ
+    handlers instead of each of them decoding their own copy. Data that can not be
+    decoded or is not a valid GCS notification raises ManualDLQError, so the message
+    is dead-lettered rather than redelivered.
+    """
+
+    def __init__(self, request: Message) -> None:
+        self.message = request.message
+
+    @property
+    def message_id(self) -> str:
+        return self.message.message_id
+
+    @property
+    def publish_time(self) -> str:
+        return self.message.publish_time
+
+    @property
+    def attributes(self) -> dict:
+        return self.message.attributes
+
+    @property
+    def content_encoding(self) -> Optional[str]:
+        return self.message.attributes.get(CONTENT_ENCODING_ATTRIBUTE)
+
+    @cached_property
+    def data(self) -> Any:
+        if isinstance(self.message.data, dict):
+            return self.message.data
+        try:
+            # parse straight from the decoded bytes, no intermediate str copy
+            return serialiser.loads(
+                decode_pubsub_message_bytes(
+                    self.message.data, content_encoding=self.content_encoding
+                )
+            )
+        except (MessageDecodeError, ValueError) as e:
+            logger.error(msg=dict(exception=str(e)))
+            raise ManualDLQError(
+                original_request=self._as_received(),
+                error_desc=str(e),
+                error_stage=ErrorEnum.MESSAGE_VALIDATION,
+            )
+
+    @cached_property
+    def gcs_event(self) -> GcsToPubsubEvent:
+        """The data validated as a GCS notification, raises ManualDLQError if invalid"""
+        return validate_gcs_event(self.data, original_request=self.original_request)
+
+    def _as_dict(self, data) -> dict:
+        return {
+            "message": {
+                "data": data,
+                "attributes": self.attributes,
+                "message_id": self.message_id,
+                "publish_time": self.publish_time,
+            }
+        }
+
+    def _as_received(self) -> dict:
+        data = self.message.data
+        if isinstance(data, bytes):
+            data = data.decode("ascii", errors="replace")
+        return self._as_dict(data)
+
+    @cached_property
+    def original_request(self) -> dict:
+        """The envelope as a dict holding the decoded data, as expected by the logging
+        context and by ManualDLQError/PubsubReprocessError. Holds the data as received
+        when it can not be decoded."""
+        try:
+            return self._as_dict(self.data)
+        except ManualDLQError:
+            return self._as_received()
@@ -1,4 +1,3 @@
-import json
 import logging
 import logging.config
 
@@ -9,6 +8,7 @@ from fastapi import Request
 
 from configuration.env import settings
 from configuration.logger_config import logger_config
+from helper import serialiser
 
 
 def configure_logger():
@@ -53,5 +53,5 @@ class CustomLoggerAdapter(logging.LoggerAdapter):
             context=self.ctx.get(),
             **kwargs.get("additional_info", {})
         )
-        return json.dumps(entry), {}
+        return serialiser.dumps(entry), {}
 
@@ -0,0 +1,250 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Callable
+
+from configuration.env import settings
+from configuration.logger_config import logger_config
+from error.custom_exceptions import ManualDLQError, PubsubReprocessError
+from gcp.gcs import GoogleCloudStorage
+from gcp.gcs_cache import create_gcs_object_cache
+from helper.compression import GZIP, compress_payload
+from pydantic_model.api_model import ErrorEnum, GcsToPubsubEvent, LogStatus, StatusLog
+from service.dedup import is_duplicate, mark_processed
+from service.envelope import DecodedEnvelope
+from service.logger import CustomLoggerAdapter, configure_logger
+
+logger = CustomLoggerAdapter(configure_logger(), None)
+
+TRANSFORM_IDENTITY = "identity"
+TRANSFORM_GZIP = "gzip"
+
+
+def identity_transform(data: bytes) -> bytes:
+    return data
+
+
+def gzip_transform(data: bytes) -> bytes:
+    # gzip members written one after another read back as one gzip file
+    return compress_payload(data, GZIP)
+
+
+TRANSFORMS = {TRANSFORM_IDENTITY: identity_transform, TRANSFORM_GZIP: gzip_transform}
+# transforms whose output for each chunk of an object, joined, is a valid output for
+# the whole object
+CHUNKED_TRANSFORMS = {TRANSFORM_GZIP}
+
+
+class GcsEventPipeline:
+    """decode -> validate -> GCS read -> transform -> GCS upload for one GCS event.
+
+    Every blocking stage runs on its own executor, sized by the stage's concurrency
+    limit, so requests waiting on a busy stage only hold a coroutine and never a
+    thread from the server's threadpool. With the identity transform the object is
+    copied server-side on the upload executor instead, and its bytes never reach
+    the instance. With a chunked transform the object is streamed from the source to
+    the target on the upload executor a chunk at a time, so memory does not grow with
+    the object's size.
+    """
+
+    def __init__(
+        self,
+        storage: GoogleCloudStorage,
+        target_bucket: str,
+        transform: Callable[[bytes], bytes] = identity_transform,
+        read_concurrency: int = 32,
+        transform_concurrency: int = 4,
+        upload_concurrency: int = 32,
+        chunked_transform: bool = False,
+    ) -> None:
+        self._storage = storage
+        self._target_bucket = target_bucket
+        self._transform = transform
+        self._server_side_copy = transform is identity_transform
+        self._chunked_transform = chunked_transform
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=read_concurrency, thread_name_prefix="pipeline-read"
+        )
+        self._transform_executor = ThreadPoolExecutor(
+            max_workers=transform_concurrency, thread_name_prefix="pipeline-transform"
+        )
+        self._upload_executor = ThreadPoolExecutor(
+            max_workers=upload_concurrency, thread_name_prefix="pipeline-upload"
+        )
+
+    @staticmethod
+    async def _run_stage(executor: ThreadPoolExecutor, func, *args):
+        # run_in_executor does not copy the context, the stages need the logging context
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, partial(context.run, func, *args)
+        )
+
+    def _apply_transform(self, data: bytes) -> bytes:
+        try:
+            return self._transform(data)
+        except Exception as e:
+            error_value = f"Failed to transform the file: {e}"
+            logger.error(msg=error_value)
+            raise ManualDLQError(
+                original_request=logger_config.context.get().get("original_request"),
+                error_desc=error_value,
+                error_stage=ErrorEnum.TRANSFORM,
+            )
+
+    def _read(self, gcs_event: GcsToPubsubEvent) -> bytes:
+        return self._storage.read_gcs_file_to_bytes(
+            gcs_event.bucket,
+            gcs_event.name,
+            size=gcs_event.size,
+            crc32c=gcs_event.crc32c,
+            md5_hash=gcs_event.md5Hash,
+            generation=gcs_event.generation,
+        )
+
+    def _stream(self, gcs_event: GcsToPubsubEvent) -> None:
+        chunks = self._storage.iter_gcs_file_chunks(
+            gcs_event.bucket,
+            gcs_event.name,
+            crc32c=gcs_event.crc32c,
+            md5_hash=gcs_event.md5Hash,
+            generation=gcs_event.generation,
+        )
+        self._storage.upload_to_gcs(
+            self._target_bucket,
+            gcs_event.name,
+            map(self._apply_transform, chunks),
+            content_type=gcs_event.contentType,
+        )
+
+    def _copy(self, gcs_event: GcsToPubsubEvent) -> None:
+        self._storage.copy_gcs_file(
+            gcs_event.bucket,
+            gcs_event.name,
+            self._target_bucket,
+            gcs_event.name,
+            generation=gcs_event.generation,
+        )
+
+    def _upload(self, target_blob_name: str, data: bytes, content_type=None) -> None:
+        self._storage.upload_to_gcs(
+            self._target_bucket, target_blob_name, data, content_type=content_type
+        )
+
+    async def process(self, envelope: DecodedEnvelope) -> None:
+        """Raises ManualDLQError for messages that should be dead-lettered and
+        PubsubReprocessError for messages that should be retried"""
+        # validate the GCS notification, invalid events are sent to the DLQ
+        gcs_event = envelope.gcs_event
+        if self._server_side_copy:
+            await self._run_stage(self._upload_executor, self._copy, gcs_event)
+            return
+        if self._chunked_transform:
+            await self._run_stage(self._upload_executor, self._stream, gcs_event)
+            return
+        data = await self._run_stage(
+            self._read_executor,
+            self._read,
+            gcs_event,
+        )
+        transformed = await self._run_stage(
+            self._transform_executor, self._apply_transform, data
+        )
+        await self._run_stage(
+            self._upload_executor,
+            self._upload,
+            gcs_event.name,
+            transformed,
+            gcs_event.contentType,
+        )
+
+    def stats(self) -> dict:
+        cache = self._storage.cache
+        return {"gcs_cache": cache.stats() if cache is not None else None}
+
+    def close(self) -> None:
+        for executor in (
+            self._read_executor,
+            self._transform_executor,
+            self._upload_executor,
+        ):
+            executor.shutdown(wait=True)
+        if self._storage.cache is not None:
+            self._storage.cache.close()
+
+
+def create_gcs_event_pipeline() -> GcsEventPipeline:
+    """Builds the pipeline configured in settings"""
+    if settings.pipeline_transform not in TRANSFORMS:
+        raise ValueError(f"Unsupported pipeline transform: {settings.pipeline_transform}")
+    return GcsEventPipeline(
+        storage=GoogleCloudStorage(
+            project_id=settings.gcp_project_id, cache=create_gcs_object_cache()
+        ),
+        target_bucket=settings.target_bucket,
+        transform=TRANSFORMS[settings.pipeline_transform],
+        read_concurrency=settings.pipeline_read_concurrency,
+        transform_concurrency=settings.pipeline_transform_concurrency,
+        upload_concurrency=settings.pipeline_upload_concurrency,
+        chunked_transform=settings.pipeline_transform in CHUNKED_TRANSFORMS,
+    )
+
+
+async def process_pubsub_message_once(
+    pipeline: GcsEventPipeline, envelope: DecodedEnvelope, dedup_store
+) -> bool:
+    """Runs the pipeline unless dedup_store has already seen the message id.
+
+    Returns False for redeliveries of processed messages, which should be acked
+    without doing the work again.
+    """
+    if await asyncio.to_thread(is_duplicate, dedup_store, envelope.message_id):
+        logger.info(msg=f"Message {envelope.message_id} was already processed - acknowledging")
+        return False
+    await pipeline.process(envelope)
+    await asyncio.to_thread(mark_processed, dedup_store, envelope.message_id)
+    return True
+
+
+def log_dead_lettered(exc: ManualDLQError) -> None:
+    pubsub_message = exc.original_request["message"]
+    logger.info(
+        msg=f"Unable to process the file - File sent to DLQ.",
+        extra_fields=StatusLog(
+            message_id=pubsub_message.get("message_id"),
+            status=LogStatus.FAILURE,
+            source_bucket_name=(pubsub_message.get("attributes") or {}).get(
+                "bucketId", None
+            ),
+            destination_bucket_name=None,
+            error_stage=exc.error_stage,
+            error_desc=exc.error_desc,
+            response_status_code="202",
+            log_timestamp=datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        ).model_dump(),
+    )
+
+
+def log_reprocess_error(exc: PubsubReprocessError) -> None:
+    logger.error(
+        msg=f"Unable to process the message due to internal server error - Message "
+        f" will be retried"
+    )
+
+    logger.info(
+        msg=f"Unable to process the message - Message will be retried",
+        extra_fields=StatusLog(
+            message_id=exc.original_request["message"]["message_id"],
+            status=LogStatus.RETRY,
+            source_bucket_name=exc.original_request["message"]["attributes"].get(
+                "bucketId", None
+            ),
+            destination_bucket_name=None,
+            error_stage=exc.error_stage,
+            error_desc=exc.error_desc,
+            response_status_code="500",
+            log_timestamp=datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        ).model_dump(),
+    )
@@ -0,0 +1,12 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from helper import serialiser
+
+
+class SerialiserJSONResponse(JSONResponse):
+    """JSONResponse rendered through the shared serialiser instead of the stdlib encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return serialiser.dumps_bytes(content)
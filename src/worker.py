@@ -0,0 +1,197 @@
+"""Pull-mode entry point, an alternative to Pub/Sub push into main.pubsub_subscriber.
+
+Messages are leased from settings.pull_subscription through a streaming pull with
+flow control and run through the same processing pipeline as the push endpoints.
+Successful, dead-lettered and already processed messages are acked, messages raising
+PubsubReprocessError (or whose DLQ publish fails) are nacked for redelivery.
+
+    python worker.py
+"""
+import asyncio
+import base64
+import json
+import signal
+import threading
+from concurrent import futures
+from functools import partial
+
+from google.cloud.pubsub_v1.subscriber.message import Message as PulledMessage
+from pydantic import ValidationError
+
+from configuration.env import settings
+from configuration.logger_config import logger_config
+from error.custom_exceptions import (
+    ManualDLQError,
+    MessageDecodeError,
+    PubsubPublishException,
+    PubsubReprocessError,
+)
+from gcp.pubsub import PubSubPublisher, PubSubPublisherPool, get_dlq_batch_settings
+from gcp.subscriber import PubSubPullSubscriber
+from helper.utils import decode_dlq_message_data
+from pydantic_model.api_model import ErrorEnum, Message, PubSubMessage
+from service.dedup import create_dedup_store, mark_processed
+from service.envelope import DecodedEnvelope
+from service.logger import CustomLoggerAdapter, configure_logger
+from service.pipeline import (
+    GcsEventPipeline,
+    create_gcs_event_pipeline,
+    log_dead_lettered,
+    log_reprocess_error,
+    process_pubsub_message_once,
+)
+
+logger = CustomLoggerAdapter(configure_logger(), None)
+
+PULL_REQUEST_TYPE = "pull"
+
+# raised by messages that can not be decoded into an envelope, which are acked and
+# dead-lettered rather than redelivered forever
+DECODE_ERRORS = (json.JSONDecodeError, MessageDecodeError, TypeError, ValidationError)
+
+
+def build_envelope(message: PulledMessage) -> DecodedEnvelope:
+    """Wraps a pulled message in the same envelope a push request is decoded into"""
+    return DecodedEnvelope(
+        Message(
+            message=PubSubMessage(
+                data=base64.b64encode(message.data),
+                attributes=dict(message.attributes),
+                message_id=message.message_id,
+                publish_time=message.publish_time.isoformat(),
+            )
+        )
+    )
+
+
+def received_request(message: PulledMessage) -> dict:
+    """The message as received, for dead-lettering messages without an envelope"""
+    return {
+        "message": {
+            "data": base64.b64encode(message.data).decode(),
+            "attributes": dict(message.attributes),
+            "message_id": message.message_id,
+            "publish_time": message.publish_time.isoformat(),
+        }
+    }
+
+
+def dead_letter_message(
+    dlq_publisher: PubSubPublisher, exc: ManualDLQError, dedup_store=None
+) -> None:
+    """Publishes the message behind a ManualDLQError to the DLQ, raises
+    PubsubPublishException when it could not be published"""
+    pubsub_message = exc.original_request["message"]
+    dlq_publisher.publish(
+        data=decode_dlq_message_data(pubsub_message),
+        source_message_uuid=pubsub_message.get("message_id"),
+        source_publish_time=pubsub_message.get("publish_time"),
+    )
+    mark_processed(dedup_store, pubsub_message.get("message_id"))
+    log_dead_lettered(exc)
+
+
+async def process_envelope(
+    pipeline: GcsEventPipeline, envelope: DecodedEnvelope, dedup_store
+) -> bool:
+    # the coroutine runs in the loop thread, so it sets its own logging context
+    logger_config.set_request_contexts(
+        ctx_fields={"requestType": PULL_REQUEST_TYPE},
+        original_request=envelope.original_request,
+    )
+    return await process_pubsub_message_once(pipeline, envelope, dedup_store)
+
+
+def decode_message(message: PulledMessage) -> DecodedEnvelope:
+    """Builds the message's envelope and sets the logging context for it, a message
+    that can not be decoded raises ManualDLQError"""
+    try:
+        envelope = build_envelope(message)
+        logger_config.set_request_contexts(
+            ctx_fields={"requestType": PULL_REQUEST_TYPE},
+            original_request=envelope.original_request,
+        )
+    except DECODE_ERRORS as exc:
+        logger.error(msg=f"Unable to decode the message: {exc}")
+        raise ManualDLQError(
+            original_request=received_request(message),
+            error_desc=str(exc),
+            error_stage=ErrorEnum.MESSAGE_VALIDATION,
+        ) from exc
+    return envelope
+
+
+def handle_message(
+    message: PulledMessage,
+    pipeline: GcsEventPipeline,
+    loop: asyncio.AbstractEventLoop,
+    dlq_publisher: PubSubPublisher,
+    dedup_store=None,
+) -> None:
+    """Streaming pull callback, runs the pipeline on the worker's event loop and acks
+    or nacks the message based on the outcome"""
+    try:
+        envelope = decode_message(message)
+        asyncio.run_coroutine_threadsafe(
+            process_envelope(pipeline, envelope, dedup_store), loop
+        ).result()
+    except ManualDLQError as exc:
+        try:
+            dead_letter_message(dlq_publisher, exc, dedup_store)
+        except PubsubPublishException as pb:
+            logger.error(msg=f"Unable to send the message to DLQ, nacking: {str(pb)}")
+            message.nack()
+            return
+    except PubsubReprocessError as exc:
+        log_reprocess_error(exc)
+        message.nack()
+        return
+    except Exception as ge:
+        logger.error(msg=f"Unexpected error while processing the message, nacking: {ge}")
+        message.nack()
+        return
+    message.ack()
+
+
+def main() -> None:
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, name="pipeline-loop", daemon=True)
+    loop_thread.start()
+    pipeline = create_gcs_event_pipeline()
+    publisher_pool = PubSubPublisherPool(batch_settings=get_dlq_batch_settings())
+    dlq_publisher = publisher_pool.get(
+        project_id=settings.gcp_project_id, topic=settings.dlq_topic
+    )
+    subscriber = PubSubPullSubscriber(
+        project_id=settings.gcp_project_id,
+        subscription=settings.pull_subscription,
+        max_messages=settings.pull_max_messages,
+        max_bytes=settings.pull_max_bytes,
+        max_workers=settings.pull_max_workers,
+    )
+    streaming_pull_future = subscriber.subscribe(
+        partial(
+            handle_message,
+            pipeline=pipeline,
+            loop=loop,
+            dlq_publisher=dlq_publisher,
+            dedup_store=create_dedup_store(),
+        )
+    )
+    # Cloud Run and docker stop send SIGTERM, stop pulling and let callbacks finish
+    signal.signal(signal.SIGTERM, lambda *_: streaming_pull_future.cancel())
+    try:
+        streaming_pull_future.result()
+    except (futures.CancelledError, KeyboardInterrupt):
+        pass
+    finally:
+        subscriber.close()
+        pipeline.close()
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+        loop.close()
+        publisher_pool.close(timeout=settings.dlq_flush_timeout_sec)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import uuid
+from unittest.mock import patch
+
+from google.cloud import datastore
+
+from gcp.datastore import get_entity
+from gcp.datastore_cache import EntityCache
+
+CACHE_KIND = "EntityCacheTest"
+
+
+def test_get_entity_serves_cached_results(mock_datastore):
+    customer_id = str(uuid.uuid4())
+    entity = datastore.Entity(key=mock_datastore.key(CACHE_KIND, customer_id))
+    entity.update({"customer_id": customer_id, "name": "John Doe"})
+    mock_datastore.put(entity)
+    cache = EntityCache(max_entries=10, ttl_sec=60, negative_ttl_sec=60)
+
+    with patch("gcp.datastore.get_entity_cache", return_value=cache):
+        assert get_entity(CACHE_KIND, {"customer_id": customer_id})[0]["name"] == "John Doe"
+        mock_datastore.delete(entity.key)
+
+        # served from the cache until it is invalidated
+        assert get_entity(CACHE_KIND, {"customer_id": customer_id})[0]["name"] == "John Doe"
+        cache.invalidate(CACHE_KIND)
+        assert get_entity(CACHE_KIND, {"customer_id": customer_id}) == []
+
+        # the empty result is cached as well
+        mock_datastore.put(entity)
+        assert get_entity(CACHE_KIND, {"customer_id": customer_id}) == []
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["negative_hits"] == 1
+    mock_datastore.delete(entity.key)
@@ -0,0 +1,29 @@
+import uuid
+
+from gcp.datastore import DatastoreDedupStore
+
+DEDUP_KIND = "ProcessedPubsubMessageTest"
+
+
+def test_datastore_dedup_store(mock_datastore):
+    store = DatastoreDedupStore(kind=DEDUP_KIND, ttl_sec=60, client=mock_datastore)
+    message_id = str(uuid.uuid4())
+
+    assert not store.is_processed(message_id)
+    store.mark_processed(message_id)
+
+    # a second store stands in for another instance sharing the same Datastore
+    other_instance = DatastoreDedupStore(kind=DEDUP_KIND, ttl_sec=60, client=mock_datastore)
+    assert other_instance.is_processed(message_id)
+
+    mock_datastore.delete(mock_datastore.key(DEDUP_KIND, message_id))
+
+
+def test_datastore_dedup_store_expired_entry(mock_datastore):
+    store = DatastoreDedupStore(kind=DEDUP_KIND, ttl_sec=-1, client=mock_datastore)
+    message_id = str(uuid.uuid4())
+
+    store.mark_processed(message_id)
+
+    assert not store.is_processed(message_id)
+    mock_datastore.delete(mock_datastore.key(DEDUP_KIND, message_id))
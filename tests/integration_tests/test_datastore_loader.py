@@ -0,0 +1,31 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import datastore
+
+from gcp.datastore import get_entities_by_keys, get_entity_by_key
+
+LOADER_KIND = "KeyBatchLoaderTest"
+
+
+def test_key_lookups_are_batched(mock_datastore):
+    names = [str(uuid.uuid4()) for _ in range(5)]
+    entities = []
+    for name in names:
+        entity = datastore.Entity(key=mock_datastore.key(LOADER_KIND, name))
+        entity["name"] = name
+        entities.append(entity)
+    mock_datastore.put_multi(entities)
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        loaded = list(executor.map(lambda name: get_entity_by_key(LOADER_KIND, name), names))
+    assert [entity["name"] for entity in loaded] == names
+
+    found = get_entities_by_keys(LOADER_KIND, [names[0], "missing", names[1]])
+    assert [entity["name"] if entity is not None else None for entity in found] == [
+        names[0],
+        None,
+        names[1],
+    ]
+
+    mock_datastore.delete_multi([entity.key for entity in entities])
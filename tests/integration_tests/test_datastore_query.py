@@ -0,0 +1,30 @@
+import uuid
+
+from google.cloud import datastore
+
+from gcp.datastore import iter_entities
+
+QUERY_KIND = "QueryIteratorTest"
+
+
+def test_iter_entities_pages_through_the_kind(mock_datastore):
+    run = str(uuid.uuid4())
+    entities = []
+    for number in range(12):
+        entity = datastore.Entity(key=mock_datastore.key(QUERY_KIND, f"{run}-{number}"))
+        entity.update({"run": run, "number": number})
+        entities.append(entity)
+    mock_datastore.put_multi(entities)
+
+    streamed = list(iter_entities(QUERY_KIND, {"run": run}, page_size=5))
+    assert sorted(entity["number"] for entity in streamed) == list(range(12))
+
+    keys = list(iter_entities(QUERY_KIND, {"run": run}, page_size=5, keys_only=True))
+    assert sorted(keys, key=lambda key: key.name) == sorted(
+        (entity.key for entity in entities), key=lambda key: key.name
+    )
+
+    limited = list(iter_entities(QUERY_KIND, {"run": run}, page_size=5, limit=7))
+    assert len(limited) == 7
+
+    mock_datastore.delete_multi([entity.key for entity in entities])
@@ -0,0 +1,111 @@
+from unittest.mock import MagicMock, patch
+
+from google.cloud import datastore
+
+from gcp.datastore import get_entity
+from gcp.datastore_cache import EntityCache, get_entity_cache, normalise_filters
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def build_entity(name: str) -> datastore.Entity:
+    entity = datastore.Entity()
+    entity["name"] = name
+    return entity
+
+
+def fetch_result(entities, next_page_token=None) -> MagicMock:
+    result = MagicMock()
+    result.pages = iter([iter(entities)])
+    result.next_page_token = next_page_token
+    return result
+
+
+def test_normalise_filters_ignores_filter_order():
+    assert normalise_filters({"a": 1, "b": [1, 2]}) == normalise_filters(
+        {"b": [1, 2], "a": 1}
+    )
+    assert normalise_filters({"a": 1}) != normalise_filters({"a": 2})
+
+
+def test_cache_expires_entries_by_kind_and_caches_empty_results():
+    clock = FakeClock()
+    cache = EntityCache(
+        max_entries=10,
+        ttl_sec=10,
+        negative_ttl_sec=2,
+        kind_ttl_sec={"Country": 100},
+        clock=clock,
+    )
+    cache.put("Customer", {"id": 1}, [build_entity("John Doe")])
+    cache.put("Country", {"code": "GB"}, [build_entity("United Kingdom")])
+    cache.put("Customer", {"id": 2}, [])
+
+    assert cache.get("Customer", {"id": 1}) == [build_entity("John Doe")]
+    assert cache.get("Customer", {"id": 2}) == []
+    clock.now = 5
+    assert cache.get("Customer", {"id": 2}) is None
+    clock.now = 50
+    assert cache.get("Customer", {"id": 1}) is None
+    assert cache.get("Country", {"code": "GB"}) == [build_entity("United Kingdom")]
+    assert cache.stats() == {
+        "entries": 1,
+        "hits": 2,
+        "negative_hits": 1,
+        "misses": 2,
+        "evictions": 0,
+        "invalidations": 0,
+    }
+
+
+def test_cache_returns_copies():
+    cache = EntityCache(max_entries=10, ttl_sec=10, negative_ttl_sec=10)
+    cache.put("Customer", {"id": 1}, [build_entity("John Doe")])
+
+    cache.get("Customer", {"id": 1})[0]["name"] = "Changed"
+
+    assert cache.get("Customer", {"id": 1})[0]["name"] == "John Doe"
+
+
+def test_cache_evicts_least_recently_used_and_invalidates():
+    cache = EntityCache(max_entries=2, ttl_sec=10, negative_ttl_sec=10)
+    cache.put("Customer", {"id": 1}, [build_entity("1")])
+    cache.put("Customer", {"id": 2}, [build_entity("2")])
+    cache.get("Customer", {"id": 1})
+    cache.put("Country", {"code": "GB"}, [build_entity("GB")])
+
+    assert cache.get("Customer", {"id": 2}) is None
+    assert cache.invalidate("Customer", {"id": 1}) == 1
+    assert cache.get("Customer", {"id": 1}) is None
+    assert cache.invalidate("Country") == 1
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["invalidations"] == 2
+
+
+@patch("gcp.datastore.get_datastore_client")
+def test_get_entity_reads_through_the_cache(ds_client_mock):
+    ds_client_mock.return_value.query.return_value.fetch.side_effect = [
+        fetch_result([build_entity("John Doe")]),
+        fetch_result([]),
+    ]
+    cache = EntityCache(max_entries=10, ttl_sec=10, negative_ttl_sec=10)
+
+    with patch("gcp.datastore.get_entity_cache", return_value=cache):
+        for _ in range(3):
+            assert get_entity("Customer", {"id": 1}) == [build_entity("John Doe")]
+            assert get_entity("Customer", {"id": 2}) == []
+
+    assert ds_client_mock.return_value.query.call_count == 2
+
+
+@patch("gcp.datastore_cache.settings")
+def test_get_entity_cache_is_disabled_by_default(settings_mock):
+    settings_mock.datastore_cache_enabled = False
+
+    assert get_entity_cache() is None
@@ -0,0 +1,97 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
+from google.api_core.exceptions import ServiceUnavailable
+from google.cloud import datastore
+
+from gcp.datastore_loader import KeyBatchLoader
+
+PROJECT = "dummy-project"
+
+
+def build_key(identifier) -> datastore.Key:
+    return datastore.Key("Customer", identifier, project=PROJECT)
+
+
+def build_client(missing=()):
+    client = MagicMock()
+    lock = threading.Lock()
+    client.requested = []
+
+    def get_multi(keys):
+        with lock:
+            client.requested.append(keys)
+        return [
+            datastore.Entity(key=key) for key in keys if key.id_or_name not in missing
+        ]
+
+    client.get_multi.side_effect = get_multi
+    return client
+
+
+def test_concurrent_loads_are_batched_into_one_get_multi():
+    client = build_client(missing=(3,))
+    loader = KeyBatchLoader(client, batch_window_sec=0.2, max_batch_size=100)
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        results = list(
+            executor.map(lambda index: loader.load(build_key(index % 5)), range(10))
+        )
+
+    assert [result.key.id_or_name if result is not None else None for result in results] == [
+        0, 1, 2, None, 4, 0, 1, 2, None, 4
+    ]
+    assert client.get_multi.call_count == 1
+    assert sorted(key.id_or_name for key in client.requested[0]) == [0, 1, 2, 3, 4]
+    assert loader.stats() == {"loads": 10, "rpcs": 1, "largest_batch": 5}
+
+
+def test_loads_of_the_same_key_get_their_own_entity():
+    client = build_client()
+    loader = KeyBatchLoader(client, batch_window_sec=0.2, max_batch_size=100)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(lambda _: loader.load(build_key(1)), range(3)))
+    results[0]["name"] = "changed"
+
+    assert client.get_multi.call_count == 1
+    assert len({id(result) for result in results}) == 3
+    assert [result.key for result in results] == [build_key(1)] * 3
+    assert [result.get("name") for result in results[1:]] == [None, None]
+
+    first, second = loader.load_many([build_key(2), build_key(2)])
+    assert first is not second and first.key == second.key
+
+
+def test_full_batches_are_sent_without_waiting():
+    client = build_client()
+    loader = KeyBatchLoader(client, batch_window_sec=5, max_batch_size=1)
+
+    assert loader.load(build_key(1)).key == build_key(1)
+    assert client.get_multi.call_count == 1
+
+
+def test_load_many_splits_keys_into_batches():
+    client = build_client(missing=("b",))
+    loader = KeyBatchLoader(client, batch_window_sec=0, max_batch_size=2)
+
+    results = loader.load_many(build_key(name) for name in ["a", "b", "c", "a"])
+
+    assert [result.key.name if result is not None else None for result in results] == ["a", None, "c", "a"]
+    assert [len(keys) for keys in client.requested] == [2, 1]
+
+
+def test_errors_are_raised_to_every_caller_of_the_batch():
+    client = MagicMock()
+    client.get_multi.side_effect = ServiceUnavailable("Testing ServiceUnavailable")
+    loader = KeyBatchLoader(client, batch_window_sec=0.1, max_batch_size=100)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(loader.load, build_key(index)) for index in range(3)]
+
+    for future in futures:
+        with pytest.raises(ServiceUnavailable):
+            future.result()
+    assert client.get_multi.call_count == 1
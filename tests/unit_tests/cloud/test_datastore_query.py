@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+from google.api_core.exceptions import BadRequest
+from google.cloud import datastore
+
+from configuration.env import settings
+from gcp.datastore import get_datastore_client, get_entity, get_key_loader, iter_entities
+from error.custom_exceptions import DatastoreGenericError
+
+
+def build_entity(number: int) -> datastore.Entity:
+    entity = datastore.Entity(key=datastore.Key("Customer", number, project="dummy-project"))
+    entity["number"] = number
+    return entity
+
+
+class FakeQuery:
+    """Serves entities a page at a time, the cursor being the offset of the page"""
+
+    def __init__(self, entities) -> None:
+        self.entities = entities
+        self.fetches = []
+        self.projection = ()
+        self.order = ()
+        self.add_filter = MagicMock()
+        self.keys_only = MagicMock()
+
+    def fetch(self, limit, start_cursor=None):
+        self.fetches.append((limit, start_cursor))
+        start = start_cursor or 0
+        end = start + limit
+        result = MagicMock()
+        result.pages = iter([iter(self.entities[start:end])])
+        result.next_page_token = end if end < len(self.entities) else None
+        return result
+
+
+@patch("gcp.datastore.get_datastore_client")
+def test_iter_entities_streams_pages_with_cursors(ds_client_mock):
+    query = ds_client_mock.return_value.query.return_value = FakeQuery([build_entity(n) for n in range(7)])
+
+    entities = iter_entities("Customer", {"active": True}, page_size=3)
+    assert [entity["number"] for entity in entities] == list(range(7))
+
+    query.add_filter.assert_called_once_with("active", "=", True)
+    assert query.fetches == [(3, None), (3, 3), (3, 6)]
+
+
+@patch("gcp.datastore.get_datastore_client")
+def test_iter_entities_stops_at_the_limit(ds_client_mock):
+    query = ds_client_mock.return_value.query.return_value = FakeQuery([build_entity(n) for n in range(7)])
+
+    entities = list(iter_entities("Customer", page_size=3, limit=4))
+
+    assert [entity["number"] for entity in entities] == [0, 1, 2, 3]
+    assert query.fetches == [(3, None), (1, 3)]
+
+
+@patch("gcp.datastore.get_datastore_client")
+def test_iter_entities_keys_only_and_projection(ds_client_mock):
+    built = [build_entity(n) for n in range(2)]
+    query = ds_client_mock.return_value.query.return_value = FakeQuery(built)
+
+    assert list(iter_entities("Customer", keys_only=True)) == [entity.key for entity in built]
+    query.keys_only.assert_called_once()
+
+    query = ds_client_mock.return_value.query.return_value = FakeQuery(built)
+    list(iter_entities("Customer", projection=["number"], order=["-number"]))
+    assert query.projection == ["number"]
+    assert query.order == ["-number"]
+
+
+@patch("gcp.datastore.get_datastore_client")
+def test_iter_entities_maps_bad_requests(ds_client_mock):
+    ds_client_mock.return_value.query.return_value.fetch.side_effect = BadRequest("bad filter")
+
+    with pytest.raises(DatastoreGenericError):
+        list(iter_entities("Customer", {"id": 1}))
+
+
+@patch("gcp.datastore.get_entity_cache", return_value=None)
+@patch("gcp.datastore.get_datastore_client")
+def test_get_entity_returns_at_most_the_limit(ds_client_mock, _):
+    ds_client_mock.return_value.query.return_value = FakeQuery([build_entity(n) for n in range(150)])
+
+    assert len(get_entity("Customer", {})) == 100
+
+
+@patch("gcp.datastore.datastore.Client")
+def test_clients_are_created_once_per_project_and_namespace(client_mock):
+    client_mock.side_effect = lambda project, namespace: MagicMock(
+        project=project, namespace=namespace
+    )
+    with patch.dict("gcp.datastore._clients", clear=True), patch.dict(
+        "gcp.datastore._key_loaders", clear=True
+    ):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            clients = list(executor.map(lambda _: get_datastore_client(), range(8)))
+        tenant = get_datastore_client(namespace="tenant")
+
+        assert all(client is clients[0] for client in clients)
+        assert clients[0].namespace == settings.datastore_namespace
+        assert tenant.namespace == "tenant"
+        assert get_key_loader(namespace="tenant") is get_key_loader(namespace="tenant")
+        assert client_mock.call_count == 2
@@ -1,11 +1,21 @@
+import base64
+import hashlib
+import io
+import json
+import threading
 from unittest.mock import MagicMock, patch
 
+import google_crc32c
+
 import pytest
-from google.api_core.exceptions import GoogleAPIError
+from google.api_core.exceptions import GoogleAPIError, ServiceUnavailable
 from google.cloud.exceptions import NotFound
+from google.cloud.storage.retry import DEFAULT_RETRY
 
 from error.custom_exceptions import ManualDLQError, PubsubReprocessError
-from gcp.gcs import GoogleCloudStorage
+from gcp.gcs import GoogleCloudStorage, http_pool_size
+from helper import concurrency_limiter
+from pydantic_model.api_model import ErrorEnum
 
 bucket_name = "test-bucket"
 source_blob_name = "test_file.json.gpg"
@@ -32,6 +42,20 @@ def test_read_gcs_file_to_bytes_success():
     blob_mock.download_as_bytes.assert_called_once()
 
 
+@patch("helper.retry.time.sleep")
+def test_read_gcs_file_to_bytes_retries_transient_errors(sleep_mock):
+    blob = MagicMock()
+    blob.download_as_bytes.side_effect = [ServiceUnavailable("Testing retry"), b"data"]
+    retry_gcs = GoogleCloudStorage(project_id="dummy-project")
+    retry_gcs._client = MagicMock()
+    retry_gcs._client.bucket.return_value.blob.return_value = blob
+
+    assert retry_gcs.read_gcs_file_to_bytes(bucket_name, source_blob_name) == b"data"
+    # the client's own retry is turned off, the retry budget covers the call
+    assert blob.download_as_bytes.call_args.kwargs == {"retry": None}
+    sleep_mock.assert_called_once()
+
+
 def test_read_gcs_file_to_bytes_failures():
     # Test NotFound Exception
     blob_mock.download_as_bytes.side_effect = NotFound("Testing NotFound")
@@ -52,19 +76,49 @@ def test_read_gcs_file_to_bytes_failures():
         gcs.read_gcs_file_to_bytes(bucket_name, source_blob_name)
 
 
-@patch("gcp.gcs.io.BytesIO")
-@patch("gcp.gcs.io.StringIO")
-def test_upload_stringio_to_gcs_success(string_io, bytes_io):
-    string_io.return_value.getvalue.return_value = string_data
-    bytes_io.return_value.getvalue.return_value = string_data.encode()
+def test_upload_stringio_to_gcs_success():
     storage_client_mock.bucket.return_value = bucket_mock
     bucket_mock.blob.return_value = blob_mock
     gcs.upload_stringio_to_gcs(bucket_name, destination_blob_name, string_data)
 
-    blob_mock.upload_from_file.assert_called_once_with(
-        bytes_io.return_value, size=len(bytes_io.return_value.getvalue())
+    blob_mock.upload_from_file.assert_called_once()
+    stream = blob_mock.upload_from_file.call_args.args[0]
+    assert stream.read() == string_data.encode()
+    assert blob_mock.upload_from_file.call_args.kwargs == {
+        "size": len(string_data),
+        "content_type": None,
+        "retry": DEFAULT_RETRY,
+    }
+
+
+@pytest.mark.parametrize(
+    "data, size, expected_size",
+    [
+        (b"0123456789", None, 10),
+        (bytearray(b"0123456789"), None, 10),
+        (memoryview(b"0123456789"), None, 10),
+        (io.BytesIO(b"0123456789"), 10, 10),
+        ((chunk for chunk in (b"0123", b"4567", b"89")), None, None),
+    ],
+)
+def test_upload_to_gcs_streams_data(data, size, expected_size):
+    blob_mock.upload_from_file.reset_mock(side_effect=True)
+    storage_client_mock.bucket.return_value = bucket_mock
+    bucket_mock.blob.return_value = blob_mock
+
+    gcs.upload_to_gcs(
+        bucket_name, destination_blob_name, data, content_type="text/csv", size=size
     )
 
+    stream = blob_mock.upload_from_file.call_args.args[0]
+    assert stream.read(4) == b"0123"
+    assert stream.read() == b"456789"
+    assert blob_mock.upload_from_file.call_args.kwargs == {
+        "size": expected_size,
+        "content_type": "text/csv",
+        "retry": DEFAULT_RETRY,
+    }
+
 
 def test_upload_stringio_to_gcs_failure():
     blob_mock.upload_from_file.side_effect = Exception("Failed to upload to GCS bucket")
@@ -72,4 +126,309 @@ def test_upload_stringio_to_gcs_failure():
     with pytest.raises(PubsubReprocessError):
         gcs.upload_stringio_to_gcs(bucket_name, destination_blob_name, string_data)
 
+    blob_mock.upload_from_file.side_effect = NotFound("Testing NotFound")
+
+    with pytest.raises(ManualDLQError):
+        gcs.upload_to_gcs(bucket_name, destination_blob_name, b"data")
+
+
+
+
+def test_iter_gcs_file_chunks_success():
+    blob_mock.open.return_value = io.BytesIO(b"0123456789")
+    bucket_mock.blob.return_value = blob_mock
+    storage_client_mock.bucket.return_value = bucket_mock
+
+    chunks = list(gcs.iter_gcs_file_chunks(bucket_name, source_blob_name, chunk_size=4))
+
+    assert chunks == [b"0123", b"4567", b"89"]
+    blob_mock.open.assert_called_with("rb", chunk_size=4)
+
+
+def test_open_gcs_file_reads_like_a_file():
+    blob_mock.open.return_value = io.BytesIO(b'[{"Name": "John Doe"}]')
+    bucket_mock.blob.return_value = blob_mock
+    storage_client_mock.bucket.return_value = bucket_mock
+
+    with gcs.open_gcs_file(bucket_name, source_blob_name, chunk_size=4) as reader:
+        assert json.load(reader) == [{"Name": "John Doe"}]
+    assert reader.closed
+
+
+def test_iter_gcs_file_chunks_failures():
+    blob_mock.open.return_value = MagicMock()
+    bucket_mock.blob.return_value = blob_mock
+    storage_client_mock.bucket.return_value = bucket_mock
+
+    # Test NotFound Exception
+    blob_mock.open.return_value.read.side_effect = NotFound("Testing NotFound")
+
+    with pytest.raises(ManualDLQError):
+        list(gcs.iter_gcs_file_chunks(bucket_name, source_blob_name))
+
+    # Test GoogleAPIError Exception
+    blob_mock.open.return_value.read.side_effect = GoogleAPIError("Testing GoogleAPIError")
+
+    with pytest.raises(PubsubReprocessError):
+        list(gcs.iter_gcs_file_chunks(bucket_name, source_blob_name))
+
+
+def test_iter_gcs_file_chunks_verifies_checksums_before_the_last_chunk_is_consumed():
+    data = b"0123456789"
+    blob_mock.open.return_value = io.BytesIO(data)
+    bucket_mock.blob.return_value = blob_mock
+    storage_client_mock.bucket.return_value = bucket_mock
+    wrong_crc32c = base64.b64encode(google_crc32c.Checksum(b"other").digest()).decode()
+
+    chunks = gcs.iter_gcs_file_chunks(
+        bucket_name, source_blob_name, chunk_size=4, crc32c=wrong_crc32c, generation="7"
+    )
+    assert [next(chunks) for _ in range(3)] == [b"0123", b"4567", b"89"]
+    with pytest.raises(PubsubReprocessError) as exc:
+        next(chunks)
+    assert exc.value.error_stage == ErrorEnum.CHECKSUM_MISMATCH
+    bucket_mock.blob.assert_called_with(source_blob_name, generation=7)
+
+
+def test_upload_to_gcs_keeps_errors_of_a_streamed_source():
+    blob_mock.upload_from_file.side_effect = lambda stream, **kwargs: stream.read()
+    blob_mock.open.return_value = MagicMock()
+    blob_mock.open.return_value.read.side_effect = NotFound("Testing NotFound")
+    bucket_mock.blob.return_value = blob_mock
+    storage_client_mock.bucket.return_value = bucket_mock
+
+    with pytest.raises(ManualDLQError):
+        gcs.upload_to_gcs(
+            bucket_name,
+            destination_blob_name,
+            gcs.iter_gcs_file_chunks(bucket_name, source_blob_name),
+        )
+    blob_mock.upload_from_file.side_effect = None
+
+
+@patch("helper.concurrency_limiter.settings")
+def test_streamed_upload_does_not_wait_on_its_own_source(mock_settings):
+    mock_settings.adaptive_concurrency_enabled = True
+    mock_settings.adaptive_concurrency_initial_limit = 1
+    mock_settings.adaptive_concurrency_min_limit = 1
+    mock_settings.adaptive_concurrency_max_limit = 1
+    mock_settings.adaptive_concurrency_latency_tolerance = 1.5
+    mock_settings.adaptive_concurrency_backoff_ratio = 0.7
+    uploaded = []
+    blob_mock.upload_from_file.side_effect = lambda stream, **kwargs: uploaded.append(
+        stream.read()
+    )
+    blob_mock.open.return_value = io.BytesIO(b"0123456789")
+    bucket_mock.blob.return_value = blob_mock
+    storage_client_mock.bucket.return_value = bucket_mock
+
+    with patch.dict(concurrency_limiter._limiters, clear=True):
+        upload = threading.Thread(
+            target=gcs.upload_to_gcs,
+            args=(
+                bucket_name,
+                destination_blob_name,
+                gcs.iter_gcs_file_chunks(bucket_name, source_blob_name, chunk_size=4),
+            ),
+            daemon=True,
+        )
+        upload.start()
+        upload.join(timeout=5)
+    blob_mock.upload_from_file.side_effect = None
+
+    assert not upload.is_alive()
+    assert uploaded == [b"0123456789"]
+
+
+def ranged_download(content: bytes, requested_ranges: list):
+    lock = threading.Lock()
+
+    def download_as_bytes(start=None, end=None, checksum="md5", retry=None):
+        with lock:
+            requested_ranges.append((start, end))
+        return content[start : end + 1]
+
+    return download_as_bytes
+
+
+@patch("gcp.gcs.settings.gcs_parallel_download_threshold", 16)
+@patch("gcp.gcs.settings.gcs_parallel_download_chunk_size", 10)
+@patch("gcp.gcs.settings.gcs_parallel_download_concurrency", 3)
+def test_read_gcs_file_to_bytes_downloads_large_files_in_parallel():
+    content = bytes(range(45))
+    requested_ranges = []
+    blob_mock.download_as_bytes.side_effect = ranged_download(content, requested_ranges)
+    bucket_mock.blob.return_value = blob_mock
+    storage_client_mock.bucket.return_value = bucket_mock
+
+    file_as_bytes = gcs.read_gcs_file_to_bytes(
+        bucket_name,
+        source_blob_name,
+        size="45",
+        crc32c=base64.b64encode(google_crc32c.Checksum(content).digest()).decode(),
+        md5_hash=base64.b64encode(hashlib.md5(content).digest()).decode(),
+        generation="1717150210123431",
+    )
+
+    assert file_as_bytes == content
+    assert sorted(requested_ranges) == [(0, 9), (10, 19), (20, 29), (30, 39), (40, 44)]
+    bucket_mock.blob.assert_called_with(source_blob_name, generation=1717150210123431)
+
+
+@patch("gcp.gcs.settings.gcs_parallel_download_threshold", 16)
+@patch("gcp.gcs.settings.gcs_parallel_download_chunk_size", 10)
+def test_read_gcs_file_to_bytes_retries_corrupt_parallel_downloads():
+    content = bytes(range(45))
+    blob_mock.download_as_bytes.side_effect = ranged_download(content, [])
+    bucket_mock.blob.return_value = blob_mock
+    storage_client_mock.bucket.return_value = bucket_mock
+
+    with pytest.raises(PubsubReprocessError) as exc:
+        gcs.read_gcs_file_to_bytes(
+            bucket_name,
+            source_blob_name,
+            size="45",
+            crc32c=base64.b64encode(google_crc32c.Checksum(b"other").digest()).decode(),
+        )
+    assert exc.value.error_stage == ErrorEnum.CHECKSUM_MISMATCH
+
+    # the object is shorter than the notification said
+    with pytest.raises(PubsubReprocessError):
+        gcs.read_gcs_file_to_bytes(bucket_name, source_blob_name, size="50")
+
+    blob_mock.download_as_bytes.side_effect = NotFound("Testing NotFound")
+
+    with pytest.raises(ManualDLQError):
+        gcs.read_gcs_file_to_bytes(bucket_name, source_blob_name, size="45")
+
+
+@patch("gcp.gcs.settings.gcs_composite_upload_threshold", 16)
+@patch("gcp.gcs.settings.gcs_composite_upload_part_size", 1)
+@patch("gcp.gcs.settings.gcs_composite_upload_concurrency", 4)
+def test_upload_to_gcs_composes_large_uploads_from_parts():
+    content = bytes(range(70))
+    blobs = {}
+    uploaded = {}
+    deleted = []
+
+    def create_blob(name):
+        blob = MagicMock()
+        blob.name = name
+        blob.upload_from_file.side_effect = lambda stream, **kwargs: uploaded.update(
+            {name: stream.read()}
+        )
+        blob.delete.side_effect = lambda **kwargs: deleted.append(name)
+        blobs.setdefault(name, blob)
+        return blob
+
+    composite_bucket_mock = MagicMock()
+    composite_bucket_mock.blob.side_effect = create_blob
+    storage_client_mock.bucket.return_value = composite_bucket_mock
+
+    gcs.upload_to_gcs(bucket_name, destination_blob_name, content, content_type="text/csv")
+
+    target = blobs.pop(destination_blob_name)
+    parts = [blobs[name] for name in sorted(blobs)]
+    assert all(name.startswith("_composite_uploads/") for name in blobs)
+    assert b"".join(uploaded[part.name] for part in parts) == content
+    # 70 parts take one compose of 32 sources and two more extending the target
+    composes = [call.args[0] for call in target.compose.call_args_list]
+    assert composes == [parts[:32], [target] + parts[32:63], [target] + parts[63:]]
+    assert target.content_type == "text/csv"
+    target.upload_from_file.assert_not_called()
+    assert sorted(deleted) == [part.name for part in parts]
+
+
+@patch("gcp.gcs.settings.gcs_composite_upload_threshold", 16)
+@patch("gcp.gcs.settings.gcs_composite_upload_part_size", 8)
+def test_upload_to_gcs_deletes_parts_of_failed_composite_uploads():
+    composite_bucket_mock = MagicMock()
+    composite_bucket_mock.blob.return_value.upload_from_file.side_effect = GoogleAPIError(
+        "Testing GoogleAPIError"
+    )
+    storage_client_mock.bucket.return_value = composite_bucket_mock
+
+    with pytest.raises(PubsubReprocessError):
+        gcs.upload_to_gcs(bucket_name, destination_blob_name, bytes(32))
+
+    composite_bucket_mock.blob.return_value.compose.assert_not_called()
+    # all four parts are deleted, whether or not they were uploaded
+    assert composite_bucket_mock.blob.return_value.delete.call_count == 4
+
+
+def test_copy_gcs_file_continues_rewrites_until_done():
+    copy_bucket_mock = MagicMock()
+    storage_client_mock.bucket.return_value = copy_bucket_mock
+    target_blob_mock = copy_bucket_mock.blob.return_value
+    target_blob_mock.rewrite.side_effect = [
+        ("token-1", 10, 30),
+        ("token-2", 20, 30),
+        (None, 30, 30),
+    ]
+
+    size = gcs.copy_gcs_file(
+        bucket_name, source_blob_name, "target-bucket", destination_blob_name, "12"
+    )
+
+    assert size == 30
+    copy_bucket_mock.blob.assert_any_call(source_blob_name, generation=12)
+    assert [call.kwargs["token"] for call in target_blob_mock.rewrite.call_args_list] == [
+        None,
+        "token-1",
+        "token-2",
+    ]
+
+
+def test_copy_gcs_file_failures():
+    copy_bucket_mock = MagicMock()
+    storage_client_mock.bucket.return_value = copy_bucket_mock
+
+    copy_bucket_mock.blob.return_value.rewrite.side_effect = NotFound("Testing NotFound")
+    with pytest.raises(ManualDLQError):
+        gcs.copy_gcs_file(bucket_name, source_blob_name, bucket_name, destination_blob_name)
+
+    copy_bucket_mock.blob.return_value.rewrite.side_effect = GoogleAPIError(
+        "Testing GoogleAPIError"
+    )
+    with pytest.raises(PubsubReprocessError):
+        gcs.copy_gcs_file(bucket_name, source_blob_name, bucket_name, destination_blob_name)
+
+
+def test_batch_operations_return_per_object_results():
+    batch_bucket_mock = MagicMock()
+    storage_client_mock.bucket.return_value = batch_bucket_mock
+
+    def create_blob(name):
+        blob = MagicMock()
+        blob.download_as_bytes.side_effect = (
+            NotFound("Testing NotFound") if name == "missing.json" else [name.encode()]
+        )
+        blob.delete.side_effect = (
+            GoogleAPIError("Testing GoogleAPIError") if name == "locked.json" else None
+        )
+        return blob
+
+    batch_bucket_mock.blob.side_effect = create_blob
+
+    read_results = gcs.read_many(bucket_name, ["a.json", "missing.json", "b.json"])
+    upload_results = gcs.upload_many(bucket_name, {"a.json": b"a", "b.json": b"b"})
+    delete_results = gcs.delete_many(bucket_name, ["a.json", "locked.json"])
+
+    assert [(result.name, result.data) for result in read_results] == [
+        ("a.json", b"a.json"),
+        ("missing.json", None),
+        ("b.json", b"b.json"),
+    ]
+    assert isinstance(read_results[1].error, ManualDLQError)
+    assert [result.error for result in upload_results] == [None, None]
+    assert delete_results[0].error is None
+    assert isinstance(delete_results[1].error, PubsubReprocessError)
+
+
+def test_storage_client_is_shared_with_a_sized_connection_pool():
+    first = GoogleCloudStorage(project_id="dummy-project")
+    second = GoogleCloudStorage(project_id="dummy-project")
 
+    assert first._client is second._client
+    adapter = first._client._http.get_adapter("https://storage.googleapis.com")
+    assert adapter._pool_maxsize == http_pool_size() > 10
@@ -0,0 +1,139 @@
+import base64
+import os
+from unittest.mock import MagicMock, patch
+
+import google_crc32c
+
+from gcp.gcs import GoogleCloudStorage
+from gcp.gcs_cache import GcsObjectCache, create_gcs_object_cache
+
+
+def crc32c_of(data: bytes) -> str:
+    return base64.b64encode(google_crc32c.Checksum(data).digest()).decode()
+
+
+def test_cache_serves_memory_then_disk_hits(tmp_path):
+    cache = GcsObjectCache(max_memory_bytes=10, max_disk_bytes=100, directory=str(tmp_path))
+    first, second = b"0123456789", b"abcdefghij"
+
+    cache.put("bucket", "first.json", "1", crc32c_of(first), first)
+    cache.put("bucket", "second.json", "1", crc32c_of(second), second)
+
+    # the first entry was evicted from memory but is still on disk
+    assert cache.get("bucket", "second.json", "1", crc32c_of(second)) == second
+    assert cache.get("bucket", "first.json", "1", crc32c_of(first)) == first
+    assert cache.get("bucket", "first.json", "2", crc32c_of(first)) is None
+    assert cache.stats() == {
+        "memory_entries": 1,
+        "memory_bytes": 10,
+        "disk_entries": 2,
+        "disk_bytes": 20,
+        "memory_hits": 1,
+        "disk_hits": 1,
+        "misses": 1,
+        "evictions": 2,
+        "checksum_failures": 0,
+    }
+
+
+def test_cache_evicts_least_recently_used_files(tmp_path):
+    cache = GcsObjectCache(max_memory_bytes=0, max_disk_bytes=20, directory=str(tmp_path))
+    contents = {name: name.encode() * 10 for name in ("a", "b", "c")}
+
+    cache.put("bucket", "a", "1", crc32c_of(contents["a"]), contents["a"])
+    cache.put("bucket", "b", "1", crc32c_of(contents["b"]), contents["b"])
+    cache.get("bucket", "a", "1", crc32c_of(contents["a"]))
+    cache.put("bucket", "c", "1", crc32c_of(contents["c"]), contents["c"])
+
+    assert cache.get("bucket", "b", "1", crc32c_of(contents["b"])) is None
+    assert cache.get("bucket", "a", "1", crc32c_of(contents["a"])) == contents["a"]
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_cache_skips_objects_larger_than_both_tiers(tmp_path):
+    cache = GcsObjectCache(max_memory_bytes=4, max_disk_bytes=8, directory=str(tmp_path))
+    data = memoryview(b"0123456789")
+
+    with patch("gcp.gcs_cache.crc32c_digest") as digest_mock:
+        cache.put("bucket", "large.json", "1", crc32c_of(bytes(data)), data)
+    digest_mock.assert_not_called()
+    assert cache.stats()["disk_entries"] == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_cache_rejects_content_not_matching_its_crc32c(tmp_path):
+    cache = GcsObjectCache(max_memory_bytes=0, max_disk_bytes=100, directory=str(tmp_path))
+    data = b"test file in bytes"
+
+    cache.put("bucket", "file.json", "1", crc32c_of(b"other"), data)
+    assert cache.get("bucket", "file.json", "1", crc32c_of(b"other")) is None
+
+    cache.put("bucket", "file.json", "1", crc32c_of(data), data)
+    # a corrupted file on disk is dropped instead of served
+    (cached_file,) = tmp_path.iterdir()
+    cached_file.write_bytes(b"corrupted")
+    assert cache.get("bucket", "file.json", "1", crc32c_of(data)) is None
+    assert list(tmp_path.iterdir()) == []
+    assert cache.stats()["checksum_failures"] == 2
+
+
+def test_repeated_reads_of_a_generation_do_not_touch_the_network(tmp_path):
+    data = b"test file in bytes"
+    gcs = GoogleCloudStorage(
+        project_id="dummy-project",
+        cache=GcsObjectCache(
+            max_memory_bytes=100, max_disk_bytes=100, directory=str(tmp_path)
+        ),
+    )
+    gcs._client = MagicMock()
+    blob_mock = gcs._client.bucket.return_value.blob.return_value
+    blob_mock.download_as_bytes.return_value = data
+
+    for _ in range(3):
+        assert (
+            gcs.read_gcs_file_to_bytes(
+                "bucket", "file.json", crc32c=crc32c_of(data), generation="1"
+            )
+            == data
+        )
+    # objects without a generation can not be cached
+    gcs.read_gcs_file_to_bytes("bucket", "file.json", crc32c=crc32c_of(data))
+
+    assert blob_mock.download_as_bytes.call_count == 2
+
+
+@patch("gcp.gcs_cache.settings")
+def test_create_gcs_object_cache(settings_mock, tmp_path):
+    settings_mock.gcs_cache_enabled = False
+    assert create_gcs_object_cache() is None
+
+    settings_mock.gcs_cache_enabled = True
+    settings_mock.gcs_cache_dir = str(tmp_path / "cache")
+    assert isinstance(create_gcs_object_cache(), GcsObjectCache)
+    assert (tmp_path / "cache" / str(os.getpid())).is_dir()
+
+
+@patch("gcp.gcs_cache.settings")
+def test_cache_directory_is_private_to_its_process(settings_mock, tmp_path):
+    settings_mock.gcs_cache_enabled = True
+    settings_mock.gcs_cache_dir = str(tmp_path)
+    settings_mock.gcs_cache_max_memory_bytes = 0
+    settings_mock.gcs_cache_max_disk_bytes = 100
+    data = b"test file in bytes"
+    # left by a worker that exited, and by one with the same pid as this process
+    (tmp_path / "1").mkdir()
+    (tmp_path / "1" / "stale").write_bytes(data)
+    (tmp_path / str(os.getpid())).mkdir()
+    (tmp_path / str(os.getpid()) / "stale").write_bytes(data)
+    with patch("gcp.gcs_cache.os.getpid", return_value=2):
+        running = create_gcs_object_cache()
+
+    cache = create_gcs_object_cache()
+    cache.put("bucket", "file.json", "1", crc32c_of(data), data)
+    assert set(os.listdir(tmp_path)) == {"2", str(os.getpid())}
+    assert len(os.listdir(tmp_path / str(os.getpid()))) == 1
+    assert os.listdir(tmp_path / "2") == []
+
+    cache.close()
+    running.close()
+    assert os.listdir(tmp_path) == []
@@ -1,9 +1,15 @@
+import asyncio
 import datetime
 import decimal
+import gzip
+import json
+from concurrent import futures
+from unittest.mock import MagicMock, patch
 
 import pytest
 
-from gcp.pubsub import PubSubPublisher
+from error.custom_exceptions import PubsubPublishException
+from gcp.pubsub import PubSubPublisher, PubSubPublisherPool, get_dlq_batch_settings
 
 
 def test_json_serial_datetime():
@@ -29,3 +35,141 @@ def test_json_serial_invalid_type():
     with pytest.raises(TypeError) as ex:
         result = PubSubPublisher.json_serial(message)
     assert str(ex.value) == "Type <class 'str'> is not serializable"
+
+
+@patch("gcp.pubsub.pubsub_v1.PublisherClient")
+def test_publisher_pool_reuses_publisher_per_topic(mock_publisher_client):
+    pool = PubSubPublisherPool()
+
+    first = pool.get(project_id="dummy-project", topic="dlq.topic")
+    second = pool.get(project_id="dummy-project", topic="dlq.topic")
+    other = pool.get(project_id="dummy-project", topic="other.topic")
+
+    assert first is second
+    assert first is not other
+    assert pool.open_channels == 2
+    assert mock_publisher_client.call_count == 2
+
+
+@patch("gcp.pubsub.pubsub_v1.PublisherClient")
+def test_publisher_pool_close(mock_publisher_client):
+    pool = PubSubPublisherPool()
+    pool.get(project_id="dummy-project", topic="dlq.topic")
+
+    pool.close()
+
+    assert pool.open_channels == 0
+    mock_publisher_client.return_value.stop.assert_called_once()
+    mock_publisher_client.return_value.transport.close.assert_called_once()
+
+
+@patch("gcp.pubsub.pubsub_v1.PublisherClient")
+def test_publish_async_success(mock_publisher_client):
+    publish_future = futures.Future()
+    publish_future.set_result("dlq-message-id")
+    mock_publisher_client.return_value.publish.return_value = publish_future
+    publisher = PubSubPublisher(project_id="dummy-project", topic="dlq.topic")
+
+    asyncio.run(
+        publisher.publish_async(
+            data={"bucket": "dummy_bucket"},
+            source_message_uuid="123",
+            source_publish_time="2024-05-31T10:10:10.012022+01:00",
+        )
+    )
+
+    publish_kwargs = mock_publisher_client.return_value.publish.call_args.kwargs
+    assert publish_kwargs["topic"] == "projects/dummy-project/topics/dlq.topic"
+    assert json.loads(publish_kwargs["data"]) == {"bucket": "dummy_bucket"}
+    assert publish_kwargs["source_message_uuid"] == "123"
+    assert publish_kwargs["source_publish_time"] == "2024-05-31T10:10:10.012022+01:00"
+
+
+@patch("gcp.pubsub.PUBSUB_PUBLISH_TIMEOUT_SEC", 0.01)
+@patch("gcp.pubsub.pubsub_v1.PublisherClient")
+def test_publish_async_timeout(mock_publisher_client):
+    mock_publisher_client.return_value.publish.return_value = futures.Future()
+    publisher = PubSubPublisher(project_id="dummy-project", topic="dlq.topic")
+
+    with pytest.raises(PubsubPublishException):
+        asyncio.run(publisher.publish_async({}, "123", "publish_time"))
+
+
+@patch("gcp.pubsub.pubsub_v1.PublisherClient")
+def test_publish_async_failure(mock_publisher_client):
+    publish_future = futures.Future()
+    publish_future.set_exception(Exception("Testing publish error"))
+    mock_publisher_client.return_value.publish.return_value = publish_future
+    publisher = PubSubPublisher(project_id="dummy-project", topic="dlq.topic")
+
+    with pytest.raises(PubsubPublishException) as ex:
+        asyncio.run(publisher.publish_async({}, "123", "publish_time"))
+    assert str(ex.value) == "Testing publish error"
+
+
+@patch("gcp.pubsub.settings.dlq_batch_enabled", True)
+def test_get_dlq_batch_settings():
+    batch_settings = get_dlq_batch_settings()
+
+    assert batch_settings.max_messages == 100
+    assert batch_settings.max_bytes == 1000000
+    assert batch_settings.max_latency == 0.05
+
+
+def test_get_dlq_batch_settings_disabled():
+    assert get_dlq_batch_settings() is None
+
+
+@patch("gcp.pubsub.pubsub_v1.PublisherClient")
+def test_publish_nowait_error_callback(mock_publisher_client):
+    publish_future = futures.Future()
+    mock_publisher_client.return_value.publish.return_value = publish_future
+    on_error = MagicMock()
+    publisher = PubSubPublisher(project_id="dummy-project", topic="dlq.topic")
+
+    publisher.publish_nowait({}, "123", "publish_time", on_error=on_error)
+    assert publisher.pending_publishes == 1
+    on_error.assert_not_called()
+
+    publish_future.set_exception(Exception("Testing publish error"))
+
+    assert publisher.pending_publishes == 0
+    on_error.assert_called_once()
+    assert isinstance(on_error.call_args.args[0], PubsubPublishException)
+
+
+@patch("gcp.pubsub.pubsub_v1.PublisherClient")
+def test_close_flushes_pending_batches(mock_publisher_client):
+    publish_future = futures.Future()
+    mock_publisher_client.return_value.publish.return_value = publish_future
+    mock_publisher_client.return_value.stop.side_effect = (
+        lambda: publish_future.set_result("dlq-message-id")
+    )
+    publisher = PubSubPublisher(project_id="dummy-project", topic="dlq.topic")
+    publisher.publish_nowait({}, "123", "publish_time")
+
+    publisher.close(timeout=1)
+
+    assert publisher.pending_publishes == 0
+    mock_publisher_client.return_value.transport.close.assert_called_once()
+
+
+def test_encode_payload_uncompressed():
+    payload, attributes = PubSubPublisher.encode_payload({"bucket": "dummy_bucket"})
+
+    assert json.loads(payload) == {"bucket": "dummy_bucket"}
+    assert attributes == {}
+
+
+@patch("gcp.pubsub.settings.pubsub_compression", "gzip")
+@patch("gcp.pubsub.settings.pubsub_compression_threshold_bytes", 100)
+def test_encode_payload_compressed_above_threshold():
+    data = {"rows": ["row"] * 100}
+
+    payload, attributes = PubSubPublisher.encode_payload(data)
+    small_payload, small_attributes = PubSubPublisher.encode_payload({})
+
+    assert attributes == {"content-encoding": "gzip"}
+    assert json.loads(gzip.decompress(payload)) == data
+    assert small_payload == b"{}"
+    assert small_attributes == {}
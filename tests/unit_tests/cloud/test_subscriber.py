@@ -0,0 +1,45 @@
+from unittest.mock import MagicMock, patch
+
+from gcp.subscriber import PubSubPullSubscriber
+
+
+@patch("gcp.subscriber.pubsub_v1.SubscriberClient")
+def test_subscribe_with_flow_control(mock_subscriber_client):
+    mock_subscriber_client.return_value.subscription_path.return_value = (
+        "projects/dummy-project/subscriptions/gcs-events.subscription"
+    )
+    subscriber = PubSubPullSubscriber(
+        project_id="dummy-project",
+        subscription="gcs-events.subscription",
+        max_messages=5,
+        max_bytes=1024,
+        max_workers=2,
+    )
+    callback = MagicMock()
+
+    subscriber.subscribe(callback)
+
+    args, kwargs = mock_subscriber_client.return_value.subscribe.call_args
+    assert args == ("projects/dummy-project/subscriptions/gcs-events.subscription",)
+    assert kwargs["callback"] is callback
+    assert kwargs["flow_control"].max_messages == 5
+    assert kwargs["flow_control"].max_bytes == 1024
+    assert kwargs["await_callbacks_on_shutdown"] is True
+
+
+@patch("gcp.subscriber.pubsub_v1.SubscriberClient")
+def test_close_cancels_streaming_pull(mock_subscriber_client):
+    subscriber = PubSubPullSubscriber(
+        project_id="dummy-project",
+        subscription="gcs-events.subscription",
+        max_messages=5,
+        max_bytes=1024,
+        max_workers=2,
+    )
+    streaming_pull_future = subscriber.subscribe(MagicMock())
+
+    subscriber.close()
+
+    streaming_pull_future.cancel.assert_called_once()
+    streaming_pull_future.result.assert_called_once()
+    mock_subscriber_client.return_value.close.assert_called_once()
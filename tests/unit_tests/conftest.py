@@ -0,0 +1,28 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from service.pipeline import GcsEventPipeline
+
+
+@pytest.fixture
+def storage_mock():
+    return MagicMock()
+
+
+@pytest.fixture
+def api_client(storage_mock):
+    with TestClient(app) as client:
+        app.state.pipeline.close()
+        app.state.pipeline = GcsEventPipeline(
+            storage=storage_mock, target_bucket="dummy_bucket"
+        )
+        yield client
+
+
+@pytest.fixture
+def mock_publish_to_dlq():
+    with patch("main.publish_to_dlq", new_callable=AsyncMock) as publish_to_dlq:
+        yield publish_to_dlq
@@ -0,0 +1,101 @@
+import asyncio
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from service.admission import (
+    AdmissionControlMiddleware,
+    AdmissionController,
+    AdmissionPool,
+    create_admission_controller,
+)
+
+
+def test_pool_sheds_when_queue_is_full():
+    async def scenario():
+        pool = AdmissionPool(name="push", max_inflight=1, max_queued=1, max_queue_wait_sec=1)
+        assert await pool.acquire() is None
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+
+        assert await pool.acquire() == 429
+        pool.release()
+        assert await waiter is None
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert stats["admitted"] == 2
+    assert stats["inflight"] == 1
+    assert stats["shed_queue_full"] == 1
+
+
+def test_pool_sheds_after_queue_wait():
+    async def scenario():
+        pool = AdmissionPool(name="push", max_inflight=1, max_queued=5, max_queue_wait_sec=0.01)
+        assert await pool.acquire() is None
+        assert await pool.acquire() == 503
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert stats["shed_queue_timeout"] == 1
+    assert stats["queued"] == 0
+    assert stats["max_queue_wait_sec"] >= 0.01
+
+
+def build_app(controller):
+    test_app = FastAPI()
+    test_app.add_middleware(AdmissionControlMiddleware)
+    test_app.state.admission = controller
+
+    @test_app.post("/")
+    def push():
+        return {"status": "Success"}
+
+    @test_app.get("/health")
+    def health():
+        return {"Status": "OK"}
+
+    return test_app
+
+
+def test_middleware_sheds_only_pooled_paths():
+    controller = AdmissionController()
+    # no slots and no queue, every push is shed
+    controller.add_pool(
+        AdmissionPool(name="push", max_inflight=0, max_queued=0, max_queue_wait_sec=1),
+        paths=["/"],
+    )
+    client = TestClient(build_app(controller))
+
+    push_response = client.post("/")
+    health_response = client.get("/health")
+
+    assert push_response.status_code == 429
+    assert push_response.headers["Retry-After"] == "1"
+    assert push_response.json()["exception"] == "Overloaded"
+    assert health_response.status_code == 200
+    assert controller.stats()["push"]["shed_queue_full"] == 1
+
+
+def test_middleware_passes_through_without_controller():
+    client = TestClient(build_app(None))
+
+    assert client.post("/").status_code == 200
+
+
+@patch("service.admission.settings")
+def test_create_admission_controller(mock_settings):
+    mock_settings.admission_enabled = False
+    assert create_admission_controller(push_paths=["/"], consumer_paths=["/v1"]) is None
+
+    mock_settings.admission_enabled = True
+    mock_settings.admission_max_inflight_pushes = 2
+    mock_settings.admission_reserved_consumer_inflight = 1
+    controller = create_admission_controller(push_paths=["/"], consumer_paths=["/v1"])
+
+    assert controller.pool_for("/").name == "pubsub_push"
+    assert controller.pool_for("/v1").name == "consumer"
+    assert controller.pool_for("/health") is None
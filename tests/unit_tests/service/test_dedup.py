@@ -0,0 +1,64 @@
+from unittest.mock import patch
+
+import pytest
+
+from service.dedup import InMemoryDedupStore, create_dedup_store
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_in_memory_store_marks_processed():
+    store = InMemoryDedupStore(max_entries=10, ttl_sec=60)
+
+    assert not store.is_processed("1")
+    store.mark_processed("1")
+
+    assert store.is_processed("1")
+    assert not store.is_processed("2")
+
+
+def test_in_memory_store_expires_entries():
+    clock = FakeClock()
+    store = InMemoryDedupStore(max_entries=10, ttl_sec=60, clock=clock)
+    store.mark_processed("1")
+
+    clock.now = 59
+    assert store.is_processed("1")
+    clock.now = 60
+    assert not store.is_processed("1")
+    assert len(store) == 0
+
+
+def test_in_memory_store_evicts_least_recently_used():
+    store = InMemoryDedupStore(max_entries=2, ttl_sec=60)
+    store.mark_processed("1")
+    store.mark_processed("2")
+    # touching 1 makes 2 the least recently used entry
+    assert store.is_processed("1")
+
+    store.mark_processed("3")
+
+    assert len(store) == 2
+    assert store.is_processed("1")
+    assert not store.is_processed("2")
+    assert store.is_processed("3")
+
+
+@patch("service.dedup.settings")
+def test_create_dedup_store(mock_settings):
+    mock_settings.dedup_enabled = False
+    assert create_dedup_store() is None
+
+    mock_settings.dedup_enabled = True
+    mock_settings.dedup_backend = "memory"
+    assert isinstance(create_dedup_store(), InMemoryDedupStore)
+
+    mock_settings.dedup_backend = "redis"
+    with pytest.raises(ValueError):
+        create_dedup_store()
@@ -0,0 +1,161 @@
+import asyncio
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from error.custom_exceptions import PubsubPublishException
+from main import app
+from service.dlq_spool import DlqSpool, drain_spool_forever
+
+
+class FakePublisher:
+    """Local stand-in for PubSubPublisher that can fail after a number of publishes"""
+
+    def __init__(self, fail_after=None):
+        self.published = []
+        self.fail_after = fail_after
+
+    def publish(self, data, source_message_uuid, source_publish_time):
+        if self.fail_after is not None and len(self.published) >= self.fail_after:
+            raise PubsubPublishException("Testing publish error")
+        self.published.append((data, source_message_uuid, source_publish_time))
+
+
+def spool_messages(spool, count):
+    for index in range(count):
+        spool.append(
+            data={"bucket": "dummy_bucket", "index": index},
+            source_message_uuid=str(index),
+            source_publish_time="2024-05-31T10:10:10.012022+01:00",
+        )
+
+
+def test_spool_drain_publishes_in_order_and_removes_segments(tmp_path):
+    spool = DlqSpool(spool_dir=str(tmp_path), segment_max_bytes=200)
+    spool_messages(spool, 5)
+    assert spool.pending_segments > 1
+
+    publisher = FakePublisher()
+    published = spool.drain(publisher)
+
+    assert published == 5
+    assert [message[1] for message in publisher.published] == ["0", "1", "2", "3", "4"]
+    assert publisher.published[0][0] == {"bucket": "dummy_bucket", "index": 0}
+    assert spool.pending_segments == 0
+    assert os.listdir(tmp_path / str(os.getpid())) == [".owner.lock"]
+
+
+def test_spool_drain_resumes_after_failure(tmp_path):
+    spool = DlqSpool(spool_dir=str(tmp_path), segment_max_bytes=1024 * 1024)
+    spool_messages(spool, 4)
+
+    failing_publisher = FakePublisher(fail_after=2)
+    with pytest.raises(PubsubPublishException):
+        spool.drain(failing_publisher)
+    assert spool.pending_segments == 1
+
+    publisher = FakePublisher()
+    assert spool.drain(publisher) == 2
+    assert [message[1] for message in publisher.published] == ["2", "3"]
+    assert spool.pending_segments == 0
+
+
+def test_spool_survives_restart(tmp_path):
+    spool = DlqSpool(spool_dir=str(tmp_path), segment_max_bytes=1024 * 1024)
+    spool_messages(spool, 2)
+    spool.close()
+
+    restarted_spool = DlqSpool(spool_dir=str(tmp_path), segment_max_bytes=1024 * 1024)
+    spool_messages(restarted_spool, 1)
+
+    publisher = FakePublisher()
+    assert restarted_spool.drain(publisher) == 3
+    assert [message[1] for message in publisher.published] == ["0", "1", "0"]
+
+
+def test_spool_skips_torn_record(tmp_path):
+    spool = DlqSpool(spool_dir=str(tmp_path), segment_max_bytes=1024 * 1024)
+    spool_messages(spool, 1)
+    spool.close()
+    spool_dir = tmp_path / str(os.getpid())
+    (segment_name,) = [name for name in os.listdir(spool_dir) if name.endswith(".log")]
+    segment_path = os.path.join(spool_dir, segment_name)
+    with open(segment_path, "ab") as segment_file:
+        segment_file.write(b'{"data": {"bucket"')
+
+    publisher = FakePublisher()
+    assert spool.drain(publisher) == 1
+    assert spool.pending_segments == 0
+
+
+@pytest.mark.parametrize(
+    "bad_record",
+    [
+        b"not json",
+        b'{"data": {}, "source_message_uuid": "x"}',
+        b'{"data": {}, "source_message_uuid": "x", "source_publish_time": null, "extra": 1}',
+        b'["data"]',
+    ],
+    ids=["corrupt", "missing_field", "extra_field", "not_an_object"],
+)
+def test_spool_skips_corrupt_and_malformed_records(tmp_path, bad_record):
+    spool = DlqSpool(spool_dir=str(tmp_path), segment_max_bytes=1024 * 1024)
+    spool_messages(spool, 1)
+    spool._active_file.write(bad_record + b"\n")
+    spool_messages(spool, 1)
+
+    publisher = FakePublisher()
+    assert spool.drain(publisher) == 2
+    assert [message[1] for message in publisher.published] == ["0", "0"]
+    assert spool.pending_segments == 0
+
+
+def test_spool_is_private_to_its_process(tmp_path):
+    with patch("service.dlq_spool.os.getpid", return_value=1):
+        running_spool = DlqSpool(spool_dir=str(tmp_path), segment_max_bytes=1024 * 1024)
+    spool_messages(running_spool, 2)
+    with patch("service.dlq_spool.os.getpid", return_value=2):
+        exited_spool = DlqSpool(spool_dir=str(tmp_path), segment_max_bytes=1024 * 1024)
+    spool_messages(exited_spool, 1)
+    exited_spool.close()
+
+    with patch("service.dlq_spool.os.getpid", return_value=3):
+        spool = DlqSpool(spool_dir=str(tmp_path), segment_max_bytes=1024 * 1024)
+
+    # only the segments of the process that exited are adopted and drained
+    publisher = FakePublisher()
+    assert spool.drain(publisher) == 1
+    assert sorted(os.listdir(tmp_path)) == ["1", "3"]
+    assert running_spool.drain(FakePublisher()) == 2
+
+
+def test_drainer_survives_unexpected_errors():
+    spool = MagicMock()
+    spool.drain.side_effect = [TypeError("Testing TypeError"), 1, 1]
+
+    async def run_drainer():
+        drainer = asyncio.create_task(
+            drain_spool_forever(spool, MagicMock(), interval_sec=0.001, max_backoff_sec=0.01)
+        )
+        while spool.drain.call_count < 3:
+            await asyncio.sleep(0.001)
+        drainer.cancel()
+
+    asyncio.run(asyncio.wait_for(run_drainer(), timeout=5))
+
+
+@patch("main.settings.dlq_spool_enabled", True)
+def test_spool_is_closed_after_batched_dlq_messages_are_flushed():
+    shutdown = MagicMock()
+    with patch("main.DlqSpool", return_value=shutdown.spool), patch(
+        "main.PubSubPublisherPool", return_value=shutdown.publisher_pool
+    ), patch("main.drain_spool_forever", new=MagicMock(return_value=asyncio.sleep(3600))):
+        with TestClient(app):
+            pass
+
+    assert [name for name, _, _ in shutdown.mock_calls if name.endswith("close")] == [
+        "publisher_pool.close",
+        "spool.close",
+    ]
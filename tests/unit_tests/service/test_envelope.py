@@ -0,0 +1,95 @@
+import base64
+import gzip
+import json
+from unittest.mock import patch
+
+import pytest
+
+from error.custom_exceptions import ManualDLQError
+from pydantic_model.api_model import ErrorEnum, GcsToPubsubEvent, Message, PubSubMessage
+from helper.utils import decode_pubsub_message_bytes
+from service.envelope import DecodedEnvelope
+
+example_data = {"bucket": "test_bucket", "name": "table"}
+
+
+def build_envelope(data, attributes=None):
+    return DecodedEnvelope(
+        Message(
+            message=PubSubMessage(
+                data=data,
+                message_id="123",
+                publish_time="2023-07-31T15:01:06.058022+01:00",
+                attributes=attributes or {},
+            )
+        )
+    )
+
+
+def test_envelope_decodes_once():
+    envelope = build_envelope(base64.b64encode(json.dumps(example_data).encode()))
+
+    with patch(
+        "service.envelope.decode_pubsub_message_bytes",
+        wraps=decode_pubsub_message_bytes,
+    ) as mock_decode:
+        assert envelope.data == example_data
+        assert envelope.gcs_event == GcsToPubsubEvent(**example_data)
+        assert envelope.original_request["message"]["data"] is envelope.data
+
+    assert mock_decode.call_count == 1
+
+
+def test_envelope_unencoded_data_is_not_copied():
+    envelope = build_envelope(example_data)
+
+    assert envelope.data is envelope.message.data
+
+
+def test_envelope_compressed_data():
+    envelope = build_envelope(
+        base64.b64encode(gzip.compress(json.dumps(example_data).encode())),
+        attributes={"content-encoding": "gzip"},
+    )
+
+    assert envelope.data == example_data
+
+
+def test_envelope_original_request():
+    envelope = build_envelope(example_data, attributes={"bucketId": "test_bucket"})
+
+    assert envelope.original_request == {
+        "message": {
+            "data": example_data,
+            "attributes": {"bucketId": "test_bucket"},
+            "message_id": "123",
+            "publish_time": "2023-07-31T15:01:06.058022+01:00",
+        }
+    }
+
+
+def test_envelope_invalid_gcs_event():
+    envelope = build_envelope({"bucket": "test_bucket"})
+
+    with pytest.raises(ManualDLQError):
+        envelope.gcs_event
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"not base64!",
+        base64.b64encode(b"not json"),
+        base64.b64encode(b'["a", "json", "array"]'),
+    ],
+    ids=["bad_base64", "not_json", "json_array"],
+)
+def test_envelope_malformed_data_is_dead_lettered(data):
+    envelope = build_envelope(data)
+
+    with pytest.raises(ManualDLQError) as ex:
+        envelope.gcs_event
+    assert ex.value.error_stage == ErrorEnum.MESSAGE_VALIDATION
+    # the logging context and the DLQ still get the message as received
+    assert envelope.original_request["message"]["message_id"] == "123"
+    assert ex.value.original_request["message"]["message_id"] == "123"
@@ -0,0 +1,206 @@
+import asyncio
+import base64
+import gzip
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from configuration.logger_config import logger_config
+from error.custom_exceptions import ManualDLQError
+from pydantic_model.api_model import ErrorEnum, Message, PubSubMessage
+from service.dedup import InMemoryDedupStore
+from service.envelope import DecodedEnvelope
+from service.pipeline import (
+    GcsEventPipeline,
+    create_gcs_event_pipeline,
+    process_pubsub_message_once,
+)
+
+
+def build_envelope(message_id="123", data=None):
+    data = data or {
+        "bucket": "source_bucket",
+        "name": "test_file.json",
+        "contentType": "text/plain",
+    }
+    return DecodedEnvelope(
+        Message(
+            message=PubSubMessage(
+                data=base64.b64encode(json.dumps(data).encode()),
+                message_id=message_id,
+                publish_time="2023-07-31T15:01:06.058022+01:00",
+                attributes={},
+            )
+        )
+    )
+
+
+def test_pipeline_reads_transforms_and_uploads():
+    storage = MagicMock()
+    storage.read_gcs_file_to_bytes.return_value = b"test file in bytes"
+    pipeline = GcsEventPipeline(
+        storage=storage, target_bucket="target_bucket", transform=bytes.upper
+    )
+
+    asyncio.run(pipeline.process(build_envelope()))
+    pipeline.close()
+
+    storage.read_gcs_file_to_bytes.assert_called_once_with(
+        "source_bucket",
+        "test_file.json",
+        size=None,
+        crc32c=None,
+        md5_hash=None,
+        generation=None,
+    )
+    storage.upload_to_gcs.assert_called_once_with(
+        "target_bucket", "test_file.json", b"TEST FILE IN BYTES", content_type="text/plain"
+    )
+
+
+def test_pipeline_dead_letters_transform_errors():
+    storage = MagicMock()
+    storage.read_gcs_file_to_bytes.return_value = b"test file in bytes"
+
+    def failing_transform(data: bytes) -> bytes:
+        raise ValueError("Testing transform error")
+
+    pipeline = GcsEventPipeline(
+        storage=storage, target_bucket="target_bucket", transform=failing_transform
+    )
+    envelope = build_envelope()
+
+    async def process():
+        logger_config.set_request_contexts(
+            ctx_fields={}, original_request=envelope.original_request
+        )
+        await pipeline.process(envelope)
+
+    with pytest.raises(ManualDLQError) as exc:
+        asyncio.run(process())
+    pipeline.close()
+
+    # the logging context reaches the stage executors
+    assert exc.value.original_request == envelope.original_request
+    assert exc.value.error_stage == ErrorEnum.TRANSFORM
+    storage.upload_to_gcs.assert_not_called()
+
+
+def test_pipeline_bounds_stage_concurrency():
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def slow_read(bucket_name, source_blob_name, **kwargs):
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+        return b"test file in bytes"
+
+    storage = MagicMock()
+    storage.read_gcs_file_to_bytes.side_effect = slow_read
+    pipeline = GcsEventPipeline(
+        storage=storage,
+        target_bucket="target_bucket",
+        transform=bytes.upper,
+        read_concurrency=3,
+    )
+
+    async def process_all():
+        await asyncio.gather(
+            *(pipeline.process(build_envelope(str(index))) for index in range(20))
+        )
+
+    asyncio.run(process_all())
+    pipeline.close()
+
+    assert max_in_flight == 3
+    assert storage.upload_to_gcs.call_count == 20
+
+
+def test_pipeline_copies_untransformed_objects_server_side():
+    storage = MagicMock()
+    pipeline = GcsEventPipeline(storage=storage, target_bucket="target_bucket")
+    envelope = build_envelope(
+        data={"bucket": "source_bucket", "name": "test_file.json", "generation": "12"}
+    )
+
+    asyncio.run(pipeline.process(envelope))
+    pipeline.close()
+
+    storage.copy_gcs_file.assert_called_once_with(
+        "source_bucket", "test_file.json", "target_bucket", "test_file.json", generation="12"
+    )
+    storage.read_gcs_file_to_bytes.assert_not_called()
+    storage.upload_to_gcs.assert_not_called()
+
+
+def test_pipeline_streams_objects_through_chunked_transforms():
+    storage = MagicMock()
+    storage.iter_gcs_file_chunks.return_value = iter([b"test file ", b"in bytes"])
+    uploaded = []
+    storage.upload_to_gcs.side_effect = lambda bucket, name, chunks, **kwargs: uploaded.extend(
+        chunks
+    )
+    pipeline = GcsEventPipeline(
+        storage=storage,
+        target_bucket="target_bucket",
+        transform=bytes.upper,
+        chunked_transform=True,
+    )
+    envelope = build_envelope(
+        data={"bucket": "source_bucket", "name": "test_file.json", "crc32c": "abc=="}
+    )
+
+    asyncio.run(pipeline.process(envelope))
+    pipeline.close()
+
+    storage.iter_gcs_file_chunks.assert_called_once_with(
+        "source_bucket", "test_file.json", crc32c="abc==", md5_hash=None, generation=None
+    )
+    assert uploaded == [b"TEST FILE ", b"IN BYTES"]
+    storage.read_gcs_file_to_bytes.assert_not_called()
+
+
+@patch("service.pipeline.GoogleCloudStorage")
+@patch("service.pipeline.settings")
+def test_gzip_pipeline_streams_a_valid_gzip_object(settings_mock, storage_class_mock):
+    settings_mock.pipeline_transform = "gzip"
+    settings_mock.pipeline_read_concurrency = 2
+    settings_mock.pipeline_transform_concurrency = 2
+    settings_mock.pipeline_upload_concurrency = 2
+    storage = storage_class_mock.return_value
+    storage.iter_gcs_file_chunks.return_value = iter([b"test file ", b"in bytes"])
+    uploaded = []
+    storage.upload_to_gcs.side_effect = lambda bucket, name, chunks, **kwargs: uploaded.extend(
+        chunks
+    )
+    pipeline = create_gcs_event_pipeline()
+
+    asyncio.run(pipeline.process(build_envelope()))
+    pipeline.close()
+
+    assert len(uploaded) == 2
+    assert gzip.decompress(b"".join(uploaded)) == b"test file in bytes"
+    storage.read_gcs_file_to_bytes.assert_not_called()
+
+
+def test_process_once_skips_processed_messages():
+    storage = MagicMock()
+    pipeline = GcsEventPipeline(storage=storage, target_bucket="target_bucket")
+    dedup_store = InMemoryDedupStore(max_entries=10, ttl_sec=60)
+
+    first = asyncio.run(process_pubsub_message_once(pipeline, build_envelope(), dedup_store))
+    second = asyncio.run(process_pubsub_message_once(pipeline, build_envelope(), dedup_store))
+    pipeline.close()
+
+    assert first is True
+    assert second is False
+    storage.copy_gcs_file.assert_called_once()
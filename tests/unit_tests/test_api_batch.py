@@ -0,0 +1,154 @@
+import base64
+import json
+import pytest
+
+from error.custom_exceptions import PubsubPublishException, PubsubReprocessError
+from main import app
+from pydantic_model.api_model import ErrorEnum
+from service.dedup import InMemoryDedupStore
+
+attributes = {"bucketId": "dummy_bucket"}
+publish_time = "2024-05-31T10:10:10.012022+01:00"
+
+
+def build_item(message_id, data):
+    return {
+        "message": {
+            "data": base64.b64encode(json.dumps(data).encode()).decode(),
+            "attributes": attributes,
+            "message_id": message_id,
+            "publish_time": publish_time,
+        }
+    }
+
+
+valid_item = build_item("1", {"bucket": "dummy_bucket", "name": "test_file.json"})
+missing_name_item = build_item("2", {"bucket": "dummy_bucket"})
+
+
+def test_batch_classifies_each_message(mock_publish_to_dlq, api_client, storage_mock):
+    malformed_item = {"message": {"message_id": "3", "attributes": attributes}}
+
+    response = api_client.post(
+        "/batch", json=[valid_item, missing_name_item, malformed_item]
+    )
+
+    results = response.json()["results"]
+    assert response.status_code == 200
+    assert [result["message_id"] for result in results] == ["1", "2", "3"]
+    assert [result["status"] for result in results] == [
+        "ack",
+        "dead_lettered",
+        "dead_lettered",
+    ]
+    assert results[1]["error_stage"] == ErrorEnum.MESSAGE_VALIDATION
+    dlq_data = {
+        call.kwargs["source_message_uuid"]: call.kwargs["data"]
+        for call in mock_publish_to_dlq.await_args_list
+    }
+    assert dlq_data == {"2": {"bucket": "dummy_bucket"}, "3": None}
+    storage_mock.copy_gcs_file.assert_called_once_with(
+        "dummy_bucket", "test_file.json", "dummy_bucket", "test_file.json", generation=None
+    )
+
+
+def test_batch_retries_reprocess_errors(mock_publish_to_dlq, api_client, storage_mock):
+    storage_mock.copy_gcs_file.side_effect = PubsubReprocessError(
+        original_request=valid_item,
+        error_desc="Testing GoogleAPIError",
+        error_stage=ErrorEnum.GOOGLE_API_ERROR,
+    )
+
+    response = api_client.post("/batch", json=[valid_item])
+
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {
+            "message_id": "1",
+            "status": "retry",
+            "error_stage": ErrorEnum.GOOGLE_API_ERROR,
+            "error_desc": "Testing GoogleAPIError",
+        }
+    ]
+    mock_publish_to_dlq.assert_not_awaited()
+
+
+def test_batch_retries_when_dlq_publish_fails(mock_publish_to_dlq, api_client):
+    mock_publish_to_dlq.side_effect = PubsubPublishException("Testing publish error")
+
+    response = api_client.post("/batch", json=[missing_name_item, valid_item])
+
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["retry", "ack"]
+    assert results[0]["error_stage"] == ErrorEnum.SENDING_TO_DLQ
+
+
+def test_batch_acks_redeliveries_as_deduplicated(
+    mock_publish_to_dlq, api_client, storage_mock
+):
+    app.state.dedup_store = InMemoryDedupStore(max_entries=10, ttl_sec=60)
+    first = api_client.post("/batch", json=[valid_item, missing_name_item])
+    second = api_client.post("/batch", json=[valid_item, missing_name_item])
+
+    assert [result["status"] for result in first.json()["results"]] == [
+        "ack",
+        "dead_lettered",
+    ]
+    assert [result["status"] for result in second.json()["results"]] == [
+        "deduplicated",
+        "deduplicated",
+    ]
+    assert mock_publish_to_dlq.await_count == 1
+    storage_mock.copy_gcs_file.assert_called_once()
+
+
+def test_batch_isolates_bad_items(mock_publish_to_dlq, api_client, storage_mock):
+    not_json_item = dict(valid_item, message=dict(valid_item["message"], message_id="2"))
+    not_json_item["message"]["data"] = base64.b64encode(b"not json").decode()
+    array_item = build_item("3", ["not", "an", "object"])
+    failing_item = build_item("4", {"bucket": "dummy_bucket", "name": "failing.json"})
+
+    def copy(bucket, name, *args, **kwargs):
+        if name == "failing.json":
+            raise RuntimeError("Testing unexpected error")
+
+    storage_mock.copy_gcs_file.side_effect = copy
+
+    response = api_client.post(
+        "/batch", json=[valid_item, not_json_item, array_item, failing_item]
+    )
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(result["message_id"], result["status"]) for result in results] == [
+        ("1", "ack"),
+        ("2", "dead_lettered"),
+        ("3", "dead_lettered"),
+        ("4", "retry"),
+    ]
+    assert mock_publish_to_dlq.await_count == 2
+
+
+def test_batch_dead_letters_items_that_are_not_envelopes(mock_publish_to_dlq, api_client):
+    response = api_client.post("/batch", json=[1, valid_item, "not an envelope"])
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == [
+        "dead_lettered",
+        "ack",
+        "dead_lettered",
+    ]
+    assert [call.kwargs["data"] for call in mock_publish_to_dlq.await_args_list] == [
+        1,
+        "not an envelope",
+    ]
+
+
+@pytest.mark.parametrize(
+    "body", [valid_item, {"x": 1}, 1], ids=["single_push", "object", "number"]
+)
+def test_batch_rejects_a_body_that_is_not_an_array(mock_publish_to_dlq, api_client, body):
+    response = api_client.post("/batch", json=body)
+
+    assert response.status_code == 422
+    mock_publish_to_dlq.assert_not_awaited()
@@ -0,0 +1,35 @@
+import base64
+
+import pytest
+
+attributes = {"bucketId": "dummy_bucket"}
+publish_time = "2024-05-31T10:10:10.012022+01:00"
+
+
+def build_push(data) -> dict:
+    return {
+        "message": {
+            "data": data,
+            "attributes": attributes,
+            "message_id": "1",
+            "publish_time": publish_time,
+        }
+    }
+
+
+@pytest.mark.parametrize(
+    "data, dlq_data",
+    [
+        ("not base64!", "not base64!"),
+        (base64.b64encode(b"not json").decode(), base64.b64encode(b"not json").decode()),
+        (base64.b64encode(b'["a", "b"]').decode(), ["a", "b"]),
+    ],
+    ids=["bad_base64", "not_json", "json_array"],
+)
+def test_push_dead_letters_malformed_data(mock_publish_to_dlq, api_client, data, dlq_data):
+    response = api_client.post("/", json=build_push(data))
+
+    assert response.status_code == 202
+    mock_publish_to_dlq.assert_awaited_once()
+    assert mock_publish_to_dlq.await_args.kwargs["data"] == dlq_data
+    assert mock_publish_to_dlq.await_args.kwargs["source_message_uuid"] == "1"
@@ -0,0 +1,218 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+
+from helper import concurrency_limiter
+from helper.concurrency_limiter import AdaptiveConcurrencyLimiter, is_overload_error
+
+BASE_LATENCY_SEC = 0.05
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeDependency:
+    """Serves `capacity` calls at base latency, queueing makes calls beyond that slower"""
+
+    def __init__(self, capacity, error_rate=0.0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+    def latency(self, concurrency):
+        return BASE_LATENCY_SEC * max(1.0, concurrency / self.capacity)
+
+
+def simulate(limiter, dependency, clock, rounds):
+    """Each round issues as many concurrent calls as the limiter admits and
+    completes them with the latency the fake dependency injects"""
+    limits = []
+    for _ in range(rounds):
+        concurrency = limiter.limit
+        for _ in range(concurrency):
+            limiter.acquire()
+        latency = dependency.latency(concurrency)
+        clock.now += latency
+        failures = int(concurrency * dependency.error_rate)
+        for call in range(concurrency):
+            limiter.release(latency, overloaded=call < failures)
+        limits.append(limiter.limit)
+    return limits
+
+
+def build_limiter(clock, initial_limit=2):
+    return AdaptiveConcurrencyLimiter(
+        name="gcs", initial_limit=initial_limit, min_limit=1, max_limit=500, clock=clock
+    )
+
+
+def test_limit_grows_while_latency_is_flat():
+    clock = FakeClock()
+    limiter = build_limiter(clock)
+
+    limits = simulate(limiter, FakeDependency(capacity=1000), clock, rounds=20)
+
+    assert limits == sorted(limits)
+    assert limits[-1] >= 20
+    assert limiter.decreases == 0
+
+
+def test_limit_converges_on_dependency_capacity():
+    clock = FakeClock()
+    limiter = build_limiter(clock)
+
+    limits = simulate(limiter, FakeDependency(capacity=40), clock, rounds=200)
+
+    # oscillates between the backed off and the tolerated queueing concurrency,
+    # 0.7 and 1.5 times the capacity
+    assert all(28 <= limit <= 62 for limit in limits[-100:])
+    assert limiter.decreases > 0
+
+
+def test_limit_cut_during_brownout_and_recovers():
+    clock = FakeClock()
+    limiter = build_limiter(clock)
+    dependency = FakeDependency(capacity=40)
+    simulate(limiter, dependency, clock, rounds=100)
+
+    dependency.capacity = 5
+    brownout_limits = simulate(limiter, dependency, clock, rounds=50)
+    assert all(limit <= 10 for limit in brownout_limits[-25:])
+
+    dependency.capacity = 40
+    recovered_limits = simulate(limiter, dependency, clock, rounds=100)
+    assert recovered_limits[-1] >= 20
+
+
+def test_limit_cut_on_overload_errors():
+    clock = FakeClock()
+    limiter = build_limiter(clock, initial_limit=50)
+
+    limits = simulate(
+        limiter, FakeDependency(capacity=1000, error_rate=0.2), clock, rounds=30
+    )
+
+    assert limits[-1] <= 5
+    assert limiter.overload_errors > 0
+
+
+def test_waiters_are_admitted_in_order_when_slots_free():
+    limiter = build_limiter(time.monotonic, initial_limit=1)
+    limiter.acquire()
+    admitted = []
+
+    def call(index):
+        limiter.acquire()
+        admitted.append(index)
+
+    waiter = threading.Thread(target=call, args=(1,))
+    waiter.start()
+    time.sleep(0.01)
+    assert admitted == []
+    assert limiter.stats()["waiting"] == 1
+
+    limiter.release(BASE_LATENCY_SEC)
+    waiter.join(timeout=1)
+
+    assert admitted == [1]
+    assert limiter.stats()["inflight"] == 1
+
+
+def test_async_waiter_admitted_when_slot_frees():
+    limiter = build_limiter(time.monotonic, initial_limit=1)
+
+    async def scenario():
+        await limiter.acquire_async()
+        waiter = asyncio.create_task(limiter.acquire_async())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        limiter.release(BASE_LATENCY_SEC)
+        await asyncio.wait_for(waiter, timeout=1)
+
+    asyncio.run(scenario())
+
+    assert limiter.stats()["inflight"] == 1
+
+
+def test_limit_call_records_overload_errors():
+    limiter = build_limiter(time.monotonic)
+
+    with pytest.raises(ServiceUnavailable):
+        with limiter.limit_call():
+            raise ServiceUnavailable("Testing ServiceUnavailable")
+    with pytest.raises(NotFound):
+        with limiter.limit_call():
+            raise NotFound("Testing NotFound")
+
+    assert limiter.overload_errors == 1
+    assert limiter.stats()["inflight"] == 0
+
+
+def test_is_overload_error():
+    assert is_overload_error(ServiceUnavailable("unavailable"))
+    assert not is_overload_error(NotFound("not found"))
+    assert not is_overload_error(ValueError("not a google error"))
+
+
+@patch("helper.concurrency_limiter.settings")
+def test_limiters_are_shared_per_dependency(mock_settings):
+    mock_settings.adaptive_concurrency_enabled = True
+    mock_settings.adaptive_concurrency_initial_limit = 10
+
+    with patch.dict(concurrency_limiter._limiters, clear=True):
+        gcs = concurrency_limiter.get_limiter("gcs")
+
+        assert concurrency_limiter.get_limiter("gcs") is gcs
+        assert concurrency_limiter.get_limiter("datastore") is not gcs
+        assert set(concurrency_limiter.limiter_stats()) == {"gcs", "datastore"}
+
+    mock_settings.adaptive_concurrency_enabled = False
+    assert concurrency_limiter.get_limiter("gcs") is None
+
+
+@patch("helper.concurrency_limiter.settings")
+def test_nested_calls_run_in_the_slot_already_held(mock_settings):
+    mock_settings.adaptive_concurrency_enabled = True
+    mock_settings.adaptive_concurrency_initial_limit = 1
+    mock_settings.adaptive_concurrency_min_limit = 1
+    mock_settings.adaptive_concurrency_max_limit = 1
+    mock_settings.adaptive_concurrency_latency_tolerance = 1.5
+    mock_settings.adaptive_concurrency_backoff_ratio = 0.7
+
+    async def nested_async():
+        async with concurrency_limiter.dependency_limit_async("gcs"):
+            async with concurrency_limiter.dependency_limit_async("gcs"):
+                return concurrency_limiter.get_limiter("gcs").stats()["inflight"]
+
+    with patch.dict(concurrency_limiter._limiters, clear=True):
+        with concurrency_limiter.dependency_limit("gcs", transfer=True):
+            with concurrency_limiter.dependency_limit("gcs"):
+                assert concurrency_limiter.get_limiter("gcs").stats()["inflight"] == 1
+        assert asyncio.run(nested_async()) == 1
+        assert concurrency_limiter.get_limiter("gcs").stats()["inflight"] == 0
+
+
+def test_transfers_of_mixed_sizes_do_not_cut_the_limit():
+    clock = FakeClock()
+    limiter = build_limiter(clock, initial_limit=20)
+
+    # a small object first, then objects up to 100 times larger
+    for latency in [BASE_LATENCY_SEC] + [BASE_LATENCY_SEC * size for size in (10, 100, 50)] * 10:
+        limiter.acquire()
+        clock.now += latency
+        limiter.release(latency, transfer=True)
+    assert limiter.limit >= 20
+    assert limiter.decreases == 0
+    assert limiter.stats()["baseline_latency_sec"] is None
+
+    limiter.acquire()
+    limiter.release(BASE_LATENCY_SEC, overloaded=True, transfer=True)
+    assert limiter.decreases == 1
@@ -1,3 +1,5 @@
+import base64
+import gzip
 import json
 import os
 from datetime import datetime
@@ -7,6 +9,7 @@ import pytest
 
 from error.custom_exceptions import ManualDLQError, MessageDecodeError
 from pydantic_model.api_model import GcsToPubsubEvent, Message, PubSubMessage
+from helper.compression import compress_payload, decompress_payload, supported_encodings
 from helper.utils import (
     format_pydantic_validation_error_message,
     create_pydantic_validation_error_message,
@@ -87,6 +90,50 @@ def test_decode_pubsub_message_data_unicode_decode_error():
     assert str(ex.value) == "Pubsub Message Data Base64 error: Incorrect padding"
 
 
+def test_decode_pubsub_message_data_gzip():
+    test_data = {"bucket": "dummy_bucket", "name": "test_file.json"}
+    test_data_encoded = base64.b64encode(gzip.compress(json.dumps(test_data).encode()))
+
+    decoded_test_data = decode_pubsub_message_data(
+        test_data_encoded, content_encoding="gzip"
+    )
+
+    assert json.loads(decoded_test_data) == test_data
+
+
+def test_decode_pubsub_message_data_decompression_error():
+    test_data_encoded = base64.b64encode(b"not compressed")
+    with pytest.raises(MessageDecodeError) as ex:
+        decode_pubsub_message_data(test_data_encoded, content_encoding="gzip")
+    assert str(ex.value).startswith("Pubsub Message Data Decompression error")
+
+    with pytest.raises(MessageDecodeError):
+        decode_pubsub_message_data(test_data_encoded, content_encoding="brotli")
+
+
+@pytest.mark.parametrize("encoding", supported_encodings())
+def test_compress_payload_round_trip(encoding):
+    payload = json.dumps({"rows": ["row"] * 1000}).encode()
+
+    compressed = compress_payload(payload, encoding)
+
+    assert len(compressed) < len(payload)
+    assert decompress_payload(compressed, encoding, len(payload)) == payload
+
+
+@pytest.mark.parametrize("encoding", supported_encodings())
+def test_decompress_payload_stops_at_max_size(encoding):
+    # a few KB that expand to 100 MB
+    bomb = compress_payload(b"\0" * 100 * 1024 * 1024, encoding)
+
+    with pytest.raises(ValueError, match="larger than 1024 bytes"):
+        decompress_payload(bomb, encoding, 1024)
+    with patch("helper.utils.settings") as settings_mock:
+        settings_mock.max_decompressed_bytes = 1024
+        with pytest.raises(MessageDecodeError):
+            decode_pubsub_message_data(base64.b64encode(bomb), content_encoding=encoding)
+
+
 def test_create_pydantic_validation_error_message():
     message = (
         "1 validation error for IngestionData\ntarget_message_uuid\nField required "
@@ -143,7 +190,7 @@ def test_read_validate_message_data(mock_decode):
     result = read_validate_message_data(mock_request)
 
     # Assert
-    mock_decode.assert_called_with(mock_request.message.data)
+    mock_decode.assert_called_with(mock_request.message.data, content_encoding=None)
     assert result == GcsToPubsubEvent(**example_data)
 
 
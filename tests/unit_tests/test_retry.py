@@ -0,0 +1,103 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+
+from helper.retry import (
+    Retry,
+    RetryBudget,
+    full_jitter_delay,
+    get_retry_budget,
+    is_transient_error,
+    request_deadline,
+)
+
+
+def flaky(failures: int, error=ServiceUnavailable("unavailable")) -> MagicMock:
+    return MagicMock(side_effect=[error] * failures + ["result"])
+
+
+def test_full_jitter_delay_is_capped_and_scaled_by_the_draw():
+    assert full_jitter_delay(1, 0.1, 1, 2, rng=lambda: 1.0) == pytest.approx(0.1)
+    assert full_jitter_delay(3, 0.1, 1, 2, rng=lambda: 0.5) == pytest.approx(0.2)
+    assert full_jitter_delay(10, 0.1, 1, 2, rng=lambda: 1.0) == 1
+    assert full_jitter_delay(10, 0.1, 1, 2, rng=lambda: 0.0) == 0
+
+
+def test_is_transient_error():
+    assert is_transient_error(ServiceUnavailable("unavailable"))
+    assert is_transient_error(ConnectionResetError())
+    assert not is_transient_error(NotFound("missing"))
+    assert not is_transient_error(ValueError())
+
+
+@patch("helper.retry.time.sleep")
+def test_retry_backs_off_until_the_call_succeeds(sleep_mock):
+    func = flaky(2)
+    retry = Retry(is_transient_error, dependency="test-succeeds", rng=lambda: 1.0)
+
+    assert retry.call(func, "arg") == "result"
+    assert func.call_count == 3
+    assert [call.args[0] for call in sleep_mock.call_args_list] == pytest.approx([0.1, 0.2])
+    assert get_retry_budget("test-succeeds").stats()["retries"] == 2
+
+
+@patch("helper.retry.time.sleep")
+def test_retry_raises_other_errors_and_the_last_error_straight_away(sleep_mock):
+    func = flaky(1, error=NotFound("missing"))
+    with pytest.raises(NotFound):
+        Retry(is_transient_error, dependency="test-other").call(func)
+    assert func.call_count == 1
+
+    func = flaky(5)
+    with pytest.raises(ServiceUnavailable):
+        Retry(ServiceUnavailable, dependency="test-exhausted", max_attempts=3).call(func)
+    assert func.call_count == 3
+    assert get_retry_budget("test-exhausted").stats()["failures"] == 1
+
+
+@patch("helper.retry.time.sleep")
+def test_retry_budget_caps_retries_to_a_share_of_calls(sleep_mock):
+    budget = RetryBudget("test-budget", ratio=0.5, max_tokens=2)
+    with patch.dict("helper.retry._budgets", {"test-budget": budget}):
+        retry = Retry(ServiceUnavailable, dependency="test-budget", max_attempts=2)
+        for _ in range(4):
+            with pytest.raises(ServiceUnavailable):
+                retry.call(flaky(2))
+
+    # the initial tokens and the half a token earned by each call
+    assert budget.stats()["retries"] == 3
+    assert budget.stats()["budget_exhausted"] == 1
+
+
+@patch("helper.retry.time.sleep")
+def test_retry_stops_at_the_deadline(sleep_mock):
+    func = flaky(3)
+    retry = Retry(ServiceUnavailable, dependency="test-deadline", deadline_sec=0.15, rng=lambda: 1.0)
+    with pytest.raises(ServiceUnavailable):
+        retry.call(func)
+    # the first retry starts after 0.1 seconds, the second would not start in time
+    assert func.call_count == 2
+
+    func = flaky(3)
+    with request_deadline(0.05), pytest.raises(ServiceUnavailable):
+        Retry(ServiceUnavailable, dependency="test-deadline", rng=lambda: 1.0).call(func)
+    assert func.call_count == 1
+    assert get_retry_budget("test-deadline").stats()["deadline_exceeded"] == 2
+
+
+def test_retry_decorates_coroutines_without_blocking_the_loop():
+    attempts = []
+
+    @Retry(ServiceUnavailable, dependency="test-async", initial_delay_sec=0.01)
+    async def call(value):
+        attempts.append(value)
+        if len(attempts) < 3:
+            raise ServiceUnavailable("unavailable")
+        return value
+
+    with patch("helper.retry.time.sleep") as sleep_mock:
+        assert asyncio.run(call("result")) == "result"
+    assert attempts == ["result"] * 3
+    sleep_mock.assert_not_called()
@@ -0,0 +1,52 @@
+import datetime
+import decimal
+import json
+from unittest.mock import patch
+
+import pytest
+
+from helper import serialiser
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def engine(request):
+    if request.param == "orjson" and serialiser.orjson is None:
+        pytest.skip("orjson is not installed")
+    if request.param == "stdlib":
+        with patch("helper.serialiser.orjson", None):
+            yield request.param
+    else:
+        yield request.param
+
+
+def test_dumps_handles_dates_and_decimals(engine):
+    data = {
+        "timestamp": datetime.datetime(2023, 5, 22, 12, 0, 0),
+        "date": datetime.date(2023, 5, 22),
+        "size": decimal.Decimal(1234.0),
+    }
+
+    result = json.loads(serialiser.dumps(data))
+
+    assert result == {"timestamp": "2023-05-22T12:00:00", "date": "2023-05-22", "size": 1234}
+
+
+def test_dumps_wide_integers(engine):
+    assert json.loads(serialiser.dumps({"value": 2**70})) == {"value": 2**70}
+
+
+def test_dumps_invalid_type(engine):
+    with pytest.raises(TypeError):
+        serialiser.dumps({"value": object()})
+
+
+def test_loads_round_trip(engine):
+    data = {"bucket": "dummy_bucket", "rows": [1, 2.5, None, True]}
+
+    assert serialiser.loads(serialiser.dumps_bytes(data)) == data
+    assert serialiser.loads(serialiser.dumps(data)) == data
+
+
+def test_loads_decode_error(engine):
+    with pytest.raises(json.decoder.JSONDecodeError):
+        serialiser.loads('{"bucket": ')
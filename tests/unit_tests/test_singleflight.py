@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from helper.singleflight import SingleFlight
+
+
+def test_concurrent_calls_with_the_same_key_share_one_call():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def query(key):
+        calls.append(key)
+        started.set()
+        release.wait()
+        return [key]
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(flights.do, "customers", query, "customers")
+        started.wait()
+        followers = [
+            executor.submit(flights.do, "customers", query, "customers") for _ in range(3)
+        ]
+        other = executor.submit(flights.do, "countries", query, "countries")
+        while flights.stats()["shared"] < 3:
+            pass
+        release.set()
+
+    assert leader.result() == (["customers"], False)
+    assert [follower.result() for follower in followers] == [(["customers"], True)] * 3
+    assert other.result() == (["countries"], False)
+    assert sorted(calls) == ["countries", "customers"]
+    assert flights.stats() == {"calls": 5, "shared": 3, "in_flight": 0}
+
+
+def test_errors_are_shared_and_the_key_is_released():
+    flights = SingleFlight()
+
+    def failing_query():
+        raise ValueError("Testing query error")
+
+    with pytest.raises(ValueError):
+        flights.do("customers", failing_query)
+
+    assert flights.do("customers", lambda: "recovered") == ("recovered", False)
@@ -0,0 +1,136 @@
+import asyncio
+import datetime
+import json
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from error.custom_exceptions import PubsubPublishException, PubsubReprocessError
+from pydantic_model.api_model import ErrorEnum
+from service.pipeline import GcsEventPipeline
+from worker import handle_message
+
+
+def build_pulled_message(data):
+    message = MagicMock()
+    message.data = json.dumps(data).encode()
+    message.attributes = {"bucketId": "dummy_bucket"}
+    message.message_id = "123"
+    message.publish_time = datetime.datetime(2024, 5, 31, 10, 10, 10)
+    return message
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    loop_thread.join()
+    loop.close()
+
+
+@pytest.fixture
+def pipeline(storage_mock):
+    pipeline = GcsEventPipeline(storage=storage_mock, target_bucket="dummy_bucket")
+    yield pipeline
+    pipeline.close()
+
+
+def test_handle_message_acks_valid_event(pipeline, loop, storage_mock):
+    message = build_pulled_message({"bucket": "dummy_bucket", "name": "test_file.json"})
+    dlq_publisher = MagicMock()
+
+    handle_message(message, pipeline=pipeline, loop=loop, dlq_publisher=dlq_publisher)
+
+    message.ack.assert_called_once()
+    message.nack.assert_not_called()
+    dlq_publisher.publish.assert_not_called()
+    storage_mock.copy_gcs_file.assert_called_once_with(
+        "dummy_bucket", "test_file.json", "dummy_bucket", "test_file.json", generation=None
+    )
+
+
+def test_handle_message_dead_letters_invalid_event(pipeline, loop):
+    message = build_pulled_message({"bucket": "dummy_bucket"})
+    dlq_publisher = MagicMock()
+
+    handle_message(message, pipeline=pipeline, loop=loop, dlq_publisher=dlq_publisher)
+
+    message.ack.assert_called_once()
+    dlq_publisher.publish.assert_called_once_with(
+        data={"bucket": "dummy_bucket"},
+        source_message_uuid="123",
+        source_publish_time="2024-05-31T10:10:10",
+    )
+
+
+def test_handle_message_nacks_when_dlq_publish_fails(pipeline, loop):
+    message = build_pulled_message({"bucket": "dummy_bucket"})
+    dlq_publisher = MagicMock()
+    dlq_publisher.publish.side_effect = PubsubPublishException("Testing publish error")
+
+    handle_message(message, pipeline=pipeline, loop=loop, dlq_publisher=dlq_publisher)
+
+    message.nack.assert_called_once()
+    message.ack.assert_not_called()
+
+
+def test_handle_message_nacks_reprocess_error(pipeline, loop, storage_mock):
+    message = build_pulled_message({"bucket": "dummy_bucket", "name": "test_file.json"})
+    storage_mock.copy_gcs_file.side_effect = PubsubReprocessError(
+        original_request={"message": {"message_id": "123", "attributes": {}}},
+        error_desc="Testing GoogleAPIError",
+        error_stage=ErrorEnum.GOOGLE_API_ERROR,
+    )
+
+    handle_message(message, pipeline=pipeline, loop=loop, dlq_publisher=MagicMock())
+
+    message.nack.assert_called_once()
+    message.ack.assert_not_called()
+
+
+def test_handle_message_dead_letters_data_that_is_not_json(pipeline, loop):
+    message = build_pulled_message({})
+    message.data = b"not json"
+    dlq_publisher = MagicMock()
+
+    handle_message(message, pipeline=pipeline, loop=loop, dlq_publisher=dlq_publisher)
+
+    message.ack.assert_called_once()
+    message.nack.assert_not_called()
+    dlq_publisher.publish.assert_called_once()
+    assert dlq_publisher.publish.call_args.kwargs["source_message_uuid"] == "123"
+
+
+def test_handle_message_dead_letters_messages_without_an_envelope(pipeline, loop):
+    message = build_pulled_message({})
+    # the envelope model rejects a message without a message id
+    message.message_id = None
+    dlq_publisher = MagicMock()
+
+    handle_message(message, pipeline=pipeline, loop=loop, dlq_publisher=dlq_publisher)
+
+    message.ack.assert_called_once()
+    dlq_publisher.publish.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "error",
+    [TypeError("Testing TypeError"), json.JSONDecodeError("Testing JSONDecodeError", "", 0)],
+    ids=["type_error", "json_decode_error"],
+)
+def test_handle_message_nacks_decode_errors_raised_by_the_pipeline(
+    pipeline, loop, storage_mock, error
+):
+    message = build_pulled_message({"bucket": "dummy_bucket", "name": "test_file.json"})
+    storage_mock.copy_gcs_file.side_effect = error
+    dlq_publisher = MagicMock()
+
+    handle_message(message, pipeline=pipeline, loop=loop, dlq_publisher=dlq_publisher)
+
+    message.nack.assert_called_once()
+    message.ack.assert_not_called()
+    dlq_publisher.publish.assert_not_called()